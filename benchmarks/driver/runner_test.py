@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from esrally.driver import runner
@@ -63,3 +65,58 @@ def test_bulk_runner_without_errors_with_detailed_results(benchmark):
         "body": "bulk API body",
         "detailed-results": True
     })
+
+
+raw_no_errors = json.dumps(es.no_errors).encode("utf-8")
+
+
+@pytest.mark.benchmark(
+    group="bulk-response",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_simple_stats_with_decoded_response(benchmark):
+    def decode_and_analyze():
+        return bulk_index.simple_stats(5000, json.loads(raw_no_errors.decode("utf-8")))
+
+    benchmark(decode_and_analyze)
+
+
+@pytest.mark.benchmark(
+    group="bulk-response",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_simple_stats_with_lazy_response(benchmark):
+    def analyze():
+        return bulk_index.simple_stats(5000, runner.LazyBulkResponse(raw_no_errors))
+
+    benchmark(analyze)
+
+
+@pytest.mark.benchmark(
+    group="bulk-response",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_detailed_stats_with_decoded_response(benchmark):
+    def decode_and_analyze():
+        return bulk_index.detailed_stats(5000, json.loads(raw_no_errors.decode("utf-8")))
+
+    benchmark(decode_and_analyze)
+
+
+@pytest.mark.benchmark(
+    group="bulk-response",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_detailed_stats_with_lazy_response(benchmark):
+    def analyze():
+        return bulk_index.detailed_stats(5000, runner.LazyBulkResponse(raw_no_errors))
+
+    benchmark(analyze)
@@ -0,0 +1,114 @@
+import http.server
+import json
+import socketserver
+import threading
+
+import pytest
+
+from esrally import client
+from esrally.driver import runner
+
+BULK_SIZE = 500
+
+DOC = '{"name": "Rally", "type": "benchmark", "location": [13.4, 52.5], "count": 42, "tags": ["elasticsearch", "bulk", "driver"]}'
+
+BULK_LINES = []
+for _ in range(BULK_SIZE):
+    BULK_LINES.append('{"index": {"_index": "test", "_type": "type1"}}')
+    BULK_LINES.append(DOC)
+
+BULK_BODY = ("\n".join(BULK_LINES) + "\n").encode("utf-8")
+
+BULK_RESPONSE = json.dumps({
+    "took": 30,
+    "errors": False,
+    "items": [{
+        "index": {
+            "_index": "test",
+            "_type": "type1",
+            "_id": str(idx),
+            "_version": 1,
+            "result": "created",
+            "_shards": {
+                "total": 2,
+                "successful": 1,
+                "failed": 0
+            },
+            "created": True,
+            "status": 201
+        }
+    } for idx in range(BULK_SIZE)]
+}).encode("utf-8")
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers every request with the same bulk response so we only measure the client side.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(BULK_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(BULK_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+server = StubServer(("127.0.0.1", 0), StubHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": server.server_port}], client_options={}).create()
+bulk_index = runner.BulkIndex()
+
+
+@pytest.mark.benchmark(
+    group="bulk-transport",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_bulk_with_list_body(benchmark):
+    benchmark(es.bulk, body=BULK_LINES)
+
+
+@pytest.mark.benchmark(
+    group="bulk-transport",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_bulk_with_bytes_body_via_client_transport(benchmark):
+    benchmark(es.transport.perform_request, "POST", "/_bulk", body=BULK_BODY)
+
+
+@pytest.mark.benchmark(
+    group="bulk-transport",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_bulk_with_bytes_body_via_raw_transport(benchmark):
+    raw_transport = es.raw_transport
+    benchmark(raw_transport.perform_request, "POST", "/_bulk", body=BULK_BODY)
+
+
+@pytest.mark.benchmark(
+    group="bulk-transport",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_bulk_runner_with_bytes_body(benchmark):
+    benchmark(bulk_index, es, {
+        "action_metadata_present": True,
+        "body": BULK_BODY
+    })
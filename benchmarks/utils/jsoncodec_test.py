@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from esrally.utils import jsoncodec
+
+SEARCH_RESPONSE = json.dumps({
+    "took": 12,
+    "timed_out": False,
+    "_shards": {"total": 5, "successful": 5, "failed": 0},
+    "hits": {
+        "total": 184537,
+        "max_score": 7.2,
+        "hits": [{
+            "_index": "geonames",
+            "_type": "type",
+            "_id": str(idx),
+            "_score": 7.2,
+            "_source": {
+                "name": "Vienna",
+                "feature_class": "P",
+                "country_code": "AT",
+                "population": 1691468,
+                "location": [16.37208, 48.20849],
+                "alternatenames": ["Becs", "Bech", "Vena", "Viena", "Vienne", "Wien"]
+            }
+        } for idx in range(10)]
+    },
+    "aggregations": {
+        "country_population": {
+            "buckets": [{"key": "AT", "doc_count": 1200, "population": {"value": 8772865.0}} for _ in range(20)]
+        }
+    }
+}).encode("utf-8")
+
+BULK_RESPONSE = json.dumps({
+    "took": 30,
+    "errors": False,
+    "items": [{
+        "index": {
+            "_index": "test",
+            "_type": "type1",
+            "_id": str(idx),
+            "_version": 1,
+            "result": "created",
+            "_shards": {"total": 2, "successful": 1, "failed": 0},
+            "created": True,
+            "status": 201
+        }
+    } for idx in range(5000)]
+}).encode("utf-8")
+
+SEARCH_REQUEST = {
+    "query": {
+        "bool": {
+            "must": [{"match": {"name": "Vienna"}}],
+            "filter": [{"range": {"population": {"gte": 100000}}}]
+        }
+    },
+    "aggs": {"country_population": {"terms": {"field": "country_code"}, "aggs": {"population": {"sum": {"field": "population"}}}}}
+}
+
+
+def available_codecs():
+    codecs = []
+    for codec_class in jsoncodec.CODECS:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+    return codecs
+
+
+CODECS = available_codecs()
+CODEC_IDS = [c.name for c in CODECS]
+
+
+@pytest.mark.parametrize("codec", CODECS, ids=CODEC_IDS)
+@pytest.mark.benchmark(
+    group="json-decode-search-response",
+    warmup="on",
+    warmup_iterations=1000,
+    disable_gc=True
+)
+def test_decode_search_response(benchmark, codec):
+    benchmark(codec.loads, SEARCH_RESPONSE)
+
+
+@pytest.mark.parametrize("codec", CODECS, ids=CODEC_IDS)
+@pytest.mark.benchmark(
+    group="json-decode-bulk-response",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_decode_bulk_response(benchmark, codec):
+    benchmark(codec.loads, BULK_RESPONSE)
+
+
+@pytest.mark.parametrize("codec", CODECS, ids=CODEC_IDS)
+@pytest.mark.benchmark(
+    group="json-encode-search-request",
+    warmup="on",
+    warmup_iterations=1000,
+    disable_gc=True
+)
+def test_encode_search_request(benchmark, codec):
+    benchmark(codec.dumps, SEARCH_REQUEST)
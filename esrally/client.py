@@ -1,9 +1,12 @@
-import gzip
 import logging
+from urllib.parse import urlencode
 
 import certifi
 import urllib3
 
+from esrally import exceptions
+from esrally.utils import compression, jsoncodec
+
 logger = logging.getLogger("rally.client")
 
 
@@ -14,7 +17,16 @@ class EsClientFactory:
     def __init__(self, hosts, client_options):
         logger.info("Creating ES client connected to %s with options [%s]" % (hosts, client_options))
         self.hosts = hosts
-        self.client_options = client_options
+        # the options may be shared with other factories so we must not remove the keys that we handle ourselves
+        self.client_options = dict(client_options)
+        self.json_codec = jsoncodec.from_client_options(self.client_options)
+        self.client_options.pop("json_codec", None)
+        try:
+            self.compressor = compression.Compressor(
+                algorithm=self.client_options.pop("compression_algorithm", compression.DEFAULT_ALGORITHM),
+                level=self.client_options.pop("compression_level", compression.DEFAULT_LEVEL))
+        except ValueError as e:
+            raise exceptions.SystemSetupError("Invalid client options: %s" % str(e))
 
         if self._is_set(client_options, "use_ssl") and self._is_set(client_options, "verify_certs") and "ca_certs" not in client_options:
             self.client_options["ca_certs"] = certifi.where()
@@ -30,13 +42,17 @@ class EsClientFactory:
 
     def create(self):
         class PoolWrap(object):
-            def __init__(self, pool, compressed=False, **kwargs):
+            def __init__(self, pool, compressor=None):
                 self.pool = pool
-                self.compressed = compressed
+                self.compressor = compressor
 
             def urlopen(self, method, url, body, retries, headers, **kw):
-                if body is not None and self.compressed:
-                    body = gzip.compress(body)
+                if isinstance(body, compression.CompressedBody):
+                    # compressed ahead of time (not necessarily with the same algorithm)
+                    headers = dict(headers)
+                    headers["Content-Encoding"] = body.content_encoding
+                elif body is not None and self.compressor:
+                    body = self.compressor.compress(body)
                 return self.pool.urlopen(method, url, body=body, retries=retries, headers=headers, **kw)
 
             def __getattr__(self, attr_name):
@@ -45,12 +61,146 @@ class EsClientFactory:
         import elasticsearch
 
         class ConfigurableHttpConnection(elasticsearch.Urllib3HttpConnection):
-            def __init__(self, compressed=False, **kwargs):
+            def __init__(self, compressed=False, compressor=None, **kwargs):
                 super(ConfigurableHttpConnection, self).__init__(**kwargs)
                 self.headers.update({"Content-Type": "application/json"})
                 if compressed:
                     self.headers.update(urllib3.make_headers(accept_encoding=True))
-                    self.headers.update({"Content-Encoding": "gzip"})
-                self.pool = PoolWrap(self.pool, **kwargs)
+                    self.headers.update({"Content-Encoding": compressor.content_encoding})
+                self.pool = PoolWrap(self.pool, compressor if compressed else None)
+
+        class CodecSerializer(elasticsearch.serializer.JSONSerializer):
+            def __init__(self, codec):
+                self.codec = codec
+
+            def loads(self, s):
+                try:
+                    return self.codec.loads(s)
+                except (ValueError, TypeError) as e:
+                    raise elasticsearch.SerializationError(s, e)
+
+            def dumps(self, data):
+                if isinstance(data, str):
+                    return data
+                try:
+                    return self.codec.dumps(data)
+                except (ValueError, TypeError, OverflowError):
+                    # e.g. dates or decimals which only the stdlib based serializer knows how to handle
+                    return super().dumps(data)
+
+        es = elasticsearch.Elasticsearch(hosts=self.hosts, connection_class=ConfigurableHttpConnection,
+                                         serializer=CodecSerializer(self.json_codec), compressor=self.compressor,
+                                         **self.client_options)
+        # created once per client so runners can reuse it for every request
+        compressor = self.compressor if self._is_set(self.client_options, "compressed") else None
+        es.raw_transport = RawTransport(es.transport, compressor=compressor, request_timeout=self.client_options.get("request_timeout"),
+                                        codec=self.json_codec)
+        return es
+
+
+class RawTransport:
+    """
+    A lean alternative to the client's transport for requests with a prebuilt body (e.g. bulk requests).
+
+    The body (``bytes`` or ``memoryview``) is sent as is over the connection pool of the provided transport so neither the client's
+    serializer nor its request logging (which decodes the complete request body) is involved. The response body is returned as raw bytes
+    and it is up to the caller to parse it.
+
+    Like the client's transport, requests are retried on another connection up to ``max_retries`` times on connection errors, on
+    timeouts (if ``retry_on_timeout`` is set) and on any of the status codes in ``retry_on_status``. Connections that failed are marked
+    dead. ``EsClientFactory`` creates one instance per client and exposes it as ``raw_transport`` on the client.
+    """
+
+    def __init__(self, transport, compressor=None, request_timeout=None, codec=None):
+        """
+        :param transport: The transport of an Elasticsearch client as created by ``EsClientFactory``.
+        :param compressor: A ``compression.Compressor`` if request bodies should be compressed. Optional.
+        :param request_timeout: The default timeout for a request in seconds. Optional. If it is not set, the timeout of the connection
+                                is used.
+        :param codec: The ``jsoncodec`` codec of the client which callers should use to decode responses. Optional. Defaults to the
+                      standard library codec.
+        """
+        self.transport = transport
+        self.compressor = compressor
+        self.request_timeout = request_timeout
+        self.codec = codec if codec else jsoncodec.codec()
+
+    def prepare_body(self, body):
+        """
+        :param body: The request body as ``bytes`` or ``memoryview``.
+        :return: A ``compression.CompressedBody`` if the client compresses requests or if the body is already compressed. Otherwise the
+                 body is returned as is.
+        """
+        if self.compressor and not isinstance(body, compression.CompressedBody):
+            return self.compressor.compress_body(body)
+        return body
+
+    def perform_request(self, method, path, params=None, body=None):
+        """
+        :param method: The HTTP method.
+        :param path: The path of the request (without host).
+        :param params: A dict with URL parameters. Optional. Like for the client's transport, the key ``request_timeout`` overrides the
+                       default request timeout and is not sent.
+        :param body: The request body as ``bytes``, ``memoryview`` or ``compression.CompressedBody``. Optional.
+        :return: A tuple of HTTP status code and raw response body (``bytes``).
+        """
+        from elasticsearch import exceptions as es_exceptions
+
+        timeout = self.request_timeout
+        if params and "request_timeout" in params:
+            params = dict(params)
+            timeout = params.pop("request_timeout")
+        for attempt in range(self.transport.max_retries + 1):
+            connection = self.transport.get_connection()
+            try:
+                status, data = self._send(connection, method, path, params, body, timeout)
+            except es_exceptions.TransportError as e:
+                if isinstance(e, es_exceptions.ConnectionTimeout):
+                    retry = self.transport.retry_on_timeout
+                elif isinstance(e, es_exceptions.ConnectionError):
+                    retry = True
+                else:
+                    retry = e.status_code in self.transport.retry_on_status
+                if not retry or attempt == self.transport.max_retries:
+                    raise
+                # only mark as dead if we are retrying (same as the client's transport)
+                self.transport.mark_dead(connection)
+            else:
+                self.transport.connection_pool.mark_live(connection)
+                return status, data
+
+    def _send(self, connection, method, path, params, body, timeout):
+        from elasticsearch import exceptions as es_exceptions
 
-        return elasticsearch.Elasticsearch(hosts=self.hosts, connection_class=ConfigurableHttpConnection, **self.client_options)
+        url = connection.url_prefix + path
+        if params:
+            url = "%s?%s" % (url, urlencode(params))
+        try:
+            # sending may happen through a pool wrapper which compresses the body if needed
+            kw = {}
+            if timeout:
+                kw["timeout"] = timeout
+            response = connection.pool.urlopen(method, url, body, retries=False, headers=connection.headers, **kw)
+            data = response.data
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise es_exceptions.ConnectionTimeout("TIMEOUT", str(e), e)
+        except Exception as e:
+            raise es_exceptions.ConnectionError("N/A", str(e), e)
+
+        if not 200 <= response.status < 300:
+            raise self._error(response.status, data.decode("utf-8", errors="replace"))
+        return response.status, data
+
+    def _error(self, status, raw_data):
+        from elasticsearch import exceptions as es_exceptions
+
+        error_message = raw_data
+        info = None
+        try:
+            info = self.codec.loads(raw_data)
+            error_message = info.get("error", error_message)
+            if isinstance(error_message, dict) and "type" in error_message:
+                error_message = error_message["type"]
+        except (ValueError, TypeError, AttributeError):
+            logger.warning("Could not decode error response with status [%s]." % status)
+        return es_exceptions.HTTP_EXCEPTIONS.get(status, es_exceptions.TransportError)(status, error_message, info)
@@ -0,0 +1,153 @@
+"""
+An alternative execution engine for load generators (``--client-execution=thread-pool``). All clients of a load generator are scheduled
+as coroutines on one event loop but as the Elasticsearch client is blocking, they issue their requests from a bounded thread pool that
+they share. Hence, every request that is in flight still occupies one thread and there are never more requests in flight than threads.
+
+Requires Python 3.5 or better.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+from esrally.driver import driver
+from esrally.utils import convert, sysstats
+
+logger = logging.getLogger("rally.driver")
+profile_logger = logging.getLogger("rally.profile")
+
+# number of request threads per logical CPU core if the number of request threads is not configured explicitly
+DEFAULT_REQUEST_THREADS_PER_CORE = 4
+
+
+def request_threads(clients, configured_threads=None):
+    """
+    :param clients: The number of clients that run on the event loop.
+    :param configured_threads: The number of request threads that the user has configured. Optional.
+    :return: The number of threads from which requests are issued. It is bounded by the number of clients.
+    """
+    if configured_threads is None:
+        configured_threads = DEFAULT_REQUEST_THREADS_PER_CORE * sysstats.logical_cpu_cores()
+    return max(min(configured_threads, clients), 1)
+
+
+def execute_tasks_of_all_clients(cancel, current_track, tasks_per_client, es_per_client, samplers_per_client, enable_profiling=False,
+                                 prefetch_size=0, max_request_threads=None):
+    """
+    Executes the tasks of all clients of a load generator on a new event loop and blocks until all of them have finished.
+
+    :param cancel: A shared boolean that indicates we need to cancel execution.
+    :param current_track: The current track.
+    :param tasks_per_client: A dict of client id to a list of tasks that this client should execute.
+    :param es_per_client: A dict of client id to the Elasticsearch client that this client should use.
+    :param samplers_per_client: A dict of client id to a list of samplers, one for each task.
+    :param enable_profiling: Enables a Python profiler for this execution (default: False).
+    :param prefetch_size: The number of parameters to prepare ahead of time for bulk-indexing operations (default: 0, i.e. disabled).
+    :param max_request_threads: The maximum number of threads from which requests are issued (default: ``DEFAULT_REQUEST_THREADS_PER_CORE``
+                                times the number of logical CPU cores).
+    """
+    if enable_profiling:
+        import cProfile, pstats
+        import io as python_io
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # The Elasticsearch client is blocking. Hence, we issue requests from a bounded thread pool that all clients share but do all the
+    # scheduling on the event loop. If all threads are busy, requests wait for a free thread which is reflected in latency and schedule lag.
+    threads = request_threads(len(tasks_per_client), max_request_threads)
+    logger.info("Issuing requests of [%d] clients from [%d] threads." % (len(tasks_per_client), threads))
+    request_executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    try:
+        clients = [execute_tasks(loop, request_executor, cancel, client_id, current_track, tasks, es_per_client[client_id],
+                                 samplers_per_client[client_id], prefetch_size)
+                   for client_id, tasks in tasks_per_client.items()]
+        if clients:
+            loop.run_until_complete(asyncio.gather(*clients))
+    finally:
+        request_executor.shutdown()
+        asyncio.set_event_loop(None)
+        loop.close()
+        if enable_profiling:
+            profiler.disable()
+            s = python_io.StringIO()
+            ps = pstats.Stats(profiler, stream=s).sort_stats("cumulative")
+            ps.print_stats()
+
+            profile = "\n=== Profile START for clients [%s] ===\n" % ", ".join([str(c) for c in tasks_per_client.keys()])
+            profile += s.getvalue()
+            profile += "=== Profile END for clients [%s] ===" % ", ".join([str(c) for c in tasks_per_client.keys()])
+            profile_logger.info(profile)
+
+
+async def execute_tasks(loop, request_executor, cancel, client_id, current_track, tasks, es, samplers, prefetch_size=0):
+    for task, sampler in zip(tasks, samplers):
+        if cancel.is_set():
+            logger.info("User cancelled execution.")
+            break
+        # creating a schedule may involve I/O (e.g. opening data files) so we keep it off the event loop
+        schedule = await loop.run_in_executor(request_executor, driver.schedule_for, current_track, task, client_id, sampler,
+                                              prefetch_size)
+        await execute_schedule(loop, request_executor, cancel, client_id, task.operation, schedule, es, sampler)
+
+
+# marks the end of a schedule (next() cannot raise StopIteration through a future)
+_END_OF_SCHEDULE = object()
+
+
+async def execute_schedule(loop, request_executor, cancel, client_id, op, schedule, es, sampler):
+    """
+    Executes tasks according to the schedule for a given operation. This is the asyncio equivalent of ``driver.execute_schedule``.
+    """
+    total_start = time.perf_counter()
+    try:
+        while True:
+            # parameter sources may block (e.g. file I/O or waiting for a prefetching thread) so they must not run on the event loop
+            item = await loop.run_in_executor(request_executor, next, schedule, _END_OF_SCHEDULE)
+            if item is _END_OF_SCHEDULE:
+                break
+            expected_scheduled_time, sample_type, percent_completed, runner, params = item
+            if cancel.is_set():
+                logger.info("User cancelled execution.")
+                break
+            absolute_expected_schedule_time = total_start + expected_scheduled_time
+            throughput_throttled = expected_scheduled_time > 0
+            if throughput_throttled:
+                rest = absolute_expected_schedule_time - time.perf_counter()
+                if rest > 0:
+                    await asyncio.sleep(rest)
+            # without throughput throttling, a request is due as soon as the client submits it
+            submitted = time.perf_counter()
+            service_time, result = await loop.run_in_executor(request_executor, _timed_execute_single, runner, es, params)
+            total_ops, total_ops_unit, request_meta_data = result
+            stop = time.perf_counter()
+
+            # Latency is measured from the scheduled time so it includes the time that the request has waited for a free request thread
+            # (unlike with one thread per client, latency differs from service time even if throughput is not throttled).
+            if throughput_throttled:
+                latency = stop - absolute_expected_schedule_time
+                # the request thread measures the service time so this is the actual start of the request (plus the time until the
+                # event loop has picked up the result)
+                schedule_lag = convert.seconds_to_ms(stop - service_time - absolute_expected_schedule_time)
+            else:
+                latency = stop - submitted
+                schedule_lag = None
+            sampler.add(sample_type, request_meta_data, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops,
+                        total_ops_unit, (stop - total_start), percent_completed, schedule_lag)
+    except BaseException:
+        logger.exception("Could not execute schedule for client [%s] and operation [%s]" % (str(client_id), str(op)))
+        raise
+    finally:
+        # release resources of the schedule (e.g. a prefetching parameter source) off the event loop as well
+        close = getattr(schedule, "close", None)
+        if close:
+            await loop.run_in_executor(request_executor, close)
+
+
+def _timed_execute_single(runner, es, params):
+    # measure service time in the request thread so it does not include any time spent waiting for the event loop
+    start = time.perf_counter()
+    result = driver.execute_single(runner, es, params)
+    stop = time.perf_counter()
+    return stop - start, result
@@ -1,20 +1,29 @@
+import array
+import collections
 import concurrent.futures
+import copy
 import threading
 import datetime
-import json
+import itertools
 import logging
-import queue
+import math
 import socket
 import time
 
 import thespian.actors
 from esrally import actor, exceptions, metrics, track, client, PROGRAM_NAME
-from esrally.driver import runner
-from esrally.utils import convert, console, versions, io
+from esrally.driver import runner, scheduler
+from esrally.utils import convert, console, versions, io, sysstats, histogram, jsoncodec
 
 logger = logging.getLogger("rally.driver")
 profile_logger = logging.getLogger("rally.profile")
 
+# time in seconds before a scheduled request during which clients busy-wait instead of sleeping
+DEFAULT_SPIN_THRESHOLD = 0.002
+
+# math.nan is only available as of Python 3.5
+NAN = float("nan")
+
 
 ##################################
 #
@@ -44,17 +53,19 @@ class StartLoadGenerator:
     Starts a load generator.
     """
 
-    def __init__(self, client_id, config, track, tasks):
+    def __init__(self, worker_id, config, track, client_allocations, prepare_track=False):
         """
-        :param client_id: Client id of the load generator.
+        :param worker_id: Id of the load generator.
         :param config: Rally internal configuration object.
         :param track: The track to use.
-        :param tasks: Tasks to run.
+        :param client_allocations: A dict with the client id as key and the tasks that this client should run as value.
+        :param prepare_track: Whether this load generator needs to prepare the track data on its host (default: False).
         """
-        self.client_id = client_id
+        self.worker_id = worker_id
         self.config = config
         self.track = track
-        self.tasks = tasks
+        self.client_allocations = client_allocations
+        self.prepare_track = prepare_track
 
 
 class Drive:
@@ -62,8 +73,13 @@ class Drive:
     Tells a load generator to drive (either after a join point or initially).
     """
 
-    def __init__(self, client_start_timestamp):
+    def __init__(self, client_start_timestamp, skip_tasks=None):
+        """
+        :param client_start_timestamp: The timestamp (in the load generator's clock) when the next step should start.
+        :param skip_tasks: A list of tasks of the next step that should not be run (e.g. remaining probes of a throughput search).
+        """
         self.client_start_timestamp = client_start_timestamp
+        self.skip_tasks = skip_tasks if skip_tasks else []
 
 
 class UpdateSamples:
@@ -71,8 +87,12 @@ class UpdateSamples:
     Used to send samples from a load generator node to the master.
     """
 
-    def __init__(self, client_id, samples):
-        self.client_id = client_id
+    def __init__(self, worker_id, samples):
+        """
+        :param worker_id: Id of the load generator.
+        :param samples: A list of ``SampleBatch`` instances.
+        """
+        self.worker_id = worker_id
         self.samples = samples
 
 
@@ -81,9 +101,11 @@ class JoinPointReached:
     Tells the master that a load generator has reached a join point. Used for coordination across multiple load generators.
     """
 
-    def __init__(self, client_id, task):
-        self.client_id = client_id
+    def __init__(self, worker_id, task):
+        self.worker_id = worker_id
         self.client_local_timestamp = time.perf_counter()
+        # needed to correct wall clock differences between load driver hosts
+        self.client_wall_clock_timestamp = time.time()
         self.task = task
 
 
@@ -116,6 +138,8 @@ class BenchmarkCancelled:
 
 class Driver(actor.RallyActor):
     WAKEUP_INTERVAL_SECONDS = 1
+    # post-process request metrics every N seconds and send it to the metrics store
+    POST_PROCESS_INTERVAL_SECONDS = 30
     """
     Coordinates all worker drivers.
     """
@@ -129,7 +153,14 @@ class Driver(actor.RallyActor):
         # Elasticsearch client
         self.es = None
         self.metrics_store = None
+        # samples that have been received since the last post-processing run
         self.raw_samples = []
+        self.throughput_calculator = None
+        self.request_metrics_aggregator = None
+        self.throughput_search_tracker = None
+        self.most_recent_post_processing = None
+        self.dropped_samples_per_task = {}
+        self.param_source_waits_per_task = {}
         self.currently_completed = 0
         self.clients_completed_current_step = {}
         self.current_step = -1
@@ -139,6 +170,8 @@ class Driver(actor.RallyActor):
         self.join_points = None
         self.ops_per_join_point = None
         self.drivers = []
+        self.remote_workers = set()
+        self.clock_offset_per_worker = {}
         self.progress_reporter = console.progress()
         self.progress_counter = 0
         self.quiet = False
@@ -156,6 +189,8 @@ class Driver(actor.RallyActor):
             elif isinstance(msg, thespian.actors.WakeupMessage):
                 if not self.finished():
                     self.update_progress_message()
+                    if time.perf_counter() - self.most_recent_post_processing >= Driver.POST_PROCESS_INTERVAL_SECONDS:
+                        self.post_process_samples()
                     self.wakeupAfter(datetime.timedelta(seconds=Driver.WAKEUP_INTERVAL_SECONDS))
             elif isinstance(msg, BenchmarkFailure):
                 logger.error("Main driver received a fatal exception from a load generator. Shutting down.")
@@ -192,25 +227,26 @@ class Driver(actor.RallyActor):
         challenge_name = self.track.find_challenge_or_default(self.config.opts("track", "challenge.name")).name
         selected_car_name = self.config.opts("mechanic", "car.name")
 
-        logger.info("Preparing track [%s]" % track_name)
-        # TODO #71: Reconsider this in case we distribute drivers. *For now* the driver will only be on a single machine, so we're safe.
-        track.prepare_track(self.track, self.config)
-
         logger.info("Benchmark for track [%s], challenge [%s] and car [%s] is about to start." %
                     (track_name, challenge_name, selected_car_name))
         self.quiet = self.config.opts("system", "quiet.mode", mandatory=False, default_value=False)
-        self.es = client.EsClientFactory(self.config.opts("client", "hosts"), self.config.opts("client", "options")).create()
+        client_factory = client.EsClientFactory(self.config.opts("client", "hosts"), self.config.opts("client", "options"))
+        self.es = client_factory.create()
         self.metrics_store = metrics.InMemoryMetricsStore(cfg=self.config, meta_info=msg.metrics_meta_info, lap=msg.lap)
         invocation = self.config.opts("system", "time.start")
         expected_cluster_health = self.config.opts("benchmarks", "cluster.health")
         self.metrics_store.open(invocation, track_name, challenge_name, selected_car_name)
+        self.throughput_calculator = ThroughputCalculator()
+        self.request_metrics_aggregator = RequestMetricsAggregator()
+        self.throughput_search_tracker = ThroughputSearchTracker()
+        self.most_recent_post_processing = time.perf_counter()
 
         self.challenge = select_challenge(self.config, self.track)
         for template in self.track.templates:
             setup_template(self.es, template)
 
         for index in self.track.indices:
-            setup_index(self.es, index, self.challenge.index_settings)
+            setup_index(self.es, index, self.challenge.index_settings, codec=client_factory.json_codec)
         wait_for_status(self.es, expected_cluster_health)
         allocator = Allocator(self.challenge.schedule)
         self.allocations = allocator.allocations
@@ -220,20 +256,43 @@ class Driver(actor.RallyActor):
         logger.info("Benchmark consists of [%d] steps executed by (at most) [%d] clients as specified by the allocation matrix:\n%s" %
                     (self.number_of_steps, len(self.allocations), self.allocations))
 
-        for client_id in range(allocator.clients):
+        hosts = load_driver_hosts(self.config)
+        worker_allocations = allocations_per_worker(self.allocations, number_of_workers(self.config, allocator.clients, len(hosts)))
+        logger.info("Running [%d] clients on [%d] load generators on hosts %s with client execution [%s]." %
+                    (allocator.clients, len(worker_allocations), hosts, client_execution(self.config)))
+        prepared_hosts = set()
+        start_messages = []
+        for worker_id in range(len(worker_allocations)):
+            host = hosts[worker_id % len(hosts)]
+            if is_local(host):
+                requirements = {"coordinator": True}
+            else:
+                if not self.config.opts("system", "remote.benchmarking.supported", mandatory=False, default_value=False):
+                    raise exceptions.SystemSetupError("To use the load driver host [%s] you need to start the Rally daemon "
+                                                      "on each machine including this one." % host)
+                requirements = {"ip": host}
+                self.remote_workers.add(worker_id)
             self.drivers.append(
                 self.createActor(LoadGenerator,
-                                 globalName="/rally/driver/worker/%s" % str(client_id),
-                                 targetActorRequirements={"coordinator": True}))
-        for client_id, driver in enumerate(self.drivers):
-            self.send(driver, StartLoadGenerator(client_id, self.config, self.track, self.allocations[client_id]))
+                                 globalName="/rally/driver/worker/%s" % str(worker_id),
+                                 targetActorRequirements=requirements))
+            # the track needs to be prepared exactly once on each host (which may be specified with different names or addresses)
+            key = machine_key(host)
+            prepare = key not in prepared_hosts
+            prepared_hosts.add(key)
+            start_messages.append(StartLoadGenerator(worker_id, self.config, self.track, worker_allocations[worker_id], prepare))
+        for driver, start_message in zip(self.drivers, start_messages):
+            self.send(driver, start_message)
 
         self.update_progress_message()
         self.wakeupAfter(datetime.timedelta(seconds=Driver.WAKEUP_INTERVAL_SECONDS))
 
     def joinpoint_reached(self, msg):
         self.currently_completed += 1
-        self.clients_completed_current_step[msg.client_id] = (msg.client_local_timestamp, time.perf_counter())
+        self.clients_completed_current_step[msg.worker_id] = (msg.client_local_timestamp, time.perf_counter())
+        if msg.worker_id in self.remote_workers:
+            # Assumption: The message latency is small compared to the clock difference between hosts.
+            self.clock_offset_per_worker[msg.worker_id] = time.time() - msg.client_wall_clock_timestamp
         logger.info("[%d/%d] drivers reached join point [%d/%d]." %
                     (self.currently_completed, len(self.drivers), self.current_step + 1, self.number_of_steps))
         if self.currently_completed == len(self.drivers):
@@ -248,6 +307,10 @@ class Driver(actor.RallyActor):
             # clear per step
             self.most_recent_sample_per_client = {}
             self.current_step += 1
+            if self.current_step > 0:
+                for task in self.challenge.schedule[self.current_step - 1]:
+                    if task.throughput_search:
+                        self.throughput_search_tracker.finish_probe(task)
             if self.finished():
                 logger.info("All steps completed. Shutting down.")
                 # we're done here
@@ -255,6 +318,10 @@ class Driver(actor.RallyActor):
                     self.send(driver, thespian.actors.ActorExitRequest())
                 logger.info("Postprocessing samples...")
                 self.post_process_samples()
+                self.store_throughput(self.throughput_calculator.finish())
+                self.store_dropped_samples()
+                self.store_param_source_waits()
+                self.store_max_sustainable_throughput()
                 logger.info("Sending benchmark results...")
                 self.send(self.start_sender, BenchmarkComplete(self.metrics_store.to_externalizable()))
                 logger.info("Closing metrics store...")
@@ -264,8 +331,12 @@ class Driver(actor.RallyActor):
                 logger.info("Terminating main driver actor.")
                 self.send(self.myAddress, thespian.actors.ActorExitRequest())
             else:
-                if self.config.opts("track", "test.mode.enabled"):
-                    # don't wait if test mode is enabled and start the next task immediately.
+                next_tasks = list(self.challenge.schedule[self.current_step])
+                skip_tasks = [task for task in next_tasks if self.throughput_search_tracker.skipped(task)]
+                if skip_tasks:
+                    logger.info("Skipping [%s] as the throughput search has already ended." % ", ".join([str(t) for t in skip_tasks]))
+                if self.config.opts("track", "test.mode.enabled") or len(skip_tasks) == len(next_tasks):
+                    # don't wait if test mode is enabled (or there is nothing to run) and start the next task immediately.
                     start_next_task = time.perf_counter()
                 else:
                     # start the next task in five seconds (relative to master's timestamp)
@@ -273,45 +344,95 @@ class Driver(actor.RallyActor):
                     # Assumption: We don't have a lot of clock skew between reaching the join point and sending the next task
                     #             (it doesn't matter too much if we're a few ms off).
                     start_next_task = time.perf_counter() + 5.0
-                for client_id, driver in enumerate(self.drivers):
-                    client_ended_task_at, master_received_msg_at = clients_curr_step[client_id]
+                for worker_id, driver in enumerate(self.drivers):
+                    client_ended_task_at, master_received_msg_at = clients_curr_step[worker_id]
                     client_start_timestamp = client_ended_task_at + (start_next_task - master_received_msg_at)
-                    logger.info("Scheduling next task for client id [%d] at their timestamp [%f] (master timestamp [%f])" %
-                                (client_id, client_start_timestamp, start_next_task))
-                    self.send(driver, Drive(client_start_timestamp))
+                    logger.info("Scheduling next task for load generator [%d] at their timestamp [%f] (master timestamp [%f])" %
+                                (worker_id, client_start_timestamp, start_next_task))
+                    self.send(driver, Drive(client_start_timestamp, skip_tasks))
 
     def finished(self):
         return self.current_step == self.number_of_steps
 
     def update_samples(self, msg):
-        self.raw_samples += msg.samples
-        if len(msg.samples) > 0:
-            most_recent = msg.samples[-1]
-            self.most_recent_sample_per_client[most_recent.client_id] = most_recent
+        clock_offset = self.clock_offset_per_worker.get(msg.worker_id)
+        for batch in msg.samples:
+            if clock_offset:
+                # bring samples of remote load generators to the master's wall clock time
+                batch.shift_absolute_time(clock_offset)
+            if batch.dropped > 0:
+                logger.warning("Client [%d] dropped [%d] samples for [%s]." % (batch.client_id, batch.dropped, batch.task))
+                self.dropped_samples_per_task[batch.task] = self.dropped_samples_per_task.get(batch.task, 0) + batch.dropped
+            if batch.param_source_waits > 0:
+                waits, wait_time = self.param_source_waits_per_task.get(batch.task, (0, 0))
+                self.param_source_waits_per_task[batch.task] = (waits + batch.param_source_waits, wait_time + batch.param_source_wait_time)
+            if len(batch) > 0:
+                self.raw_samples.append(batch)
+                self.most_recent_sample_per_client[batch.client_id] = batch.last()
+                self.throughput_search_tracker.add(batch)
 
     def post_process_samples(self):
-        logger.info("Storing latency and service time... ")
-        for sample in self.raw_samples:
-            meta_data = self.merge(
-                self.track.meta_data,
-                self.challenge.meta_data,
-                sample.operation.meta_data,
-                sample.task.meta_data,
-                sample.request_meta_data)
+        """
+        Folds all samples that have been received since the last invocation into per-task histograms and stores them together with the
+        throughput that could be calculated so far. Afterwards the samples are discarded so the memory consumption of the driver does not
+        grow with the duration of the benchmark. As this happens every ``POST_PROCESS_INTERVAL_SECONDS``, request metrics are stored as a
+        time series with one histogram per task, sample type and interval.
+        """
+        self.most_recent_post_processing = time.perf_counter()
+        raw_samples = self.raw_samples
+        self.raw_samples = []
+        if len(raw_samples) == 0:
+            return
+        logger.info("Aggregating latency and service time for [%d] samples... " % sum([len(batch) for batch in raw_samples]))
+        self.request_metrics_aggregator.add(itertools.chain.from_iterable(raw_samples))
+        self.store_request_metrics(self.request_metrics_aggregator.finish())
 
-            self.metrics_store.put_value_cluster_level(name="latency", value=sample.latency_ms, unit="ms", operation=sample.operation.name,
-                                                       operation_type=sample.operation.type, sample_type=sample.sample_type,
-                                                       absolute_time=sample.absolute_time, relative_time=sample.relative_time,
-                                                       meta_data=meta_data)
+        logger.info("Calculating throughput... ")
+        self.store_throughput(self.throughput_calculator.calculate(itertools.chain.from_iterable(raw_samples)))
 
-            self.metrics_store.put_value_cluster_level(name="service_time", value=sample.service_time_ms, unit="ms",
-                                                       operation=sample.operation.name, operation_type=sample.operation.type,
-                                                       sample_type=sample.sample_type, absolute_time=sample.absolute_time,
-                                                       relative_time=sample.relative_time, meta_data=meta_data)
+    def store_request_metrics(self, aggregates):
+        for (task, sample_type), task_metrics in aggregates.items():
+            op = task.operation
+            meta_data = self.merge(self.track.meta_data, self.challenge.meta_data, op.meta_data, task.meta_data)
+            for name, h in task_metrics.histograms.items():
+                self.metrics_store.put_histogram_cluster_level(name=name, histogram=h, unit="ms", operation=op.name, operation_type=op.type,
+                                                               sample_type=sample_type, absolute_time=task_metrics.absolute_time,
+                                                               relative_time=task_metrics.relative_time, meta_data=meta_data)
+            self.metrics_store.put_count_cluster_level(name="error_count", count=task_metrics.errors, operation=op.name,
+                                                       operation_type=op.type, sample_type=sample_type,
+                                                       absolute_time=task_metrics.absolute_time, relative_time=task_metrics.relative_time,
+                                                       meta_data=meta_data)
 
-        logger.info("Calculating throughput... ")
-        aggregates = calculate_global_throughput(self.raw_samples)
-        logger.info("Storing throughput... ")
+    def store_dropped_samples(self):
+        seen_tasks = set()
+        for tasks in self.challenge.schedule:
+            for task in tasks:
+                if task in seen_tasks:
+                    continue
+                seen_tasks.add(task)
+                op = task.operation
+                meta_data = self.merge(self.track.meta_data, self.challenge.meta_data, op.meta_data, task.meta_data)
+                self.metrics_store.put_count_cluster_level(name="dropped_samples", count=self.dropped_samples_per_task.get(task, 0),
+                                                           operation=op.name, operation_type=op.type, meta_data=meta_data)
+
+    def store_param_source_waits(self):
+        for task, (waits, wait_time) in self.param_source_waits_per_task.items():
+            op = task.operation
+            meta_data = self.merge(self.track.meta_data, self.challenge.meta_data, op.meta_data, task.meta_data)
+            self.metrics_store.put_count_cluster_level(name="param_source_waits", count=waits, operation=op.name, operation_type=op.type,
+                                                       meta_data=meta_data)
+            self.metrics_store.put_value_cluster_level(name="param_source_wait_time", value=convert.seconds_to_ms(wait_time), unit="ms",
+                                                       operation=op.name, operation_type=op.type, meta_data=meta_data)
+
+    def store_max_sustainable_throughput(self):
+        for search in self.throughput_search_tracker.searches(self.challenge.schedule):
+            op = search.operation
+            target_throughput, throughput, throughput_unit = self.throughput_search_tracker.result(search)
+            meta_data = self.merge(self.track.meta_data, self.challenge.meta_data, op.meta_data, {"target-throughput": target_throughput})
+            self.metrics_store.put_value_cluster_level(name="max_sustainable_throughput", value=throughput, unit=throughput_unit,
+                                                       operation=op.name, operation_type=op.type, meta_data=meta_data)
+
+    def store_throughput(self, aggregates):
         for task, samples in aggregates.items():
             meta_data = self.merge(
                 self.track.meta_data,
@@ -348,7 +469,7 @@ class Driver(actor.RallyActor):
 
 class LoadGenerator(actor.RallyActor):
     """
-    The actual driver that applies load against the cluster.
+    The actual driver that applies load against the cluster. A load generator runs one or more clients.
 
     It will also regularly send measurements to the master node so it can consolidate them.
     """
@@ -359,44 +480,52 @@ class LoadGenerator(actor.RallyActor):
         super().__init__()
         actor.RallyActor.configure_logging(logger)
         self.master = None
-        self.client_id = None
+        self.worker_id = None
         self.es = None
         self.config = None
         self.track = None
-        self.tasks = None
-        self.current_task = 0
+        self.client_allocations = None
+        self.client_execution = None
+        self.current_task_index = 0
         self.start_timestamp = None
-        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pool = None
         # cancellation via future does not work, hence we use our own mechanism with a shared variable and polling
         self.cancel = threading.Event()
-        self.executor_future = None
-        self.sampler = None
+        self.executor_futures = []
+        self.samplers = []
+        self.skip_tasks = []
         self.start_driving = False
         self.wakeup_interval = LoadGenerator.WAKEUP_INTERVAL_SECONDS
 
     def receiveMessage(self, msg, sender):
         try:
-            logger.debug("LoadGenerator[%s]#receiveMessage(msg = [%s], sender = [%s])" % (str(self.client_id), str(type(msg)), str(sender)))
+            logger.debug("LoadGenerator[%s]#receiveMessage(msg = [%s], sender = [%s])" % (str(self.worker_id), str(type(msg)), str(sender)))
             if isinstance(msg, StartLoadGenerator):
-                logger.debug("LoadGenerator[%d] is about to start." % msg.client_id)
+                logger.debug("LoadGenerator[%d] is about to start." % msg.worker_id)
                 self.master = sender
-                self.client_id = msg.client_id
-                self.es = client.EsClientFactory(msg.config.opts("client", "hosts"), msg.config.opts("client", "options")).create()
+                self.worker_id = msg.worker_id
                 self.config = msg.config
                 self.track = msg.track
-                self.tasks = msg.tasks
-                self.current_task = 0
+                self.client_allocations = msg.client_allocations
+                self.client_execution = client_execution(self.config)
+                if msg.prepare_track:
+                    logger.info("LoadGenerator[%d] is preparing track [%s]." % (self.worker_id, self.track.name))
+                    track.prepare_track(self.track, self.config)
+                self.es = self.create_es_clients()
+                self.pool = self.create_pool()
+                self.current_task_index = 0
                 self.cancel.clear()
                 # we need to wake up more often in test mode
                 if self.config.opts("track", "test.mode.enabled"):
                     self.wakeup_interval = 0.5
                 self.start_timestamp = time.perf_counter()
-                track.load_track_plugins(self.config, runner.register_runner)
+                track.load_track_plugins(self.config, runner.register_runner, scheduler.register_scheduler)
                 self.drive()
             elif isinstance(msg, Drive):
                 logger.debug("LoadGenerator[%d] is continuing its work at task index [%d] on [%f]." %
-                             (self.client_id, self.current_task, msg.client_start_timestamp))
+                             (self.worker_id, self.current_task_index, msg.client_start_timestamp))
                 self.start_driving = True
+                self.skip_tasks = msg.skip_tasks
                 self.wakeupAfter(datetime.timedelta(seconds=time.perf_counter() - msg.client_start_timestamp))
             elif isinstance(msg, thespian.actors.WakeupMessage):
                 # it would be better if we could send ourselves a message at a specific time, simulate this with a boolean...
@@ -407,95 +536,335 @@ class LoadGenerator(actor.RallyActor):
                     self.send_samples()
                     if self.cancel.is_set():
                         self.send(self.master, BenchmarkCancelled())
-                    elif self.executor_future is not None and self.executor_future.done():
-                        e = self.executor_future.exception(timeout=0)
+                    elif self.executor_futures and all(f.done() for f in self.executor_futures):
+                        e = self.step_exception()
                         if e:
-                            self.send(self.master, BenchmarkFailure("Error in load generator [%d]" % self.client_id, e))
+                            self.send(self.master, BenchmarkFailure("Error in load generator [%d]" % self.worker_id, e))
                         else:
-                            self.executor_future = None
+                            self.executor_futures = []
                             self.drive()
                     else:
                         self.wakeupAfter(datetime.timedelta(seconds=self.wakeup_interval))
             elif isinstance(msg, thespian.actors.ActorExitRequest):
-                logger.info("LoadGenerator[%s] is exiting due to ActorExitRequest." % str(self.client_id))
-                if self.executor_future is not None and self.executor_future.running():
+                logger.info("LoadGenerator[%s] is exiting due to ActorExitRequest." % str(self.worker_id))
+                if any(f.running() for f in self.executor_futures):
                     self.cancel.set()
+                if self.pool:
                     self.pool.shutdown()
             else:
-                logger.debug("client [%d] received unknown message [%s] (ignoring)." % (self.client_id, str(msg)))
+                logger.debug("LoadGenerator[%s] received unknown message [%s] (ignoring)." % (str(self.worker_id), str(msg)))
         except Exception as e:
-            logger.exception("Fatal error in load generator [%d]" % self.client_id)
-            self.send(self.master, BenchmarkFailure("Fatal error in load generator [%d]" % self.client_id, e))
+            logger.exception("Fatal error in load generator [%s]" % str(self.worker_id))
+            self.send(self.master, BenchmarkFailure("Fatal error in load generator [%s]" % str(self.worker_id), e))
+
+    @property
+    def client_ids(self):
+        return sorted(self.client_allocations.keys())
+
+    def create_es_clients(self):
+        hosts = self.config.opts("client", "hosts")
+        client_options = self.config.opts("client", "options")
+        if self.client_execution == "thread-pool":
+            # all clients share one client (and thus one connection pool) which needs to be large enough for all of them
+            client_options = dict(client_options)
+            client_options.setdefault("maxsize", len(self.client_allocations))
+            es = client.EsClientFactory(hosts, client_options).create()
+            return {client_id: es for client_id in self.client_ids}
+        else:
+            return {client_id: client.EsClientFactory(hosts, client_options).create() for client_id in self.client_ids}
+
+    def create_pool(self):
+        if self.client_execution == "thread-pool":
+            # the event loop runs in a dedicated thread so this actor can still react to messages
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        else:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=len(self.client_allocations))
+
+    def step_exception(self):
+        for f in self.executor_futures:
+            e = f.exception(timeout=0)
+            if e:
+                return e
+        return None
 
     def drive(self):
         profiling_enabled = self.config.opts("driver", "profiling")
-        task = None
-        # skip non-tasks in the task list
-        while task is None:
-            task = self.tasks[self.current_task]
-            self.current_task += 1
-
-        if isinstance(task, JoinPoint):
-            logger.info("client [%d] reached join point [%s]." % (self.client_id, task))
-            # clients that don't execute tasks don't need to care about waiting
-            if self.executor_future is not None:
-                self.executor_future.result()
+        # Precondition: join points are at the same index for all clients (see Allocator).
+        next_tasks = self.client_allocations[self.client_ids[0]][self.current_task_index]
+        if isinstance(next_tasks, JoinPoint):
+            join_point = next_tasks
+            self.current_task_index += 1
+            logger.info("LoadGenerator[%d] reached join point [%s]." % (self.worker_id, join_point))
+            # load generators that don't execute tasks don't need to care about waiting
+            for f in self.executor_futures:
+                f.result()
             self.send_samples()
             self.cancel.clear()
-            self.executor_future = None
-            self.sampler = None
-            self.send(self.master, JoinPointReached(self.client_id, task))
-        elif isinstance(task, track.Task):
-            logger.info("Client [%d] is executing [%s]." % (self.client_id, task))
-            self.sampler = Sampler(self.client_id, task, self.start_timestamp)
-            schedule = schedule_for(self.track, task, self.client_id)
-            self.executor_future = self.pool.submit(execute_schedule,
-                                                    self.cancel, self.client_id, task.operation, schedule, self.es, self.sampler,
-                                                    profiling_enabled)
-            self.wakeupAfter(datetime.timedelta(seconds=self.wakeup_interval))
+            self.executor_futures = []
+            self.samplers = []
+            self.send(self.master, JoinPointReached(self.worker_id, join_point))
         else:
-            raise exceptions.RallyAssertionError("Unknown task type [%s]" % type(task))
+            tasks_per_client = {}
+            next_join_point_index = self.current_task_index
+            for client_id in self.client_ids:
+                tasks = []
+                idx = self.current_task_index
+                allocations = self.client_allocations[client_id]
+                while not isinstance(allocations[idx], JoinPoint):
+                    # skip non-tasks in the task list
+                    if allocations[idx] is not None:
+                        if not isinstance(allocations[idx], track.Task):
+                            raise exceptions.RallyAssertionError("Unknown task type [%s]" % type(allocations[idx]))
+                        if allocations[idx] not in self.skip_tasks:
+                            tasks.append(allocations[idx])
+                    idx += 1
+                next_join_point_index = idx
+                if tasks:
+                    tasks_per_client[client_id] = tasks
+            self.current_task_index = next_join_point_index
+            if not tasks_per_client:
+                logger.info("LoadGenerator[%d] has no tasks to run until the next join point." % self.worker_id)
+                self.drive()
+                return
+
+            samplers_per_client = {}
+            spill_limit = sampler_spill_limit(self.config)
+            prefetch_size = int(self.config.opts("driver", "bulk.prefetch.size", mandatory=False, default_value=0))
+            spin_threshold = convert.ms_to_seconds(float(self.config.opts("driver", "timer.spin.threshold", mandatory=False,
+                                                                          default_value=convert.seconds_to_ms(DEFAULT_SPIN_THRESHOLD))))
+            for client_id, tasks in tasks_per_client.items():
+                logger.info("Client [%d] is executing [%s]." % (client_id, ", ".join([str(t) for t in tasks])))
+                samplers_per_client[client_id] = [Sampler(client_id, task, self.start_timestamp, spill_limit=spill_limit) for task in tasks]
+                self.samplers.extend(samplers_per_client[client_id])
+
+            if self.client_execution == "thread-pool":
+                from esrally.driver import async_driver
+                request_threads = self.config.opts("driver", "request.threads", mandatory=False, default_value=None)
+                self.executor_futures = [self.pool.submit(async_driver.execute_tasks_of_all_clients, self.cancel, self.track,
+                                                          tasks_per_client, self.es, samplers_per_client, profiling_enabled,
+                                                          prefetch_size, int(request_threads) if request_threads else None)]
+            else:
+                self.executor_futures = [self.pool.submit(execute_tasks, self.cancel, client_id, self.track, tasks, self.es[client_id],
+                                                          samplers_per_client[client_id], profiling_enabled, prefetch_size,
+                                                          spin_threshold)
+                                         for client_id, tasks in tasks_per_client.items()]
+            self.wakeupAfter(datetime.timedelta(seconds=self.wakeup_interval))
 
     def send_samples(self):
-        if self.sampler:
-            samples = self.sampler.samples
-            if len(samples) > 0:
-                self.send(self.master, UpdateSamples(self.client_id, samples))
+        samples = []
+        for sampler in self.samplers:
+            batch = sampler.samples
+            if len(batch) > 0 or batch.dropped > 0 or batch.param_source_waits > 0:
+                samples.append(batch)
+        if len(samples) > 0:
+            self.send(self.master, UpdateSamples(self.worker_id, samples))
 
 
 class Sampler:
     """
     Encapsulates management of gathered samples.
+
+    Samples are written by exactly one client (the producer) and read by the load generator actor (the consumer). They are stored in a
+    preallocated ring buffer which needs no locking as each side only ever modifies its own position. If the consumer cannot keep up
+    and the ring buffer is full, samples are spilled to an overflow queue instead of being dropped. Samples are only dropped (and
+    counted) if the number of spilled samples exceeds ``spill_limit``.
     """
 
-    def __init__(self, client_id, task, start_timestamp):
+    def __init__(self, client_id, task, start_timestamp, buffer_size=16384, spill_limit=None):
+        """
+        :param client_id: The id of the client that produces the samples.
+        :param task: The task that the client executes.
+        :param start_timestamp: The start timestamp of the load generator.
+        :param buffer_size: The number of samples in the ring buffer (default: 16384).
+        :param spill_limit: The maximum number of samples in the overflow queue. ``None`` (default) means unbounded.
+        """
         self.client_id = client_id
         self.task = task
         self.start_timestamp = start_timestamp
-        self.q = queue.Queue(maxsize=16384)
+        self.buffer_size = buffer_size
+        self.spill_limit = spill_limit
+        self.buffer = [None] * buffer_size
+        # only modified by the producer
+        self.write_position = 0
+        # only modified by the consumer
+        self.read_position = 0
+        self.overflow = collections.deque()
+        # only modified by the producer
+        self.dropped = 0
+        self.param_source_waits = 0
+        self.param_source_wait_time = 0
+        # only modified by the consumer
+        self.reported_dropped = 0
+        self.reported_param_source_waits = 0
+        self.reported_param_source_wait_time = 0
+
+    def add_param_source_wait(self, wait_time):
+        """
+        Records that the client had to wait for its parameter source.
 
-    def add(self, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, percent_completed):
-        try:
-            self.q.put_nowait(Sample(self.client_id, time.time(), time.perf_counter() - self.start_timestamp, self.task,
-                                     sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period,
-                                     percent_completed))
-        except queue.Full:
-            logger.warning("Dropping sample for [%s] due to a full sampling queue." % self.task.operation.name)
+        :param wait_time: The waiting time in seconds.
+        """
+        self.param_source_wait_time += wait_time
+        self.param_source_waits += 1
+
+    def add(self, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, percent_completed,
+            schedule_lag_ms=None):
+        # only store a plain tuple here; we convert to the compact representation when samples are retrieved
+        sample = (time.time(), time.perf_counter() - self.start_timestamp, sample_type, request_meta_data, latency_ms,
+                  service_time_ms, total_ops, total_ops_unit, time_period, percent_completed, schedule_lag_ms)
+        # once we have started spilling we need to continue until the consumer has caught up to preserve the order of samples
+        if len(self.overflow) > 0 or self.write_position - self.read_position >= self.buffer_size:
+            if self.spill_limit is not None and len(self.overflow) >= self.spill_limit:
+                self.dropped += 1
+                logger.warning("Dropping sample for [%s] due to a full sampling buffer." % self.task.operation.name)
+            else:
+                self.overflow.append(sample)
+        else:
+            self.buffer[self.write_position % self.buffer_size] = sample
+            # publish the sample only after it has been written
+            self.write_position += 1
 
     @property
     def samples(self):
-        samples = []
+        """
+        :return: A ``SampleBatch`` with all samples that have been gathered since the last invocation.
+        """
+        batch = SampleBatch(self.client_id, self.task)
+        write_position = self.write_position
+        for position in range(self.read_position, write_position):
+            idx = position % self.buffer_size
+            batch.add(*self.buffer[idx])
+            self.buffer[idx] = None
+        self.read_position = write_position
+        # spilled samples are always newer than the ones in the ring buffer
         try:
             while True:
-                samples.append(self.q.get_nowait())
-        except queue.Empty:
+                batch.add(*self.overflow.popleft())
+        except IndexError:
             pass
-        return samples
+        dropped = self.dropped
+        batch.dropped = dropped - self.reported_dropped
+        self.reported_dropped = dropped
+        # read the time first as the producer updates it first
+        param_source_wait_time = self.param_source_wait_time
+        param_source_waits = self.param_source_waits
+        batch.param_source_waits = param_source_waits - self.reported_param_source_waits
+        batch.param_source_wait_time = param_source_wait_time - self.reported_param_source_wait_time
+        self.reported_param_source_waits = param_source_waits
+        self.reported_param_source_wait_time = param_source_wait_time
+        return batch
+
+
+class SampleBatch:
+    """
+    A compact, columnar representation of samples of one client for one task. It is used to transport samples from load generators to
+    the master driver.
+
+    Numeric values are stored in typed arrays, the task is only referenced once per batch and units and request meta data are interned
+    so pickling a batch is much cheaper than pickling individual ``Sample`` objects. Iterating over a batch yields ``Sample`` objects.
+    """
+
+    def __init__(self, client_id, task):
+        self.client_id = client_id
+        self.task = task
+        # number of samples that the sampler had to drop
+        self.dropped = 0
+        # how often and how long (in seconds) the client had to wait for its parameter source
+        self.param_source_waits = 0
+        self.param_source_wait_time = 0
+        self.absolute_times = array.array("d")
+        self.relative_times = array.array("d")
+        self.sample_types = array.array("b")
+        self.latencies = array.array("d")
+        self.service_times = array.array("d")
+        # NaN if the request was not throughput-throttled
+        self.schedule_lags = array.array("d")
+        self.total_ops = array.array("d")
+        self.time_periods = array.array("d")
+        self.percent_completed = array.array("d")
+        self.units = []
+        self.unit_indices = array.array("H")
+        self.meta_data = []
+        self.meta_data_indices = array.array("L")
+        # lookup tables for interning; they are only needed while adding samples
+        self._unit_lookup = {}
+        self._meta_data_lookup = {}
+
+    def add(self, absolute_time, relative_time, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit,
+            time_period, percent_completed, schedule_lag_ms=None):
+        self.absolute_times.append(absolute_time)
+        self.relative_times.append(relative_time)
+        self.sample_types.append(sample_type)
+        self.latencies.append(latency_ms)
+        self.service_times.append(service_time_ms)
+        self.schedule_lags.append(schedule_lag_ms if schedule_lag_ms is not None else NAN)
+        self.total_ops.append(total_ops)
+        self.time_periods.append(time_period)
+        self.percent_completed.append(percent_completed)
+        self.unit_indices.append(self._intern(self.units, self._unit_lookup, total_ops_unit, total_ops_unit))
+        self.meta_data_indices.append(self._intern(self.meta_data, self._meta_data_lookup, self._meta_data_key(request_meta_data),
+                                                   request_meta_data))
+
+    @staticmethod
+    def _meta_data_key(request_meta_data):
+        if request_meta_data is None:
+            return None
+        try:
+            key = tuple(sorted(request_meta_data.items()))
+            hash(key)
+            return key
+        except TypeError:
+            # contains unhashable values (e.g. nested dicts) so we can only intern identical objects. This is safe as the batch
+            # keeps a reference to the object.
+            return id(request_meta_data)
+
+    @staticmethod
+    def _intern(values, lookup, key, value):
+        idx = lookup.get(key)
+        if idx is None:
+            idx = len(values)
+            values.append(value)
+            lookup[key] = idx
+        return idx
+
+    def shift_absolute_time(self, offset):
+        for idx in range(len(self.absolute_times)):
+            self.absolute_times[idx] += offset
+
+    def sample(self, idx):
+        total_ops = self.total_ops[idx]
+        schedule_lag = self.schedule_lags[idx]
+        return Sample(self.client_id, self.absolute_times[idx], self.relative_times[idx], self.task,
+                      metrics.SampleType(self.sample_types[idx]), self.meta_data[self.meta_data_indices[idx]], self.latencies[idx],
+                      self.service_times[idx], int(total_ops) if total_ops.is_integer() else total_ops,
+                      self.units[self.unit_indices[idx]], self.time_periods[idx], self.percent_completed[idx],
+                      None if math.isnan(schedule_lag) else schedule_lag)
+
+    def last(self):
+        return self.sample(len(self) - 1)
+
+    def __len__(self):
+        return len(self.absolute_times)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.sample(idx)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_unit_lookup"]
+        del state["_meta_data_lookup"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._unit_lookup = {}
+        self._meta_data_lookup = {}
 
 
 class Sample:
     def __init__(self, client_id, absolute_time, relative_time, task, sample_type, request_meta_data, latency_ms, service_time_ms,
-                 total_ops, total_ops_unit, time_period, percent_completed):
+                 total_ops, total_ops_unit, time_period, percent_completed, schedule_lag_ms=None):
         self.client_id = client_id
         self.absolute_time = absolute_time
         self.relative_time = relative_time
@@ -508,6 +877,8 @@ class Sample:
         self.total_ops_unit = total_ops_unit
         self.time_period = time_period
         self.percent_completed = percent_completed
+        # difference between the actual and the intended start of the request; None if the request was not throughput-throttled
+        self.schedule_lag_ms = schedule_lag_ms
 
     @property
     def operation(self):
@@ -540,7 +911,9 @@ def setup_template(es, template, source=io.FileSource):
     es.indices.put_template(name=template.name, body=template_content)
 
 
-def setup_index(es, index, index_settings, source=io.FileSource):
+def setup_index(es, index, index_settings, source=io.FileSource, codec=None):
+    # mapping files are decoded with the client's JSON codec
+    codec = codec if codec else jsoncodec.codec()
     if index.auto_managed:
         if es.indices.exists(index=index.name):
             logger.warning("Index [%s] already exists. Deleting it." % index.name)
@@ -553,7 +926,7 @@ def setup_index(es, index, index_settings, source=io.FileSource):
             logger.info("create mapping for type [%s] in index [%s] with content:\n%s" % (type.name, index.name, mappings))
             es.indices.put_mapping(index=index.name,
                                    doc_type=type.name,
-                                   body=json.loads(mappings))
+                                   body=codec.loads(mappings))
     else:
         logger.info("Skipping index [%s] as it is managed by the user." % index.name)
 
@@ -655,62 +1028,272 @@ def calculate_global_throughput(samples, bucket_interval_secs=1):
     :param bucket_interval_secs: The bucket interval for aggregations.
     :return: A global view of throughput samples.
     """
-    samples_per_task = {}
-    # first we group all warmup / measurement samples by operation.
-    for sample in samples:
-        k = sample.task
-        if k not in samples_per_task:
-            samples_per_task[k] = []
-        samples_per_task[k].append(sample)
-
-    global_throughput = {}
-    # with open("raw_samples.csv", "w") as sample_log:
-    #    print("client_id,absolute_time,relative_time,operation,sample_type,total_ops,time_period", file=sample_log)
-    for k, v in samples_per_task.items():
-        task = k
-        if task not in global_throughput:
+    calculator = ThroughputCalculator(bucket_interval_secs)
+    global_throughput = calculator.calculate(samples)
+    for task, throughput in calculator.finish().items():
+        global_throughput.setdefault(task, []).extend(throughput)
+    return global_throughput
+
+
+class ThroughputCalculator:
+    """
+    Calculates global throughput incrementally based on samples gathered from multiple load generators. It only keeps a constant amount
+    of state per task so samples can be discarded after they have been processed.
+    """
+
+    class TaskStats:
+        def __init__(self, sample_type, start_time):
+            self.total_count = 0
+            self.interval = 0
+            self.current_bucket = 0
+            self.sample_type = sample_type
+            self.sample_count_for_current_sample_type = 0
+            self.start_time = start_time
+            self.last_sample = None
+
+    def __init__(self, bucket_interval_secs=1):
+        """
+        :param bucket_interval_secs: The bucket interval for aggregations.
+        """
+        self.bucket_interval_secs = bucket_interval_secs
+        self.task_stats = {}
+
+    def calculate(self, samples):
+        """
+        Folds the provided samples into the current state.
+
+        Note that samples of one invocation are sorted by time but samples are expected to arrive roughly in order across invocations.
+        Late samples are still counted but they do not generate a throughput sample for an earlier bucket.
+
+        :param samples: A list of samples that have been received since the last invocation.
+        :return: A dict with the task as key and a list of throughput samples for this task that could be calculated so far as value.
+        """
+        samples_per_task = {}
+        # first we group all warmup / measurement samples by operation.
+        for sample in samples:
+            k = sample.task
+            if k not in samples_per_task:
+                samples_per_task[k] = []
+            samples_per_task[k].append(sample)
+
+        global_throughput = {}
+        for task, v in samples_per_task.items():
             global_throughput[task] = []
-        # sort all samples by time
-        current_samples = sorted(v, key=lambda s: s.absolute_time)
-
-        total_count = 0
-        interval = 0
-        current_bucket = 0
-        current_sample_type = current_samples[0].sample_type
-        sample_count_for_current_sample_type = 0
-        start_time = current_samples[0].absolute_time - current_samples[0].time_period
-        for sample in current_samples:
-            # print("%d,%f,%f,%s,%s,%d,%f" %
-            # (sample.client_id, sample.absolute_time, sample.relative_time, sample.operation, sample.sample_type,
-            #  sample.total_ops, sample.time_period), file=sample_log)
-
-            # once we have seen a new sample type, we stick to it.
-            if current_sample_type < sample.sample_type:
-                current_sample_type = sample.sample_type
-                sample_count_for_current_sample_type = 0
-
-            total_count += sample.total_ops
-            interval = max(sample.absolute_time - start_time, interval)
-
-            # avoid division by zero
-            if interval > 0 and interval >= current_bucket:
-                sample_count_for_current_sample_type += 1
-                current_bucket = int(interval) + bucket_interval_secs
-                throughput = (total_count / interval)
-                # we calculate throughput per second
-                global_throughput[task].append(
-                    (sample.absolute_time, sample.relative_time, current_sample_type, throughput, "%s/s" % sample.total_ops_unit))
-        # also include the last sample if we don't have one for the current sample type, even if it is below the bucket interval
-        # (mainly needed to ensure we show throughput data in test mode)
-        if interval > 0 and sample_count_for_current_sample_type == 0:
-            throughput = (total_count / interval)
-            global_throughput[task].append(
-                (sample.absolute_time, sample.relative_time, current_sample_type, throughput, "%s/s" % sample.total_ops_unit))
+            # sort all samples by time
+            current_samples = sorted(v, key=lambda s: s.absolute_time)
+            if task not in self.task_stats:
+                first_sample = current_samples[0]
+                self.task_stats[task] = ThroughputCalculator.TaskStats(first_sample.sample_type,
+                                                                       first_sample.absolute_time - first_sample.time_period)
+            stats = self.task_stats[task]
+            for sample in current_samples:
+                # once we have seen a new sample type, we stick to it.
+                if stats.sample_type < sample.sample_type:
+                    stats.sample_type = sample.sample_type
+                    stats.sample_count_for_current_sample_type = 0
+
+                stats.total_count += sample.total_ops
+                stats.interval = max(sample.absolute_time - stats.start_time, stats.interval)
+                stats.last_sample = sample
+
+                # avoid division by zero
+                if stats.interval > 0 and stats.interval >= stats.current_bucket:
+                    stats.sample_count_for_current_sample_type += 1
+                    stats.current_bucket = int(stats.interval) + self.bucket_interval_secs
+                    throughput = (stats.total_count / stats.interval)
+                    # we calculate throughput per second
+                    global_throughput[task].append(
+                        (sample.absolute_time, sample.relative_time, stats.sample_type, throughput, "%s/s" % sample.total_ops_unit))
+        return global_throughput
+
+    def finish(self):
+        """
+        Needs to be called after all samples have been processed.
+
+        :return: A dict with the task as key and a list of remaining throughput samples for this task as value.
+        """
+        global_throughput = {}
+        for task, stats in self.task_stats.items():
+            # also include the last sample if we don't have one for the current sample type, even if it is below the bucket interval
+            # (mainly needed to ensure we show throughput data in test mode)
+            if stats.interval > 0 and stats.sample_count_for_current_sample_type == 0:
+                sample = stats.last_sample
+                throughput = (stats.total_count / stats.interval)
+                global_throughput[task] = [
+                    (sample.absolute_time, sample.relative_time, stats.sample_type, throughput, "%s/s" % sample.total_ops_unit)]
+        return global_throughput
+
+
+class RequestMetricsAggregator:
+    """
+    Folds the request metrics of individual samples (latency, service time, schedule lag and the took time of multi-search queries) into
+    one histogram per task, sample type and metric. Its memory consumption depends on the number of distinct values (with a bounded
+    precision) but not on the number of samples.
+    """
+
+    class TaskMetrics:
+        def __init__(self):
+            # metric name -> histogram
+            self.histograms = {}
+            self.errors = 0
+            # timestamps of the most recent sample
+            self.absolute_time = None
+            self.relative_time = None
+
+        def record(self, name, value):
+            h = self.histograms.get(name)
+            if h is None:
+                h = histogram.HdrHistogram()
+                self.histograms[name] = h
+            h.record_value(max(value, 0))
+
+    def __init__(self):
+        # (task, sample type) -> TaskMetrics
+        self.task_metrics = {}
+
+    def add(self, samples):
+        """
+        Folds the provided samples into the current state.
+
+        :param samples: An iterable of samples that have been received since the last invocation.
+        """
+        for sample in samples:
+            key = (sample.task, sample.sample_type)
+            task_metrics = self.task_metrics.get(key)
+            if task_metrics is None:
+                task_metrics = RequestMetricsAggregator.TaskMetrics()
+                self.task_metrics[key] = task_metrics
+            if task_metrics.relative_time is None or sample.relative_time > task_metrics.relative_time:
+                task_metrics.absolute_time = sample.absolute_time
+                task_metrics.relative_time = sample.relative_time
+            task_metrics.record("latency", sample.latency_ms)
+            task_metrics.record("service_time", sample.service_time_ms)
+            if sample.schedule_lag_ms is not None:
+                task_metrics.record("schedule_lag", sample.schedule_lag_ms)
+            request_meta_data = sample.request_meta_data
+            if request_meta_data:
+                if request_meta_data.get("success") is False:
+                    task_metrics.errors += 1
+                # multi-search requests report the server-side time of each query
+                for took in request_meta_data.get("query-took") or []:
+                    task_metrics.record("query_took", took)
+
+    def finish(self):
+        """
+        Returns the request metrics of all samples since the last invocation and starts over.
+
+        :return: A dict with a tuple (task, sample type) as key and the aggregated request metrics as value.
+        """
+        task_metrics = self.task_metrics
+        self.task_metrics = {}
+        return task_metrics
 
-    return global_throughput
 
+class ThroughputSearchTracker:
+    """
+    Evaluates the probes of throughput searches. It records latency, errors and the global throughput of the measurement samples of each
+    probe. When a probe has finished, its results are checked against the objectives of its search and all remaining probes of a search
+    are skipped as soon as one probe has violated them.
+    """
+
+    class ProbeStats:
+        def __init__(self):
+            self.latencies = histogram.HdrHistogram()
+            self.errors = 0
+            self.throughput_calculator = ThroughputCalculator()
+            self.throughputs = []
+            self.throughput_unit = None
+
+        def add_throughput(self, samples):
+            for absolute_time, relative_time, sample_type, throughput, throughput_unit in samples:
+                if sample_type == metrics.SampleType.Normal:
+                    self.throughputs.append(throughput)
+                    self.throughput_unit = throughput_unit
+
+    def __init__(self):
+        self.probe_stats = {}
+        # search name -> (target throughput, throughput, throughput unit) of the highest probe that satisfied all objectives
+        self.results = {}
+        # names of all searches that have found their maximum
+        self.ended = set()
+
+    def add(self, batch):
+        """
+        Records a batch of samples. Samples of tasks that are not part of a throughput search are ignored.
+        """
+        task = batch.task
+        if task.throughput_search is None:
+            return
+        stats = self.probe_stats.setdefault(task, ThroughputSearchTracker.ProbeStats())
+        samples = list(batch)
+        for sample in samples:
+            if sample.sample_type == metrics.SampleType.Normal:
+                stats.latencies.record_value(max(sample.latency_ms, 0))
+                if sample.request_meta_data and sample.request_meta_data.get("success") is False:
+                    stats.errors += 1
+        for throughput_samples in stats.throughput_calculator.calculate(samples).values():
+            stats.add_throughput(throughput_samples)
+
+    def finish_probe(self, task):
+        """
+        Evaluates a probe after all of its samples have been added.
 
-def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profiling=False):
+        :param task: A probe task.
+        :return: ``True`` iff the probe has satisfied all objectives of its search.
+        """
+        search = task.throughput_search
+        stats = self.probe_stats.pop(task, None)
+        if search.name in self.ended:
+            return False
+        if stats is None or stats.latencies.total_count == 0:
+            logger.warning("[%s] did not produce any measurement samples. Ending throughput search." % str(task))
+            self.ended.add(search.name)
+            return False
+        for throughput_samples in stats.throughput_calculator.finish().values():
+            stats.add_throughput(throughput_samples)
+        latency = stats.latencies.value_at_percentile(search.latency_percentile)
+        error_rate = stats.errors / stats.latencies.total_count
+        satisfied = latency <= search.max_latency and (search.max_error_rate is None or error_rate <= search.max_error_rate)
+        logger.info("[%s] with a target throughput of [%s] ops/s: %sth percentile latency [%.2f] ms, error rate [%.4f] => %s." %
+                    (search, str(task.target_throughput), str(search.latency_percentile), latency, error_rate,
+                     "sustainable" if satisfied else "not sustainable"))
+        if satisfied:
+            if stats.throughputs:
+                throughput = metrics.InMemoryMetricsStore.percentile_value(sorted(stats.throughputs), 50)
+                self.results[search.name] = (task.target_throughput, throughput, stats.throughput_unit)
+            else:
+                self.results[search.name] = (task.target_throughput, task.target_throughput, "ops/s")
+        else:
+            self.ended.add(search.name)
+        return satisfied
+
+    def skipped(self, task):
+        """
+        :return: ``True`` iff the provided task is a probe of a throughput search that has already ended.
+        """
+        return task.throughput_search is not None and task.throughput_search.name in self.ended
+
+    def result(self, search):
+        """
+        :return: A tuple (target throughput, achieved median throughput, throughput unit) of the highest probe that has satisfied all
+                 objectives of the provided search. If no probe has satisfied them, throughput is zero.
+        """
+        return self.results.get(search.name, (0, 0, "ops/s"))
+
+    @staticmethod
+    def searches(schedule):
+        """
+        :return: A list of all throughput searches in the provided schedule.
+        """
+        searches = []
+        for tasks in schedule:
+            for task in tasks:
+                if task.throughput_search and task.throughput_search not in searches:
+                    searches.append(task.throughput_search)
+        return searches
+
+
+def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profiling=False, spin_threshold=DEFAULT_SPIN_THRESHOLD):
     """
     Executes tasks according to the schedule for a given operation.
 
@@ -721,6 +1304,8 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
     :param es: Elasticsearch client that will be used to execute the operation.
     :param sampler: A container to store raw samples.
     :param enable_profiling: Enables a Python profiler for this execution (default: False).
+    :param spin_threshold: The time in seconds before a scheduled request during which we busy-wait instead of sleeping (see
+                           ``wait_until``).
     """
     if enable_profiling:
         logger.debug("Enabling Python profiler for [%s]" % str(op))
@@ -741,18 +1326,21 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
             absolute_expected_schedule_time = total_start + expected_scheduled_time
             throughput_throttled = expected_scheduled_time > 0
             if throughput_throttled:
-                rest = absolute_expected_schedule_time - time.perf_counter()
-                if rest > 0:
-                    time.sleep(rest)
+                wait_until(absolute_expected_schedule_time, spin_threshold)
             start = time.perf_counter()
             total_ops, total_ops_unit, request_meta_data = execute_single(runner, es, params)
             stop = time.perf_counter()
 
             service_time = stop - start
             # Do not calculate latency separately when we don't throttle throughput. This metric is just confusing then.
-            latency = stop - absolute_expected_schedule_time if throughput_throttled else service_time
+            if throughput_throttled:
+                latency = stop - absolute_expected_schedule_time
+                schedule_lag = convert.seconds_to_ms(start - absolute_expected_schedule_time)
+            else:
+                latency = service_time
+                schedule_lag = None
             sampler.add(sample_type, request_meta_data, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops,
-                        total_ops_unit, (stop - total_start), percent_completed)
+                        total_ops_unit, (stop - total_start), percent_completed, schedule_lag)
     except BaseException:
         logger.exception("Could not execute schedule")
         raise
@@ -770,6 +1358,44 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
             profile_logger.info(profile)
 
 
+def wait_until(deadline, spin_threshold=DEFAULT_SPIN_THRESHOLD):
+    """
+    Waits until ``time.perf_counter()`` has reached ``deadline``. ``time.sleep`` often wakes up too late which is noticeable at high
+    target throughputs. Hence, we only sleep until ``spin_threshold`` seconds before the deadline and busy-wait afterwards.
+
+    :param deadline: The point in time (as returned by ``time.perf_counter()``) until which to wait.
+    :param spin_threshold: The time in seconds before the deadline during which we busy-wait. Zero disables busy-waiting.
+    """
+    rest = deadline - time.perf_counter()
+    if rest > spin_threshold:
+        time.sleep(rest - spin_threshold)
+    while time.perf_counter() < deadline:
+        pass
+
+
+def execute_tasks(cancel, client_id, current_track, tasks, es, samplers, enable_profiling=False, prefetch_size=0,
+                  spin_threshold=DEFAULT_SPIN_THRESHOLD):
+    """
+    Executes all tasks that are assigned to one client between two join points one after another.
+
+    :param cancel: A shared boolean that indicates we need to cancel execution.
+    :param client_id: The id of the client that executes the tasks.
+    :param current_track: The current track.
+    :param tasks: A list of tasks that this client should execute.
+    :param es: Elasticsearch client that will be used to execute the tasks.
+    :param samplers: A list of samplers, one for each task.
+    :param enable_profiling: Enables a Python profiler for this execution (default: False).
+    :param prefetch_size: The number of parameters to prepare ahead of time for bulk-indexing operations (default: 0, i.e. disabled).
+    :param spin_threshold: The time in seconds before a scheduled request during which clients busy-wait instead of sleeping.
+    """
+    for task, sampler in zip(tasks, samplers):
+        if cancel.is_set():
+            logger.info("User cancelled execution.")
+            break
+        schedule = schedule_for(current_track, task, client_id, sampler, prefetch_size)
+        execute_schedule(cancel, client_id, task.operation, schedule, es, sampler, enable_profiling, spin_threshold)
+
+
 def execute_single(runner, es, params):
     """
     Invokes the given runner once and provides the runner's return value in a uniform structure.
@@ -811,6 +1437,113 @@ def execute_single(runner, es, params):
     return total_ops, total_ops_unit, request_meta_data
 
 
+def client_execution(config):
+    """
+    :param config: The current config object.
+    :return: The execution engine for clients within a load generator. Either "threads" (default) or "thread-pool".
+    """
+    return config.opts("driver", "client.execution", mandatory=False, default_value="threads")
+
+
+def sampler_spill_limit(config):
+    """
+    :param config: The current config object.
+    :return: The maximum number of samples that a sampler spills before it drops samples or ``None`` (default) if it never drops samples.
+    """
+    # by default samplers never drop samples but users may want to bound memory usage
+    spill_limit = config.opts("driver", "sampler.spill.limit", mandatory=False, default_value=None)
+    if spill_limit is None:
+        return None
+    # may be a string if it is defined in the config file
+    spill_limit = int(spill_limit)
+    if spill_limit < 0:
+        raise exceptions.SystemSetupError("The sampler spill limit must not be negative but was [%d]." % spill_limit)
+    return spill_limit
+
+
+def load_driver_hosts(config):
+    """
+    :param config: The current config object.
+    :return: A list of IP addresses of all machines on which load generators should run (default: only the coordinator machine).
+    """
+    return config.opts("driver", "load_driver_hosts", mandatory=False, default_value=["localhost"])
+
+
+def is_local(host):
+    # the coordinator's actor system is registered with the IP "127.0.0.1" so we treat "localhost" the same (see also the mechanic)
+    return host == "localhost" or host == "127.0.0.1"
+
+
+def machine_key(host):
+    """
+    :param host: A host name or IP address of a load driver host.
+    :return: A key that is the same for all names and addresses that resolve to the same machine (as far as we can tell), i.e. the
+             coordinator's addresses are all mapped to "127.0.0.1" and other host names to their IP address.
+    """
+    if is_local(host):
+        return "127.0.0.1"
+    try:
+        address = socket.gethostbyname(host)
+    except OSError:
+        logger.warning("Could not resolve load driver host [%s]." % host)
+        return host
+    if address.startswith("127.") or address in local_addresses():
+        return "127.0.0.1"
+    return address
+
+
+def local_addresses():
+    """
+    :return: A list of the IP addresses of the coordinator's host name (may be empty if it cannot be resolved).
+    """
+    try:
+        return socket.gethostbyname_ex(socket.gethostname())[2]
+    except OSError:
+        return []
+
+
+def number_of_workers(config, clients, hosts=1):
+    """
+    Determines how many load generators (worker actors) are needed to run the given number of clients.
+
+    :param config: The current config object.
+    :param clients: The total number of clients.
+    :param hosts: The number of load driver hosts (default: 1).
+    :return: The number of load generators to start.
+    """
+    if config.opts("driver", "worker.pool", mandatory=False, default_value=False):
+        # spread clients across a fixed number of processes so CPU-heavy work in the driver can use all cores
+        pool_size = config.opts("driver", "worker.pool.size", mandatory=False, default_value=None)
+        if pool_size is None:
+            pool_size = sysstats.logical_cpu_cores()
+        if pool_size < 1:
+            raise exceptions.SystemSetupError("The worker pool size must be at least one but is [%d]." % pool_size)
+        return min(pool_size * hosts, clients)
+    elif client_execution(config) == "thread-pool":
+        # one event loop per host is capable of handling all clients
+        return min(hosts, clients)
+    else:
+        # each client gets its own load generator
+        return clients
+
+
+def allocations_per_worker(allocations, workers):
+    """
+    Distributes clients round-robin to the given number of load generators.
+
+    :param allocations: The allocation matrix as calculated by the ``Allocator``.
+    :param workers: The number of load generators. Must be greater than zero.
+    :return: A list with one entry per load generator. Each entry is a dict that maps a client id to its allocations.
+    """
+    if workers < 1:
+        raise exceptions.RallyAssertionError("At least one load generator is required but got [%d]." % workers)
+    workers = min(workers, len(allocations))
+    worker_allocations = [{} for _ in range(workers)]
+    for client_id, client_allocations in enumerate(allocations):
+        worker_allocations[client_id % workers][client_id] = client_allocations
+    return worker_allocations
+
+
 class JoinPoint:
     def __init__(self, id):
         self.id = id
@@ -937,79 +1670,126 @@ class Allocator:
 
 # Runs a concrete schedule on one worker client
 # Needs to determine the runners and concrete iterations per client.
-def schedule_for(current_track, task, client_index):
+def schedule_for(current_track, task, client_index, sampler=None, prefetch_size=0):
     """
     Calculates a client's schedule for a given task.
 
     :param current_track: The current track.
     :param task: The task that should be executed.
     :param client_index: The current client index.  Must be in the range [0, `task.clients').
+    :param sampler: The sampler for this task. Optional.
+    :param prefetch_size: The number of parameters that should be prepared ahead of time in a background thread for bulk-indexing
+                          operations. Zero (default) disables prefetching.
     :return: A generator for the operations the given client needs to perform for this task.
     """
     op = task.operation
     num_clients = task.clients
-    target_throughput = task.target_throughput / num_clients if task.target_throughput else None
-    runner_for_op = runner.runner_for(op.type)
+    sched = scheduler.scheduler_for(task.schedule, scheduler_params(task, client_index))
+    # runners may hold state (e.g. a scroll id) so each client needs its own instance when several clients share one process
+    runner_for_op = copy.copy(runner.runner_for(op.type))
     params_for_op = track.operation_parameters(current_track, op).partition(client_index, num_clients)
+    if prefetch_size > 0 and op.type == track.OperationType.Index.name:
+        logger.info("Prefetching up to [%d] parameters for [%s]." % (prefetch_size, op))
+        params_for_op = track.PrefetchingParamSource(params_for_op, prefetch_size,
+                                                     on_wait=sampler.add_param_source_wait if sampler else None)
 
     if task.warmup_time_period is not None or task.time_period is not None:
         warmup_time_period = task.warmup_time_period if task.warmup_time_period else 0
         logger.info("Creating time-period based schedule for [%s] with a warmup period of [%s] seconds and a time period of [%s] seconds."
                     % (op, str(warmup_time_period), str(task.time_period)))
-        return time_period_based(target_throughput, warmup_time_period, task.time_period, runner_for_op, params_for_op)
+        schedule = time_period_based(sched, warmup_time_period, task.time_period, runner_for_op, params_for_op)
     else:
         logger.info("Creating iteration-count based schedule for [%s] with [%d] warmup iterations and [%d] iterations." %
                     (op, task.warmup_iterations, task.iterations))
-        return iteration_count_based(target_throughput, task.warmup_iterations // num_clients, task.iterations // num_clients,
-                                     runner_for_op, params_for_op)
+        schedule = iteration_count_based(sched, task.warmup_iterations // num_clients, task.iterations // num_clients,
+                                         runner_for_op, params_for_op)
+    if isinstance(params_for_op, track.PrefetchingParamSource):
+        return closing_schedule(schedule, params_for_op)
+    return schedule
 
 
-def time_period_based(target_throughput, warmup_time_period, time_period, runner, params):
+def scheduler_params(task, client_index):
+    """
+    :return: The parameters for the scheduler of the given task and client (see ``scheduler.scheduler_for``).
+    """
+    params = dict(task.schedule_params)
+    if task.time_period is not None:
+        duration = (task.warmup_time_period if task.warmup_time_period else 0) + task.time_period
+    else:
+        duration = None
+    params.update({
+        "target-throughput": task.target_throughput,
+        "clients": task.clients,
+        "client-index": client_index,
+        "duration": duration
+    })
+    return params
+
+
+def closing_schedule(schedule, param_source):
+    """
+    Delegates to the provided schedule and closes the parameter source when the schedule is exhausted or not needed anymore.
+    """
+    try:
+        yield from schedule
+    finally:
+        param_source.close()
+
+
+def time_period_based(sched, warmup_time_period, time_period, runner, params):
     """
     Calculates the necessary schedule for time period based operations.
 
-    :param target_throughput: The desired target throughput in operations / second or None if throughput should not be limited.
+    :param sched: The scheduler for this client or None if throughput should not be limited.
     :param warmup_time_period: The time period in seconds that is considered for warmup. Must not be None; provide zero instead.
     :param time_period: The time period in seconds that is considered for measurement. May be None.
     :param runner: The runner for a given operation.
     :param params: The parameter source for a given operation.
     :return: A generator for the corresponding parameters.
     """
-    wait_time = 1 / target_throughput if target_throughput else 0
+    next_scheduled = sched.next(None) if sched else 0
     start = time.perf_counter()
     if time_period is None:
         iterations = params.size()
         for it in range(0, iterations):
+            if next_scheduled is None:
+                break
             sample_type = metrics.SampleType.Warmup if time.perf_counter() - start < warmup_time_period else metrics.SampleType.Normal
             percent_completed = (it + 1) / iterations
-            yield (wait_time * it, sample_type, percent_completed, runner, params.params())
+            yield (next_scheduled, sample_type, percent_completed, runner, params.params())
+            if sched:
+                next_scheduled = sched.next(next_scheduled)
     else:
         end = start + warmup_time_period + time_period
-        it = 0
-        while time.perf_counter() < end:
+        while next_scheduled is not None and time.perf_counter() < end:
             now = time.perf_counter()
             sample_type = metrics.SampleType.Warmup if now - start < warmup_time_period else metrics.SampleType.Normal
             percent_completed = (now - start) / (warmup_time_period + time_period)
-            yield (wait_time * it, sample_type, percent_completed, runner, params.params())
-            it += 1
+            yield (next_scheduled, sample_type, percent_completed, runner, params.params())
+            if sched:
+                next_scheduled = sched.next(next_scheduled)
 
 
-def iteration_count_based(target_throughput, warmup_iterations, iterations, runner, params):
+def iteration_count_based(sched, warmup_iterations, iterations, runner, params):
     """
     Calculates the necessary schedule based on a given number of iterations.
 
-    :param target_throughput: The desired target throughput in operations / second or None if throughput should not be limited.
+    :param sched: The scheduler for this client or None if throughput should not be limited.
     :param warmup_iterations: The number of warmup iterations to run. 0 if no warmup should be performed.
     :param iterations: The number of measurement iterations to run.
     :param runner: The runner for a given operation.
     :param params: The parameter source for a given operation.
     :return: A generator for the corresponding parameters.
     """
-    wait_time = 1 / target_throughput if target_throughput else 0
     total_iterations = warmup_iterations + iterations
     if total_iterations == 0:
         raise exceptions.RallyAssertionError("Operation must run at least for one iteration.")
+    next_scheduled = sched.next(None) if sched else 0
     for it in range(0, total_iterations):
+        if next_scheduled is None:
+            break
         sample_type = metrics.SampleType.Warmup if it < warmup_iterations else metrics.SampleType.Normal
         percent_completed = (it + 1) / total_iterations
-        yield (wait_time * it, sample_type, percent_completed, runner, params.params())
+        yield (next_scheduled, sample_type, percent_completed, runner, params.params())
+        if sched:
+            next_scheduled = sched.next(next_scheduled)
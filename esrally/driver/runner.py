@@ -1,8 +1,10 @@
+import re
 import types
 import logging
 from collections import Counter, OrderedDict
 
 from esrally import exceptions, track
+from esrally.utils import compression, convert, jsoncodec
 
 logger = logging.getLogger("rally.driver")
 
@@ -80,7 +82,10 @@ class BulkIndex(Runner):
 
         It expects a parameter dict with the following mandatory keys:
 
-        * ``body``: containing all documents for the current bulk request.
+        * ``body``: containing all documents for the current bulk request. Either a list of lines or a ``bytes`` (or ``memoryview``) object
+        that is already in the format of the bulk API (i.e. newline-delimited and terminated). The latter is sent as is, bypassing the
+        client's serialization and request logging (see ``client.RawTransport``). This requires a client created by
+        ``client.EsClientFactory``.
         * ``action_metadata_present``: if ``True``, assume that an action and metadata line is present (meaning only half of the lines
         contain actual documents to index)
         * ``index``: The name of the affected index in case ``action_metadata_present`` is ``False``.
@@ -88,6 +93,8 @@ class BulkIndex(Runner):
 
         The following keys are optional:
 
+        * ``bulk-size``: The number of documents in ``body``. Rally's own parameter source always provides it. Otherwise, it is derived from
+        the number of lines in ``body`` which requires scanning raw bodies in the timed section.
         * ``pipeline``: If present, runs the the specified ingest pipeline for this bulk.
         * ``detailed-results``: If ``True``, the runner will analyze the response and add detailed meta-data. Defaults to ``False``. Note
         that this has a very significant impact on performance and will very likely cause a bottleneck in the benchmark driver so please
@@ -96,6 +103,12 @@ class BulkIndex(Runner):
          is enabled; numbers based on a bulk size of 500 elements and no errors). For details please refer to the respective benchmarks
          in ``benchmarks/driver``.
 
+        Raw bodies are compressed before they are sent if compression is enabled in the client options unless they have already been
+        compressed by the parameter source (see ``body-compression``). Compression happens in the timed section in the former case.
+
+        For raw (``bytes``) bodies the response is parsed lazily (see ``LazyBulkResponse``): If ``detailed-results`` is ``False`` and the
+        response indicates that there are no errors, the individual items are not decoded at all. Otherwise, they are decoded one by one.
+
 
         Returned meta data
         `
@@ -117,6 +130,12 @@ class BulkIndex(Runner):
           distribution applies and ``shards`` contains another hash with the actual distribution of ``total``, ``successful`` and ``failed``
           shards (see examples below).
 
+        If the body has been compressed (see above) the following meta data are returned in addition:
+
+        * ``uncompressed-bytes``: The size of the uncompressed body in bytes.
+        * ``compressed-bytes``: The size of the compressed body in bytes.
+        * ``compression-time``: The time in milliseconds that it took to compress the body.
+
 
         Here are a few examples:
 
@@ -221,14 +240,43 @@ class BulkIndex(Runner):
             bulk_params["pipeline"] = params["pipeline"]
 
         with_action_metadata = params["action_metadata_present"]
-
-        if with_action_metadata:
-            # only half of the lines are documents
-            bulk_size = len(params["body"]) // 2
-            response = es.bulk(body=params["body"], params=bulk_params)
+        body = params["body"]
+
+        bulk_size = params.get("bulk-size")
+        compression_stats = None
+        if isinstance(body, (bytes, memoryview)):
+            transport = es.raw_transport
+            body = transport.prepare_body(body)
+            if isinstance(body, compression.CompressedBody):
+                compression_stats = {
+                    "uncompressed-bytes": body.uncompressed_size,
+                    "compressed-bytes": len(body),
+                    "compression-time": convert.seconds_to_ms(body.compression_time)
+                }
+            if bulk_size is None:
+                if isinstance(body, compression.CompressedBody):
+                    lines = body.line_count
+                else:
+                    # memoryview does not support count()
+                    lines = (body if isinstance(body, bytes) else body.tobytes()).count(b"\n")
+                # only half of the lines are documents
+                bulk_size = lines // 2 if with_action_metadata else lines
+            if with_action_metadata:
+                path = "/_bulk"
+            else:
+                path = "/%s/%s/_bulk" % (params["index"], params["type"])
+            # the body is already in its final format so we send it as is
+            status, raw_response = transport.perform_request("POST", path, params=bulk_params, body=body)
+            response = LazyBulkResponse(raw_response, transport.codec)
+        elif with_action_metadata:
+            if bulk_size is None:
+                # only half of the lines are documents
+                bulk_size = len(body) // 2
+            response = es.bulk(body=body, params=bulk_params)
         else:
-            bulk_size = len(params["body"])
-            response = es.bulk(body=params["body"], index=params["index"], doc_type=params["type"], params=bulk_params)
+            if bulk_size is None:
+                bulk_size = len(body)
+            response = es.bulk(body=body, index=params["index"], doc_type=params["type"], params=bulk_params)
 
         stats = self.detailed_stats(bulk_size, response) if detailed_results else self.simple_stats(bulk_size, response)
 
@@ -238,6 +286,8 @@ class BulkIndex(Runner):
             "bulk-size": bulk_size,
         }
         meta_data.update(stats)
+        if compression_stats:
+            meta_data.update(compression_stats)
         return meta_data
 
     def detailed_stats(self, bulk_size, response):
@@ -287,6 +337,68 @@ class BulkIndex(Runner):
         return "bulk-index"
 
 
+class LazyBulkResponse:
+    """
+    Provides dict-style access to a raw bulk response which is only decoded if needed.
+
+    The ``errors`` flag is read directly from the beginning of the response (Elasticsearch renders it before the items). Items are
+    decoded one at a time while they are iterated and only if any other property is accessed, the complete response is decoded. This
+    avoids creating thousands of dicts for each bulk response if we only need to know that all items have succeeded.
+    """
+    ERRORS_FLAG = re.compile(rb'"errors"\s*:\s*(true|false)')
+    ITEMS_START = re.compile(rb'"items"\s*:')
+    ITEMS_ARRAY_START = re.compile(r'"items"\s*:\s*\[')
+    ITEMS_SEPARATOR = re.compile(r"[\s,]*")
+
+    def __init__(self, raw_response, codec=None):
+        """
+        :param raw_response: The bulk response as returned by Elasticsearch (``bytes``).
+        :param codec: The ``jsoncodec`` codec to decode the response. Optional. Defaults to the standard library codec.
+        """
+        self.raw_response = raw_response
+        self.codec = codec if codec else jsoncodec.codec()
+        self._decoded = None
+
+    def __getitem__(self, key):
+        if key == "errors":
+            return self.errors
+        elif key == "items" and self._decoded is None:
+            return self.iter_items()
+        else:
+            return self.decoded()[key]
+
+    def iter_items(self):
+        """
+        :return: A generator that decodes the items of the bulk response incrementally.
+        """
+        doc = self.raw_response.decode("utf-8")
+        items_start = self.ITEMS_ARRAY_START.search(doc)
+        if not items_start:
+            yield from self.decoded()["items"]
+            return
+        idx = self.ITEMS_SEPARATOR.match(doc, items_start.end()).end()
+        while doc[idx] != "]":
+            item, idx = self.codec.raw_decode(doc, idx)
+            yield item
+            idx = self.ITEMS_SEPARATOR.match(doc, idx).end()
+
+    def decoded(self):
+        if self._decoded is None:
+            self._decoded = self.codec.loads(self.raw_response)
+        return self._decoded
+
+    @property
+    def errors(self):
+        if self._decoded is not None:
+            return self._decoded["errors"]
+        items_start = self.ITEMS_START.search(self.raw_response)
+        # only consider the part before the items so we cannot match the contents of an item
+        m = self.ERRORS_FLAG.search(self.raw_response, 0, items_start.start() if items_start else len(self.raw_response))
+        if m:
+            return m.group(1) == b"true"
+        return self.decoded()["errors"]
+
+
 class ForceMerge(Runner):
     """
     Runs a force merge operation against Elasticsearch.
@@ -407,8 +519,55 @@ class Query(Runner):
         return "query"
 
 
+class MultiSearch(Runner):
+    """
+    Runs several request body searches with one multi search request against Elasticsearch.
+
+    It expects the following key in the `params` hash:
+
+    * `queries`: A list of queries. Each query is a hash with the keys `index`, `type` (may be `None`), `use_request_cache` and `body`
+      (see `Query`).
+
+    Each query counts as one operation. Besides `success`, `success-count` and `error-count` (denoted in queries), the returned meta data
+    contain the server-side time in milliseconds of each successful query as reported in its `took` property (`query-took`).
+    """
+
+    def __call__(self, es, params):
+        queries = params["queries"]
+        body = []
+        for query in queries:
+            header = {"index": query["index"]}
+            if query.get("type"):
+                header["type"] = query["type"]
+            if "use_request_cache" in query:
+                header["request_cache"] = query["use_request_cache"]
+            body.append(header)
+            body.append(query["body"] if query["body"] is not None else {})
+
+        response = es.msearch(body=body)
+        query_took = []
+        error_count = 0
+        for query_response in response["responses"]:
+            if "error" in query_response:
+                error_count += 1
+            else:
+                query_took.append(query_response["took"])
+        return {
+            "weight": len(queries),
+            "unit": "ops",
+            "success": error_count == 0,
+            "success-count": len(queries) - error_count,
+            "error-count": error_count,
+            "query-took": query_took
+        }
+
+    def __repr__(self, *args, **kwargs):
+        return "msearch"
+
+
 register_runner(track.OperationType.Index.name, BulkIndex())
 register_runner(track.OperationType.ForceMerge.name, ForceMerge())
 register_runner(track.OperationType.IndicesStats.name, IndicesStats())
 register_runner(track.OperationType.NodesStats.name, NodeStats())
 register_runner(track.OperationType.Search.name, Query())
+register_runner(track.OperationType.MultiSearch.name, MultiSearch())
@@ -0,0 +1,238 @@
+import bisect
+import logging
+import math
+import random
+
+from esrally import exceptions
+
+logger = logging.getLogger("rally.driver")
+
+__SCHEDULERS = {}
+
+
+def scheduler_for(name, params):
+    """
+    Creates a scheduler which determines when a client should issue its next request.
+
+    :param name: The name of the scheduler. If ``None``, a deterministic scheduler is chosen if a target throughput is defined.
+    :param params: A dict with scheduler parameters. Rally provides at least the task's (total) ``target-throughput`` (may be
+                   ``None``), the number of ``clients`` of the task, the ``client-index`` and the ``duration`` of the task in seconds
+                   (``None`` if the task is not time-period based).
+    :return: A scheduler instance or ``None`` if requests should not be throttled.
+    """
+    if name is None:
+        if not params.get("target-throughput"):
+            return None
+        name = "deterministic"
+    try:
+        scheduler = __SCHEDULERS[name]
+    except KeyError:
+        raise exceptions.InvalidSyntax("Unknown schedule [%s]. Known schedules are [%s]." % (name, ", ".join(sorted(__SCHEDULERS.keys()))))
+    return scheduler(params)
+
+
+def register_scheduler(name, scheduler):
+    """
+    Registers a scheduler class or factory function which is called with a parameter dict (see ``scheduler_for``). Schedulers need to
+    provide a method ``next(current)`` which returns the time in seconds (relative to the start of the task) when the next request
+    should be issued, given the intended time of the current request. ``current`` is ``None`` for the first request. ``next`` returns
+    ``None`` if no more requests should be issued.
+    """
+    logger.info("Registering scheduler [%s]." % name)
+    __SCHEDULERS[name] = scheduler
+
+
+def _target_throughput(name, params):
+    """
+    :return: The target throughput per client.
+    """
+    target_throughput = params.get("target-throughput")
+    if not target_throughput or target_throughput <= 0:
+        raise exceptions.InvalidSyntax("Schedule [%s] requires a positive 'target-throughput'." % name)
+    return target_throughput / params.get("clients", 1)
+
+
+class DeterministicScheduler:
+    """
+    Issues requests at a fixed interval.
+    """
+
+    def __init__(self, params):
+        self.wait_time = 1 / _target_throughput("deterministic", params)
+        self.requests = 0
+
+    def next(self, current):
+        if current is None:
+            return 0
+        self.requests += 1
+        # avoid accumulating rounding errors
+        return self.wait_time * self.requests
+
+
+class PoissonScheduler:
+    """
+    Issues requests according to a Poisson process, i.e. the waiting times between requests are exponentially distributed. On average
+    the target throughput is reached but requests arrive in bursts which is closer to traffic from many independent users.
+
+    The optional parameter ``seed`` makes the arrival times reproducible.
+    """
+
+    def __init__(self, params):
+        self.rate = _target_throughput("poisson", params)
+        seed = params.get("seed")
+        # each client needs a different random sequence
+        self.rand = random.Random(seed + params.get("client-index", 0) if seed is not None else None)
+
+    def next(self, current):
+        if current is None:
+            return 0
+        return current + self.rand.expovariate(self.rate)
+
+
+class ProfileScheduler:
+    """
+    Issues requests according to a throughput profile. The throughput changes linearly between two consecutive points of the profile and
+    stays at the throughput of the last point afterwards. The n-th request (zero-based) is scheduled at the time when the integral of the
+    throughput reaches n, i.e. the first request is always issued immediately.
+    """
+
+    def __init__(self, points):
+        """
+        :param points: A non-empty list of tuples (time in seconds, throughput in operations per second for this client), sorted by time.
+                       The first point needs to be at time zero.
+        """
+        self.times = []
+        self.throughputs = []
+        # number of requests that have been scheduled until the respective point
+        self.counts = []
+        count = 0
+        previous = None
+        for t, throughput in points:
+            if previous is not None:
+                previous_t, previous_throughput = previous
+                count += (t - previous_t) * (previous_throughput + throughput) / 2
+            self.times.append(t)
+            self.throughputs.append(throughput)
+            self.counts.append(count)
+            previous = (t, throughput)
+        self.requests = 0
+
+    def next(self, current):
+        if current is not None:
+            self.requests += 1
+        return self.time_of(self.requests)
+
+    def time_of(self, n):
+        """
+        :param n: The number of requests that have been issued so far.
+        :return: The time when the integral of the throughput profile reaches ``n`` or ``None`` if it never reaches it.
+        """
+        # index of the last point that has been reached when n requests have been issued
+        i = bisect.bisect_right(self.counts, n) - 1
+        remaining = n - self.counts[i]
+        start = self.throughputs[i]
+        if i == len(self.times) - 1:
+            return self.times[i] + remaining / start if start > 0 else None
+        duration = self.times[i + 1] - self.times[i]
+        slope = (self.throughputs[i + 1] - start) / duration
+        if slope == 0:
+            return self.times[i] + remaining / start
+        # solve start * x + slope / 2 * x^2 = remaining
+        return self.times[i] + (math.sqrt(max(start * start + 2 * slope * remaining, 0)) - start) / slope
+
+
+def ramp_scheduler(params):
+    """
+    Increases throughput linearly from ``start-throughput`` (default: 0) to ``target-throughput`` during ``ramp-up-time-period`` seconds.
+    If ``ramp-down-time-period`` is defined, throughput decreases linearly to ``start-throughput`` again at the end of the task which
+    requires a time-period based task.
+    """
+    target_throughput = _target_throughput("ramp", params)
+    clients = params.get("clients", 1)
+    start_throughput = params.get("start-throughput", 0) / clients
+    ramp_up = params.get("ramp-up-time-period")
+    ramp_down = params.get("ramp-down-time-period")
+    if ramp_up is None or ramp_up < 0:
+        raise exceptions.InvalidSyntax("Schedule [ramp] requires a non-negative 'ramp-up-time-period'.")
+    points = [(0, start_throughput), (ramp_up, target_throughput)]
+    if ramp_down:
+        duration = params.get("duration")
+        if duration is None:
+            raise exceptions.InvalidSyntax("Schedule [ramp] supports 'ramp-down-time-period' only for tasks with a 'time-period'.")
+        if ramp_up + ramp_down > duration:
+            raise exceptions.InvalidSyntax("The sum of 'ramp-up-time-period' and 'ramp-down-time-period' must not exceed the task's "
+                                           "duration of [%s] seconds." % str(duration))
+        points.extend([(duration - ramp_down, target_throughput), (duration, start_throughput)])
+    return ProfileScheduler(points)
+
+
+def step_scheduler(params):
+    """
+    Runs a sequence of ``steps`` with a constant throughput each. Each step defines its ``duration`` in seconds and its total
+    ``target-throughput``. After the last step, the throughput of the last step is kept.
+    """
+    steps = params.get("steps")
+    if not steps:
+        raise exceptions.InvalidSyntax("Schedule [step] requires a non-empty list of 'steps'.")
+    clients = params.get("clients", 1)
+    points = []
+    t = 0
+    for step in steps:
+        duration = step.get("duration")
+        throughput = step.get("target-throughput")
+        if duration is None or duration <= 0 or throughput is None or throughput < 0:
+            raise exceptions.InvalidSyntax("Each step needs a positive 'duration' and a non-negative 'target-throughput' but was [%s]."
+                                           % str(step))
+        throughput /= clients
+        points.append((t, throughput))
+        t += duration
+        points.append((t, throughput))
+    return ProfileScheduler(points)
+
+
+class ReplayScheduler:
+    """
+    Replays request times from a file which contains one timestamp in seconds per line (lines starting with ``#`` are ignored). The
+    timestamps are relative to the first one in the file. If the task has multiple clients, each client issues every n-th request so
+    all clients together follow the recorded timeline. No more requests are issued after the last timestamp.
+    """
+
+    def __init__(self, params):
+        file_name = params.get("file")
+        if not file_name:
+            raise exceptions.InvalidSyntax("Schedule [replay] requires a 'file'.")
+        speedup = params.get("speedup", 1)
+        if speedup <= 0:
+            raise exceptions.InvalidSyntax("'speedup' must be positive but was [%s]." % str(speedup))
+        timestamps = ReplayScheduler.read(file_name)
+        clients = params.get("clients", 1)
+        client_index = params.get("client-index", 0)
+        first = timestamps[0] if timestamps else 0
+        self.times = [(t - first) / speedup for t in timestamps[client_index::clients]]
+        self.requests = -1
+
+    @staticmethod
+    def read(file_name):
+        timestamps = []
+        try:
+            with open(file_name, "rt") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        timestamps.append(float(line))
+        except OSError:
+            raise exceptions.SystemSetupError("Cannot read schedule file [%s]." % file_name)
+        except ValueError as e:
+            raise exceptions.DataError("Invalid timestamp in schedule file [%s]: %s" % (file_name, str(e)))
+        return sorted(timestamps)
+
+    def next(self, current):
+        self.requests += 1
+        return self.times[self.requests] if self.requests < len(self.times) else None
+
+
+register_scheduler("deterministic", DeterministicScheduler)
+register_scheduler("poisson", PoissonScheduler)
+register_scheduler("ramp", ramp_scheduler)
+register_scheduler("step", step_scheduler)
+register_scheduler("replay", ReplayScheduler)
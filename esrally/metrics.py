@@ -1,17 +1,19 @@
+import array
 import collections
 import datetime
+import heapq
 import logging
 import math
 import pickle
-import statistics
 import sys
+import threading
 import zlib
 from enum import Enum, IntEnum
 
 import certifi
 import tabulate
 from esrally import time, exceptions, config
-from esrally.utils import console
+from esrally.utils import console, histogram
 
 logger = logging.getLogger("rally.metrics")
 
@@ -172,6 +174,9 @@ class MetricsStore:
     """
     Abstract metrics store
     """
+    # request metrics that are potentially recorded millions of times. The driver stores them as histograms (see
+    # #put_histogram_cluster_level()) and their statistics are answered from these histograms.
+    HISTOGRAM_METRICS = ["latency", "service_time", "schedule_lag", "query_took"]
 
     def __init__(self, cfg, clock=time.Clock, meta_info=None, lap=None):
         """
@@ -270,12 +275,15 @@ class MetricsStore:
         :param key: The key of the meta information.
         :param value: The value of the meta information.
         """
+        # metrics records share the meta info (see #_put()) so we never modify it in place but replace it with an updated copy
         if scope == MetaInfoScope.cluster:
-            self._meta_info[MetaInfoScope.cluster][key] = value
+            cluster_meta_info = self._meta_info[MetaInfoScope.cluster].copy()
+            cluster_meta_info[key] = value
+            self._meta_info[MetaInfoScope.cluster] = cluster_meta_info
         elif scope == MetaInfoScope.node:
-            if scope_key not in self._meta_info[MetaInfoScope.node]:
-                self._meta_info[MetaInfoScope.node][scope_key] = {}
-            self._meta_info[MetaInfoScope.node][scope_key][key] = value
+            node_meta_info = self._meta_info[MetaInfoScope.node].get(scope_key, {}).copy()
+            node_meta_info[key] = value
+            self._meta_info[MetaInfoScope.node][scope_key] = node_meta_info
         else:
             raise exceptions.SystemSetupError("Unknown meta info scope [%s]" % scope)
 
@@ -391,17 +399,42 @@ class MetricsStore:
         self._put(MetaInfoScope.node, node_name, name, value, unit, operation, operation_type, sample_type, absolute_time, relative_time,
                   meta_data)
 
+    def put_histogram_cluster_level(self, name, histogram, unit, operation=None, operation_type=None, sample_type=SampleType.Normal,
+                                    absolute_time=None, relative_time=None, meta_data=None):
+        """
+        Adds a new cluster level metric that aggregates many individual values in a histogram. The metrics record has no value but stores
+        the histogram in the property ``histogram`` instead.
+
+        :param name: The name of the metric.
+        :param histogram: A ``HdrHistogram`` containing all values of this metric.
+        :param unit: The unit of the recorded values (e.g. ms).
+        :param operation The operation name to which these values apply. Optional. Defaults to None.
+        :param operation_type The operation type to which these values apply. Optional. Defaults to None.
+        :param sample_type Whether these are warmup or normal measurement samples. Defaults to SampleType.Normal.
+        :param absolute_time The absolute timestamp in seconds since epoch when this metric record is stored. Defaults to None. The metrics
+               store will derive the timestamp automatically.
+        :param relative_time The relative timestamp in seconds since the start of the benchmark when this metric record is stored.
+               Defaults to None. The metrics store will derive the timestamp automatically.
+        :param meta_data: A dict, containing additional key-value pairs. Defaults to None.
+        """
+        self._put(MetaInfoScope.cluster, None, name, None, unit, operation, operation_type, sample_type, absolute_time, relative_time,
+                  meta_data, histogram=histogram)
+
     def _put(self, level, level_key, name, value, unit, operation, operation_type, sample_type, absolute_time=None, relative_time=None,
-             meta_data=None):
+             meta_data=None, histogram=None):
         if level == MetaInfoScope.cluster:
-            meta = self._meta_info[MetaInfoScope.cluster].copy()
+            # the meta info is never modified in place so records without additional meta data can share it
+            meta = self._meta_info[MetaInfoScope.cluster]
+            if meta_data:
+                meta = meta.copy()
+                meta.update(meta_data)
         elif level == MetaInfoScope.node:
             meta = self._meta_info[MetaInfoScope.cluster].copy()
             meta.update(self._meta_info[MetaInfoScope.node][level_key])
+            if meta_data:
+                meta.update(meta_data)
         else:
             raise exceptions.SystemSetupError("Unknown meta info level [%s] for metric [%s]" % (level, name))
-        if meta_data:
-            meta.update(meta_data)
 
         if absolute_time is None:
             absolute_time = self._clock.now()
@@ -427,6 +460,8 @@ class MetricsStore:
             doc["operation"] = operation
         if operation_type:
             doc["operation-type"] = operation_type
+        if histogram is not None:
+            doc["histogram"] = histogram.to_dict()
 
         assert self.lap is not None, "Attempting to store [%s] without a lap." % doc
         self._add(doc)
@@ -460,6 +495,7 @@ class MetricsStore:
         :param sample_type The sample type to query. Optional. By default, all samples are considered.
         :param lap The lap to query. Optional. By default, all laps are considered.
         :return: The corresponding value for the given metric name or None if there is no value.
+        :raises RallyAssertionError: If the metric has been stored as histograms (see ``get``).
         """
         return self._first_or_none(self.get(name, operation, operation_type, sample_type, lap))
 
@@ -476,8 +512,17 @@ class MetricsStore:
         :param sample_type The sample type to query. Optional. By default, all samples are considered.
         :param lap The lap to query. Optional. By default, all laps are considered.
         :return: A list of all values for the given metric.
+        :raises RallyAssertionError: If the metric has been stored as histograms (e.g. latency or service time). Their individual values
+                                     are not available. Use ``get_stats``, ``get_percentiles`` or ``get_median`` instead.
         """
-        return self._get(name, operation, operation_type, sample_type, lap, lambda doc: doc["value"])
+        return self._raw_values(name, self._get(name, operation, operation_type, sample_type, lap, lambda doc: doc["value"]))
+
+    def _raw_values(self, name, values):
+        # histogram records have no value
+        if name in MetricsStore.HISTOGRAM_METRICS and any(v is None for v in values):
+            raise exceptions.RallyAssertionError("Individual values of [%s] are not available as they are stored as histograms. Use "
+                                                 "statistics, percentiles or the median instead." % name)
+        return values
 
     def get_unit(self, name, operation=None, operation_type=None):
         """
@@ -572,6 +617,141 @@ def index_name(ts):
     return "rally-%04d" % ts.year
 
 
+class BulkFlusher:
+    """
+    Streams metrics documents to the metrics store in the background.
+
+    Documents are buffered and sent in bulk requests as soon as either ``bulk_size`` documents have been buffered or ``flush_interval``
+    seconds have passed. The buffer is bounded: if the metrics store cannot keep up, ``add`` blocks until there is room again
+    (backpressure) so memory usage does not grow with the duration of a benchmark.
+    """
+
+    def __init__(self, client, index, doc_type, bulk_size=5000, flush_interval=5, max_buffer_size=50000, max_retries=3,
+                 retry_backoff=1):
+        """
+        :param client: An ``EsClient``.
+        :param index: The index to write to.
+        :param doc_type: The document type of all documents.
+        :param bulk_size: The maximum number of documents per bulk request.
+        :param flush_interval: The maximum number of seconds that a document stays in the buffer.
+        :param max_buffer_size: The maximum number of buffered documents. Callers of ``add`` block as long as the buffer is full.
+        :param max_retries: The number of times a failed bulk request is retried.
+        :param retry_backoff: The number of seconds to wait before the first retry. The wait time doubles on each subsequent retry.
+        """
+        if bulk_size < 1:
+            raise exceptions.SystemSetupError("Bulk size for the metrics store must be positive but was [%s]." % str(bulk_size))
+        if max_buffer_size < bulk_size:
+            raise exceptions.SystemSetupError("Buffer size for the metrics store [%s] must not be smaller than the bulk size [%s]." %
+                                              (str(max_buffer_size), str(bulk_size)))
+        self.client = client
+        self.index = index
+        self.doc_type = doc_type
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.buffer = collections.deque()
+        # number of documents that have been taken from the buffer but are not yet stored
+        self.in_flight = 0
+        self.failure = None
+        self.stopped = False
+        self.flush_requested = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="metrics-bulk-flusher", daemon=True)
+        self.thread.start()
+
+    def add(self, doc):
+        with self.condition:
+            self._check_failure()
+            while len(self.buffer) >= self.max_buffer_size and not self.failure:
+                self.condition.wait()
+            self._check_failure()
+            self.buffer.append(doc)
+            if len(self.buffer) >= self.bulk_size:
+                self.condition.notify_all()
+
+    def flush(self):
+        """
+        Blocks until all documents that have been added so far are stored in the metrics store.
+        """
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify_all()
+            while (self.buffer or self.in_flight > 0) and not self.failure:
+                self.condition.wait()
+            self.flush_requested = False
+            self._check_failure()
+
+    def close(self):
+        """
+        Flushes all pending documents and stops the background thread.
+        """
+        try:
+            self.flush()
+        finally:
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+            self.thread.join()
+
+    def _check_failure(self):
+        if self.failure:
+            failure = self.failure
+            # report the error only once
+            self.failure = None
+            self.buffer.clear()
+            raise failure
+
+    def _next_batch(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.stopped or self.flush_requested or len(self.buffer) >= self.bulk_size,
+                                    timeout=self.flush_interval)
+            batch = []
+            while self.buffer and len(batch) < self.bulk_size:
+                batch.append(self.buffer.popleft())
+            self.in_flight = len(batch)
+            # there is room in the buffer again
+            self.condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._send(batch)
+                except BaseException as e:
+                    with self.condition:
+                        self.failure = e
+                finally:
+                    with self.condition:
+                        self.in_flight = 0
+                        self.condition.notify_all()
+            else:
+                with self.condition:
+                    if self.stopped:
+                        return
+
+    def _send(self, batch):
+        attempt = 0
+        while True:
+            try:
+                self.client.bulk_index(index=self.index, doc_type=self.doc_type, items=batch)
+                return
+            except exceptions.SystemSetupError:
+                # retrying will not help
+                raise
+            except BaseException:
+                if attempt >= self.max_retries:
+                    raise
+                wait = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning("Could not store [%d] metrics documents. Retrying in [%s] seconds (attempt %d of %d)." %
+                               (len(batch), str(wait), attempt, self.max_retries))
+                time.sleep(wait)
+
+
 class EsMetricsStore(MetricsStore):
     """
     A metrics store backed by Elasticsearch.
@@ -597,10 +777,12 @@ class EsMetricsStore(MetricsStore):
         self._index = None
         self._client = client_factory_class(cfg).create()
         self._index_template_provider = index_template_provider_class(cfg)
-        self._docs = None
+        self._flusher = None
+        self._docs_count = 0
 
     def open(self, invocation=None, track_name=None, challenge_name=None, car_name=None, ctx=None, create=False):
-        self._docs = []
+        self._stop_flusher()
+        self._docs_count = 0
         MetricsStore.open(self, invocation, track_name, challenge_name, car_name, ctx, create)
         self._index = index_name(invocation)
         # reduce a bit of noise in the metrics cluster log
@@ -615,16 +797,44 @@ class EsMetricsStore(MetricsStore):
     def _get_template(self):
         return self._index_template_provider.template()
 
+    def _start_flusher(self):
+        self._flusher = BulkFlusher(self._client, self._index, EsMetricsStore.METRICS_DOC_TYPE,
+                                    bulk_size=int(self._config.opts("reporting", "datastore.bulk.size", mandatory=False,
+                                                                    default_value=5000)),
+                                    flush_interval=float(self._config.opts("reporting", "datastore.flush.interval", mandatory=False,
+                                                                           default_value=5)),
+                                    max_buffer_size=int(self._config.opts("reporting", "datastore.buffer.size", mandatory=False,
+                                                                          default_value=50000)),
+                                    max_retries=int(self._config.opts("reporting", "datastore.max.retries", mandatory=False,
+                                                                      default_value=3)))
+
     def flush(self):
-        self._client.bulk_index(index=self._index, doc_type=EsMetricsStore.METRICS_DOC_TYPE, items=self._docs)
+        if self._flusher:
+            self._flusher.flush()
         logger.info("Successfully added %d metrics documents for invocation=[%s], track=[%s], challenge=[%s], car=[%s]." %
-                    (len(self._docs), self._invocation, self._track, self._challenge, self._car))
-        self._docs = []
+                    (self._docs_count, self._invocation, self._track, self._challenge, self._car))
+        self._docs_count = 0
         # ensure we can search immediately after flushing
         self._client.refresh(index=self._index)
 
+    def close(self):
+        try:
+            MetricsStore.close(self)
+        finally:
+            self._stop_flusher()
+
+    def _stop_flusher(self):
+        if self._flusher:
+            flusher = self._flusher
+            self._flusher = None
+            flusher.close()
+
     def _add(self, doc):
-        self._docs.append(doc)
+        # lazily started so we do not need a background thread when the metrics store is only read
+        if not self._flusher:
+            self._start_flusher()
+        self._flusher.add(doc)
+        self._docs_count += 1
 
     def _get(self, name, operation, operation_type, sample_type, lap, mapper):
         query = {
@@ -635,7 +845,46 @@ class EsMetricsStore(MetricsStore):
         logger.debug("Metrics query produced [%s] results." % result["hits"]["total"])
         return [mapper(v["_source"]) for v in result["hits"]["hits"]]
 
+    def _histogram(self, name, operation, operation_type, sample_type, lap):
+        """
+        :return: A histogram that merges all histogram records of the given metric or None if there are none (e.g. because the metric
+                 has been stored as individual values by an older version of Rally).
+        """
+        q = self._query_by_name(name, operation, operation_type, sample_type, lap)
+        # histogram records have no value
+        q["bool"]["must_not"] = {
+            "exists": {
+                "field": "value"
+            }
+        }
+        query = {
+            "query": q,
+            "_source": ["histogram"],
+            # the driver stores one histogram per task, sample type and post-processing interval (i.e. this covers tasks that run for days)
+            "size": 10000
+        }
+        logger.debug("Issuing histogram query against index=[%s], doc_type=[%s], query=[%s]" %
+                     (self._index, EsMetricsStore.METRICS_DOC_TYPE, query))
+        result = self._client.search(index=self._index, doc_type=EsMetricsStore.METRICS_DOC_TYPE, body=query)
+        if result["hits"]["total"] > len(result["hits"]["hits"]):
+            logger.warning("Only considering [%d] of [%d] histograms of [%s]." %
+                           (len(result["hits"]["hits"]), result["hits"]["total"], name))
+        merged = None
+        for hit in result["hits"]["hits"]:
+            h = hit["_source"].get("histogram")
+            if h:
+                if merged is None:
+                    merged = histogram.HdrHistogram()
+                merged.merge(histogram.HdrHistogram.from_dict(h))
+        return merged
+
     def get_error_rate(self, operation, operation_type=None, sample_type=None, lap=None):
+        h = self._histogram("service_time", operation, operation_type, sample_type, lap)
+        if h is not None:
+            if h.total_count == 0:
+                return 0.0
+            errors = self.get_stats("error_count", operation, operation_type, sample_type, lap)
+            return (errors["sum"] or 0) / h.total_count
         query = {
             "query": self._query_by_name("service_time", operation, operation_type, sample_type, lap),
             "size": 0,
@@ -679,6 +928,10 @@ class EsMetricsStore(MetricsStore):
         :return: A metric_stats structure. For details please refer to
         https://www.elastic.co/guide/en/elasticsearch/reference/current/search-aggregations-metrics-stats-aggregation.html
         """
+        if name in MetricsStore.HISTOGRAM_METRICS:
+            h = self._histogram(name, operation, operation_type, sample_type, lap)
+            if h is not None:
+                return histogram_stats(h)
         query = {
             "query": self._query_by_name(name, operation, operation_type, sample_type, lap),
             "size": 0,
@@ -698,6 +951,10 @@ class EsMetricsStore(MetricsStore):
     def get_percentiles(self, name, operation=None, operation_type=None, sample_type=None, lap=None, percentiles=None):
         if percentiles is None:
             percentiles = [99, 99.9, 100]
+        if name in MetricsStore.HISTOGRAM_METRICS:
+            h = self._histogram(name, operation, operation_type, sample_type, lap)
+            if h is not None:
+                return histogram_percentiles(h, percentiles)
         query = {
             "query": self._query_by_name(name, operation, operation_type, sample_type, lap),
             "size": 0,
@@ -785,6 +1042,215 @@ class EsMetricsStore(MetricsStore):
         return q
 
 
+def histogram_stats(h):
+    """
+    :param h: A histogram.
+    :return: A metric_stats structure for all values in the histogram.
+    """
+    return {
+        "count": h.total_count,
+        "min": h.min,
+        "max": h.max,
+        "avg": h.mean,
+        "sum": h.sum
+    }
+
+
+def histogram_percentiles(h, percentiles):
+    """
+    :param h: A histogram.
+    :param percentiles: A list of percentiles.
+    :return: An ordered dictionary of the values in the histogram at the given percentiles.
+    """
+    result = collections.OrderedDict()
+    for percentile in percentiles:
+        result[percentile] = h.value_at_percentile(percentile)
+    return result
+
+
+class ColumnarDocuments:
+    """
+    Stores metrics documents column by column instead of as one dict per document.
+
+    * Numeric fields (timestamps and values) are stored in typed arrays.
+    * String fields (and the lap) are dictionary-encoded, i.e. each distinct value is stored once and documents only refer to it by
+      index.
+    * Meta data are stored once per distinct combination of keys and values. Meta data that are specific to a single request (see
+      ``REQUEST_META_DATA``) and values that are not scalars are stored per document instead.
+
+    It supports the same sequence protocol as a list of document dicts (``append``, ``len``, indexing and iteration). Documents are
+    reconstructed on access.
+    """
+    ENCODED_FIELDS = ["trial-timestamp", "environment", "track", "lap", "challenge", "car", "name", "unit", "sample-type", "operation",
+                      "operation-type"]
+    NUMERIC_FIELDS = ["@timestamp", "relative-time", "value", "meta"] + ENCODED_FIELDS
+    # meta data keys whose values are (almost) unique per request
+    REQUEST_META_DATA = ["took", "hits", "ops", "shards_histogram", "query-took", "success-count", "error-count"]
+    SCALAR_TYPES = (str, int, float, bool, type(None))
+
+    # value types
+    FLOAT = 0
+    INT = 1
+    OTHER = 2
+
+    def __init__(self):
+        # index 0 is reserved to indicate that a document does not contain a field
+        self._dictionary = [None]
+        self._dictionary_lookup = {}
+        self._encoded = {field: array.array("L") for field in ColumnarDocuments.ENCODED_FIELDS}
+        self._timestamps = array.array("d")
+        self._relative_times = array.array("d")
+        self._values = array.array("d")
+        self._value_types = array.array("b")
+        # position -> value for values that cannot be represented as a double
+        self._other_values = {}
+        self._non_float_values = 0
+        self._meta = []
+        self._meta_lookup = {}
+        self._meta_indices = array.array("L")
+        # position -> dict with meta data that are specific to this document
+        self._document_meta = {}
+        # position -> dict with all fields that we don't know about
+        self._extra_fields = {}
+
+    def _encode(self, value):
+        idx = self._dictionary_lookup.get(value)
+        if idx is None:
+            idx = len(self._dictionary)
+            self._dictionary.append(value)
+            self._dictionary_lookup[value] = idx
+        return idx
+
+    @staticmethod
+    def _meta_key(meta):
+        # the type is part of the key as e.g. True == 1 (and they have the same hash)
+        return tuple(sorted((k, type(v), v) for k, v in meta.items()))
+
+    def _encode_meta(self, position, meta):
+        shared_meta = meta
+        document_meta = None
+        for k, v in meta.items():
+            if k in ColumnarDocuments.REQUEST_META_DATA or not isinstance(v, ColumnarDocuments.SCALAR_TYPES):
+                if document_meta is None:
+                    document_meta = {}
+                    shared_meta = meta.copy()
+                document_meta[k] = v
+                del shared_meta[k]
+        if document_meta:
+            self._document_meta[position] = document_meta
+        key = ColumnarDocuments._meta_key(shared_meta)
+        idx = self._meta_lookup.get(key)
+        if idx is None:
+            idx = len(self._meta)
+            self._meta.append(shared_meta)
+            self._meta_lookup[key] = idx
+        return idx
+
+    def append(self, doc):
+        """
+        Adds a new document.
+
+        :param doc: A metrics document.
+        :return: The position of the new document.
+        """
+        position = len(self._timestamps)
+        for field in ColumnarDocuments.ENCODED_FIELDS:
+            self._encoded[field].append(self._encode(doc[field]) if field in doc else 0)
+        self._timestamps.append(doc["@timestamp"])
+        self._relative_times.append(doc["relative-time"])
+        value = doc["value"]
+        if type(value) is float:
+            self._values.append(value)
+            self._value_types.append(ColumnarDocuments.FLOAT)
+        elif type(value) is int and abs(value) < 2 ** 53:
+            self._values.append(value)
+            self._value_types.append(ColumnarDocuments.INT)
+            self._non_float_values += 1
+        else:
+            self._values.append(0)
+            self._value_types.append(ColumnarDocuments.OTHER)
+            self._other_values[position] = value
+            self._non_float_values += 1
+        self._meta_indices.append(self._encode_meta(position, doc.get("meta", {})))
+        extra_fields = {k: v for k, v in doc.items() if k not in ColumnarDocuments.NUMERIC_FIELDS}
+        if extra_fields:
+            self._extra_fields[position] = extra_fields
+        return position
+
+    def field(self, position, field):
+        """
+        :return: The value of a dictionary-encoded field of the document at the given position or None if the document does not
+                 contain this field.
+        """
+        return self._dictionary[self._encoded[field][position]]
+
+    def value(self, position):
+        value_type = self._value_types[position]
+        if value_type == ColumnarDocuments.FLOAT:
+            return self._values[position]
+        elif value_type == ColumnarDocuments.INT:
+            return int(self._values[position])
+        else:
+            return self._other_values[position]
+
+    def values(self, positions):
+        """
+        :return: A list of all values at the given positions.
+        """
+        if self._non_float_values == 0:
+            # fast path: all values are floats so we can just read them from the array
+            values = self._values
+            return [values[p] for p in positions]
+        return [self.value(p) for p in positions]
+
+    def meta(self, position):
+        """
+        :return: The meta data of the document at the given position. Note that they may be shared between documents and must not be
+                 modified.
+        """
+        meta = self._meta[self._meta_indices[position]]
+        document_meta = self._document_meta.get(position)
+        if document_meta:
+            meta = meta.copy()
+            meta.update(document_meta)
+        return meta
+
+    def __getitem__(self, position):
+        doc = {
+            "@timestamp": int(self._timestamps[position]),
+            "relative-time": int(self._relative_times[position]),
+            "value": self.value(position),
+            "meta": dict(self.meta(position))
+        }
+        for field in ColumnarDocuments.ENCODED_FIELDS:
+            idx = self._encoded[field][position]
+            if idx != 0:
+                doc[field] = self._dictionary[idx]
+        extra_fields = self._extra_fields.get(position)
+        if extra_fields:
+            doc.update(extra_fields)
+        return doc
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # lookup tables can be rebuilt
+        del state["_dictionary_lookup"]
+        del state["_meta_lookup"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._dictionary_lookup = {v: idx for idx, v in enumerate(self._dictionary) if idx != 0}
+        self._meta_lookup = {ColumnarDocuments._meta_key(meta): idx for idx, meta in enumerate(self._meta)}
+
+
 class InMemoryMetricsStore(MetricsStore):
     def __init__(self, cfg, clock=time.Clock, meta_info=None, lap=None):
         """
@@ -797,16 +1263,74 @@ class InMemoryMetricsStore(MetricsStore):
         :param lap: This parameter is optional and intended for creating a metrics store with a previously serialized lap.
         """
         super().__init__(cfg=cfg, clock=clock, meta_info=meta_info, lap=lap)
-        self.docs = []
+        self.docs = ColumnarDocuments()
+        # secondary index: (name, operation, sample type, lap) -> positions in self.docs
+        self.docs_by_key = {}
+        # (name, operation, operation type, sample type, lap) -> histogram
+        self.histograms = {}
 
     def __del__(self):
         """
         Deletes the metrics store instance.
         """
         del self.docs
+        del self.docs_by_key
+        del self.histograms
 
     def _add(self, doc):
-        self.docs.append(doc)
+        key = (doc["name"], doc.get("operation"), doc["sample-type"], doc["lap"])
+        positions = self.docs_by_key.get(key)
+        if positions is None:
+            positions = []
+            self.docs_by_key[key] = positions
+        positions.append(self.docs.append(doc))
+        if doc["name"] in InMemoryMetricsStore.HISTOGRAM_METRICS:
+            key = (doc["name"], doc.get("operation"), doc.get("operation-type"), doc["sample-type"], doc["lap"])
+            h = self.histograms.get(key)
+            if h is None:
+                h = histogram.HdrHistogram()
+                self.histograms[key] = h
+            if "histogram" in doc:
+                h.merge(histogram.HdrHistogram.from_dict(doc["histogram"]))
+            else:
+                # histograms cannot record negative values (e.g. a service time that is slightly negative due to clock adjustments)
+                h.record_value(max(doc["value"], 0))
+
+    def _matching_positions(self, name, operation, operation_type, sample_type, lap):
+        """
+        Uses the secondary index to retrieve the positions of all matching documents in insertion order.
+        """
+        sample_type_name = sample_type.name.lower() if sample_type is not None else None
+        # fast path: all components of the index key are known
+        if operation is not None and sample_type is not None and lap is not None:
+            positions = self.docs_by_key.get((name, operation, sample_type_name, lap), [])
+        else:
+            candidates = [p for (d_name, d_operation, d_sample_type, d_lap), p in self.docs_by_key.items()
+                          if d_name == name and
+                          (operation is None or d_operation == operation) and
+                          (sample_type is None or d_sample_type == sample_type_name) and
+                          (lap is None or d_lap == lap)]
+            # each list of positions is sorted so we can merge them to retain insertion order
+            positions = candidates[0] if len(candidates) == 1 else heapq.merge(*candidates)
+        for position in positions:
+            if operation_type is None or self.docs.field(position, "operation-type") == operation_type.name:
+                yield position
+
+    def _histogram(self, name, operation, operation_type, sample_type, lap):
+        """
+        :return: A histogram that contains all values of the given metric (merged across e.g. laps) or None if there is none.
+        """
+        result = None
+        for (h_name, h_operation, h_operation_type, h_sample_type, h_lap), h in self.histograms.items():
+            if h_name == name and \
+                    (operation is None or h_operation == operation) and \
+                    (operation_type is None or h_operation_type == operation_type.name) and \
+                    (sample_type is None or h_sample_type == sample_type.name.lower()) and \
+                    (lap is None or h_lap == lap):
+                if result is None:
+                    result = histogram.HdrHistogram()
+                result.merge(h)
+        return result
 
     def flush(self):
         pass
@@ -814,7 +1338,9 @@ class InMemoryMetricsStore(MetricsStore):
     def to_externalizable(self, clear=False):
         docs = self.docs
         if clear:
-            self.docs = []
+            self.docs = ColumnarDocuments()
+            self.docs_by_key = {}
+            self.histograms = {}
         compressed = zlib.compress(pickle.dumps(docs))
         logger.info("Compression changed size of metric store from [%d] bytes to [%d] bytes" %
                     (sys.getsizeof(docs), sys.getsizeof(compressed)))
@@ -830,6 +1356,9 @@ class InMemoryMetricsStore(MetricsStore):
     def get_percentiles(self, name, operation=None, operation_type=None, sample_type=None, lap=None, percentiles=None):
         if percentiles is None:
             percentiles = [99, 99.9, 100]
+        if name in InMemoryMetricsStore.HISTOGRAM_METRICS:
+            h = self._histogram(name, operation, operation_type, sample_type, lap)
+            return histogram_percentiles(h, percentiles) if h is not None else collections.OrderedDict()
         result = collections.OrderedDict()
         values = self.get(name, operation, operation_type, sample_type, lap)
         if len(values) > 0:
@@ -861,45 +1390,43 @@ class InMemoryMetricsStore(MetricsStore):
             return lower_score + (higher_score - lower_score) * fr
 
     def get_error_rate(self, operation, operation_type=None, sample_type=None, lap=None):
-        error = 0
-        total_count = 0
-        for doc in self.docs:
-            # we can use any request metrics record (i.e. service time or latency)
-            if doc["name"] == "service_time" and doc["operation"] == operation and \
-                    (operation_type is None or doc["operation-type"] == operation_type.name) and \
-                    (sample_type is None or doc["sample-type"] == sample_type.name.lower()) and \
-                    (lap is None or doc["lap"] == lap):
-                total_count += 1
-                if doc["meta"]["success"] is False:
-                    error += 1
+        # we can use any request metrics record (i.e. service time or latency)
+        h = self._histogram("service_time", operation, operation_type, sample_type, lap)
+        total_count = h.total_count if h is not None else 0
+        # errors of aggregated requests...
+        error = sum(self.get("error_count", operation, operation_type, sample_type, lap))
+        # ... and of requests that have been stored individually
+        for position in self._matching_positions("service_time", operation, operation_type, sample_type, lap):
+            if self.docs.meta(position).get("success") is False:
+                error += 1
         if total_count > 0:
             return error / total_count
         else:
             return 0.0
 
     def get_stats(self, name, operation=None, operation_type=None, sample_type=SampleType.Normal, lap=None):
+        if name in InMemoryMetricsStore.HISTOGRAM_METRICS:
+            h = self._histogram(name, operation, operation_type, sample_type, lap)
+            return histogram_stats(h) if h is not None else None
         values = self.get(name, operation, operation_type, sample_type, lap)
-        sorted_values = sorted(values)
-        if len(sorted_values) > 0:
+        if len(values) > 0:
+            total = sum(values)
             return {
-                "count": len(sorted_values),
-                "min": sorted_values[0],
-                "max": sorted_values[-1],
-                "avg": statistics.mean(sorted_values),
-                "sum": sum(sorted_values)
+                "count": len(values),
+                "min": min(values),
+                "max": max(values),
+                "avg": total / len(values),
+                "sum": total
             }
         else:
             return None
 
+    def get(self, name, operation=None, operation_type=None, sample_type=None, lap=None):
+        # avoid reconstructing documents
+        return self._raw_values(name, self.docs.values(self._matching_positions(name, operation, operation_type, sample_type, lap)))
+
     def _get(self, name, operation, operation_type, sample_type, lap, mapper):
-        return [mapper(doc)
-                for doc in self.docs
-                if doc["name"] == name and
-                (operation is None or doc["operation"] == operation) and
-                (operation_type is None or doc["operation-type"] == operation_type.name) and
-                (sample_type is None or doc["sample-type"] == sample_type.name.lower()) and
-                (lap is None or doc["lap"] == lap)
-                ]
+        return [mapper(self.docs[position]) for position in self._matching_positions(name, operation, operation_type, sample_type, lap)]
 
 
 def race_store(cfg):
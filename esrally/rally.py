@@ -78,6 +78,18 @@ def parse_args():
             raise argparse.ArgumentTypeError("must be positive but was %s" % value)
         return value
 
+    def non_negative_number(v):
+        value = int(v)
+        if value < 0:
+            raise argparse.ArgumentTypeError("must not be negative but was %s" % value)
+        return value
+
+    def non_negative_float(v):
+        value = float(v)
+        if value < 0:
+            raise argparse.ArgumentTypeError("must not be negative but was %s" % value)
+        return value
+
     # try to preload configurable defaults, but this does not work together with `--configuration-name` (which is undocumented anyway)
     cfg = config.Config()
     if cfg.config_present():
@@ -225,6 +237,16 @@ def parse_args():
             help="runs the given track in 'test mode'. Meant to check a track for errors but not for real benchmarks (default: false).",
             default=False,
             action="store_true")
+        p.add_argument(
+            "--offset-table-interval",
+            type=positive_number,
+            help="number of lines between two entries in the file offset table of track data files (default: 50000).",
+            default=50000)
+        p.add_argument(
+            "--stream-track-data",
+            help="reads track data directly from their (bz2 or gz) archives instead of decompressing them first (default: false).",
+            default=False,
+            action="store_true")
 
     for p in [parser, list_parser, race_parser]:
         p.add_argument(
@@ -251,6 +273,49 @@ def parse_args():
             help="Enables a profiler for analyzing the performance of calls in Rally's driver (default: false)",
             default=False,
             action="store_true")
+        p.add_argument(
+            "--client-execution",
+            help="defines how clients are executed within a load generator (default: threads).",
+            choices=["threads", "thread-pool"],
+            default="threads")
+        p.add_argument(
+            "--request-threads",
+            help="maximum number of threads from which a load generator issues requests if --client-execution=thread-pool "
+                 "(default: 4 times the number of logical CPU cores).",
+            type=positive_number,
+            default=None)
+        p.add_argument(
+            "--load-driver-hosts",
+            help="define a comma-separated list of hosts which should generate load (default: localhost).",
+            default="localhost")
+        p.add_argument(
+            "--worker-pool",
+            help="runs all clients in a fixed number of load generator processes instead of one process per client (default: false).",
+            default=False,
+            action="store_true")
+        p.add_argument(
+            "--worker-pool-size",
+            help="number of load generator processes if the worker pool is enabled (default: number of logical CPU cores).",
+            type=positive_number,
+            default=None)
+        p.add_argument(
+            "--bulk-prefetch-size",
+            help="number of bulk requests that each client prepares ahead of time in a background thread; 0 disables prefetching "
+                 "(default: 0).",
+            type=non_negative_number,
+            default=0)
+        p.add_argument(
+            "--sampler-spill-limit",
+            help="maximum number of samples per task that a client buffers if the driver cannot keep up with processing them; "
+                 "further samples are dropped (default: unbounded).",
+            type=non_negative_number,
+            default=None)
+        p.add_argument(
+            "--timer-spin-threshold",
+            help="time in milliseconds before a scheduled request during which clients busy-wait instead of sleeping; 0 disables "
+                 "busy-waiting (default: 2).",
+            type=non_negative_float,
+            default=2)
 
     ###############################################################################
     #
@@ -504,6 +569,11 @@ def main():
     console.init(quiet=args.quiet)
     console.println(BANNER)
 
+    if args.client_execution == "thread-pool" and sys.version_info < (3, 5):
+        console.error("--client-execution=thread-pool requires Python 3.5 or better but you are running Python %d.%d." %
+                      (sys.version_info[0], sys.version_info[1]))
+        exit(64)
+
     cfg = config.Config(config_name=args.configuration_name)
     sub_command = derive_sub_command(args, cfg)
     ensure_configuration_present(cfg, args, sub_command)
@@ -538,6 +608,8 @@ def main():
     cfg.add(config.Scope.applicationOverride, "track", "track.name", args.track)
     cfg.add(config.Scope.applicationOverride, "track", "challenge.name", args.challenge)
     cfg.add(config.Scope.applicationOverride, "track", "test.mode.enabled", args.test_mode)
+    cfg.add(config.Scope.applicationOverride, "track", "offset.table.interval", args.offset_table_interval)
+    cfg.add(config.Scope.applicationOverride, "track", "data.streaming", args.stream_track_data)
     cfg.add(config.Scope.applicationOverride, "track", "auto_manage_indices", to_bool(args.auto_manage_indices))
 
     cfg.add(config.Scope.applicationOverride, "reporting", "format", args.report_format)
@@ -551,6 +623,15 @@ def main():
     ################################
     cfg.add(config.Scope.applicationOverride, "benchmarks", "cluster.health", args.cluster_health)
     cfg.add(config.Scope.applicationOverride, "driver", "profiling", args.enable_driver_profiling)
+    cfg.add(config.Scope.applicationOverride, "driver", "client.execution", args.client_execution)
+    cfg.add(config.Scope.applicationOverride, "driver", "request.threads", args.request_threads)
+    cfg.add(config.Scope.applicationOverride, "driver", "worker.pool", args.worker_pool)
+    cfg.add(config.Scope.applicationOverride, "driver", "load_driver_hosts", csv_to_list(args.load_driver_hosts))
+    cfg.add(config.Scope.applicationOverride, "driver", "worker.pool.size", args.worker_pool_size)
+    cfg.add(config.Scope.applicationOverride, "driver", "bulk.prefetch.size", args.bulk_prefetch_size)
+    cfg.add(config.Scope.applicationOverride, "driver", "timer.spin.threshold", args.timer_spin_threshold)
+    if args.sampler_spill_limit is not None:
+        cfg.add(config.Scope.applicationOverride, "driver", "sampler.spill.limit", args.sampler_spill_limit)
     if sub_command != "list":
         # Also needed by mechanic (-> telemetry) - duplicate by module?
         cfg.add(config.Scope.applicationOverride, "client", "hosts", convert_hosts(csv_to_list(args.target_hosts)))
@@ -39,16 +39,25 @@ class Stats:
     def __init__(self, store, challenge, lap=None):
         self.store = store
         self.op_metrics = collections.OrderedDict()
+        # operation name -> (throughput, unit)
+        self.max_sustainable_throughput = collections.OrderedDict()
         self.lap = lap
         for tasks in challenge.schedule:
             for task in tasks:
+                if task.throughput_search and task.throughput_search.name not in self.max_sustainable_throughput:
+                    search_op = task.throughput_search.name
+                    self.max_sustainable_throughput[search_op] = (self.one("max_sustainable_throughput", operation_name=search_op),
+                                                                  self.store.get_unit("max_sustainable_throughput", operation=search_op))
                 op = task.operation.name
                 logger.debug("Gathering request metrics for [%s]." % op)
                 self.op_metrics[op] = {}
                 self.op_metrics[op]["throughput"] = self.summary_stats("throughput", op)
                 self.op_metrics[op]["latency"] = self.single_latency(op)
                 self.op_metrics[op]["service_time"] = self.single_latency(op, metric_name="service_time")
+                self.op_metrics[op]["schedule_lag"] = self.single_latency(op, metric_name="schedule_lag")
                 self.op_metrics[op]["error_rate"] = self.error_rate(op)
+                self.op_metrics[op]["dropped_samples"] = self.one("dropped_samples", operation_name=op)
+                self.op_metrics[op]["param_source_waits"] = self.one("param_source_waits", operation_name=op)
 
         logger.debug("Gathering indexing metrics.")
         self.total_time = self.sum("indexing_total_time")
@@ -95,8 +104,8 @@ class Stats:
         else:
             return None
 
-    def one(self, metric_name):
-        return self.store.get_one(metric_name, lap=self.lap)
+    def one(self, metric_name, operation_name=None):
+        return self.store.get_one(metric_name, operation=operation_name, lap=self.lap)
 
     def summary_stats(self, metric_name, operation_name):
         median = self.store.get_median(metric_name, operation=operation_name, sample_type=metrics.SampleType.Normal, lap=self.lap)
@@ -221,10 +230,17 @@ class SummaryReporter:
 
         for tasks in selected_challenge.schedule:
             for task in tasks:
+                # probes of a throughput search that have been skipped did not produce any results
+                if task.throughput_search and stats.op_metrics[task.operation.name]["throughput"][1] is None:
+                    continue
                 metrics_table += self.report_throughput(stats, task.operation)
                 metrics_table += self.report_latency(stats, task.operation)
                 metrics_table += self.report_service_time(stats, task.operation)
+                metrics_table += self.report_schedule_lag(stats, task.operation)
                 metrics_table += self.report_error_rate(stats, task.operation)
+                metrics_table += self.report_dropped_samples(stats, task.operation)
+                metrics_table += self.report_param_source_waits(stats, task.operation)
+        metrics_table += self.report_max_sustainable_throughput(stats)
 
         meta_info_table += self.report_meta_info()
 
@@ -301,6 +317,15 @@ class SummaryReporter:
                 lines.append([self.lap, "%sth percentile service time" % percentile, operation.name, value, "ms"])
         return lines
 
+    def report_schedule_lag(self, stats, operation):
+        lines = []
+        # only available for throughput-throttled tasks
+        schedule_lag = stats.op_metrics[operation.name].get("schedule_lag")
+        if schedule_lag:
+            for percentile, value in schedule_lag.items():
+                lines.append([self.lap, "%sth percentile schedule lag" % percentile, operation.name, value, "ms"])
+        return lines
+
     def report_error_rate(self, stats, operation):
         lines = []
         error_rate = stats.op_metrics[operation.name]["error_rate"]
@@ -308,6 +333,29 @@ class SummaryReporter:
             lines.append([self.lap, "error rate", operation.name, "%.2f" % (error_rate * 100.0), "%"])
         return lines
 
+    def report_dropped_samples(self, stats, operation):
+        lines = []
+        dropped_samples = stats.op_metrics[operation.name]["dropped_samples"]
+        # only show it if there is a problem
+        if dropped_samples:
+            lines.append([self.lap, "dropped samples", operation.name, dropped_samples, ""])
+        return lines
+
+    def report_param_source_waits(self, stats, operation):
+        lines = []
+        param_source_waits = stats.op_metrics[operation.name].get("param_source_waits")
+        # only show it if clients had to wait for their parameters
+        if param_source_waits:
+            lines.append([self.lap, "param source waits", operation.name, param_source_waits, ""])
+        return lines
+
+    def report_max_sustainable_throughput(self, stats):
+        lines = []
+        for operation_name, (throughput, unit) in stats.max_sustainable_throughput.items():
+            if throughput is not None:
+                lines.append([self.lap, "Max Sustainable Throughput", operation_name, throughput, unit])
+        return lines
+
     def report_total_times(self, stats):
         total_times = []
         unit = "min"
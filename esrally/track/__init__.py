@@ -1,4 +1,5 @@
 from .loader import list_tracks, load_track, load_track_plugins, prepare_track, operation_parameters
+from .params import PrefetchingParamSource
 
 # expose the complete track API
 from .track import *
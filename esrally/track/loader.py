@@ -1,3 +1,4 @@
+import concurrent.futures
 import importlib.machinery
 import json
 import logging
@@ -12,7 +13,7 @@ import jsonschema
 import tabulate
 from esrally import exceptions, time, PROGRAM_NAME
 from esrally.track import params, track
-from esrally.utils import io, convert, net, git, versions, console
+from esrally.utils import io, convert, net, git, versions, console, sysstats, jsoncodec
 
 logger = logging.getLogger("rally.track")
 
@@ -79,11 +80,11 @@ def load_track(cfg):
                                           (track_name, PROGRAM_NAME))
 
 
-def load_track_plugins(cfg, register_runner):
+def load_track_plugins(cfg, register_runner, register_scheduler=None):
     track_name = cfg.opts("track", "track.name")
     # TODO #71: If we distribute drivers we need to ensure that the correct branch in the track repo is checked out
     repo = TrackRepository(cfg, fetch=False)
-    plugin_reader = TrackPluginReader(register_runner)
+    plugin_reader = TrackPluginReader(register_runner, register_scheduler)
 
     track_plugin_path = repo.track_dir(track_name)
     if plugin_reader.can_load(track_plugin_path):
@@ -151,27 +152,34 @@ def prepare_track(track, cfg):
 
         return True
 
-    def decompress(data_set_path, expected_size_in_bytes):
+    def decompress(data_set_path, expected_size_in_bytes, offset_table_interval, threads):
         # we assume that track data are always compressed and try to decompress them before running the benchmark
         basename, extension = io.splitext(data_set_path)
-        decompressed = False
         if not os.path.isfile(basename) or os.path.getsize(basename) != expected_size_in_bytes:
-            decompressed = True
-            if type.uncompressed_size_in_bytes:
-                console.info("Decompressing track data from [%s] to [%s] (resulting size: %.2f GB) ... " %
-                             (data_set_path, basename, convert.bytes_to_gb(type.uncompressed_size_in_bytes)),
-                             end='', flush=True, logger=logger)
+            # decompression may run in parallel for multiple files so we cannot print a progress indicator per file
+            if expected_size_in_bytes:
+                console.info("Decompressing track data from [%s] to [%s] (resulting size: %.2f GB)." %
+                             (data_set_path, basename, convert.bytes_to_gb(expected_size_in_bytes)), logger=logger)
             else:
-                console.info("Decompressing track data from [%s] to [%s] ... " % (data_set_path, basename), end='',
-                             flush=True, logger=logger)
+                console.info("Decompressing track data from [%s] to [%s]." % (data_set_path, basename), logger=logger)
 
-            io.decompress(data_set_path, io.dirname(data_set_path))
-            console.println("[OK]")
+            # also creates the file offset table while decompressing (if supported for this file type)
+            io.decompress(data_set_path, io.dirname(data_set_path), offset_table_interval=offset_table_interval, threads=threads)
             extracted_bytes = os.path.getsize(basename)
             if expected_size_in_bytes is not None and extracted_bytes != expected_size_in_bytes:
                 raise exceptions.DataError("[%s] is corrupt. Extracted [%d] bytes but [%d] bytes are expected." %
                                            (basename, extracted_bytes, expected_size_in_bytes))
-        return basename, decompressed
+            console.info("Successfully decompressed [%s]." % data_set_path, logger=logger)
+        # no-op if the file offset table has already been created while decompressing
+        io.prepare_file_offset_table(basename, offset_table_interval)
+        return basename
+
+    offset_table_interval = int(cfg.opts("track", "offset.table.interval", mandatory=False,
+                                         default_value=io.DEFAULT_OFFSET_TABLE_INTERVAL))
+    stream_data = cfg.opts("track", "data.streaming", mandatory=False, default_value=False)
+    cores = sysstats.logical_cpu_cores()
+    # data sets that need to be decompressed
+    data_sets = []
 
     if not track.source_root_url:
         logger.info("Track [%s] does not specify a source root URL. Assuming data are available locally." % track.name)
@@ -191,13 +199,25 @@ def prepare_track(track, cfg):
                     else:
                         logger.error("[%s] does not exist." % type.document_archive)
                         raise exceptions.DataError("Track data file [%s] is missing." % type.document_archive)
-                decompressed_file_path, was_decompressed = decompress(type.document_archive, type.uncompressed_size_in_bytes)
-                # just rebuild the file every time for the time being. Later on, we might check the data file fingerprint to avoid it
-                io.prepare_file_offset_table(decompressed_file_path)
+                if stream_data and io.supports_block_index(type.document_archive):
+                    # clients will read directly from the archive
+                    io.prepare_block_index(type.document_archive)
+                else:
+                    data_sets.append((type.document_archive, type.uncompressed_size_in_bytes))
             else:
                 logger.info("Type [%s] in index [%s] does not define a document archive. No data are indexed from a file for this type." %
                             (type.name, index.name))
 
+    if data_sets:
+        # decompress all data sets in parallel and additionally split the available cores among them for multi-stream bz2 files
+        threads_per_data_set = max(cores // len(data_sets), 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(data_sets), cores)) as executor:
+            futures = [executor.submit(decompress, data_set_path, expected_size_in_bytes, offset_table_interval, threads_per_data_set)
+                       for data_set_path, expected_size_in_bytes in data_sets]
+            for future in futures:
+                # propagates any errors
+                future.result()
+
 
 class TrackRepository:
     """
@@ -360,8 +380,10 @@ class TrackFileReader:
     """
 
     def __init__(self, cfg):
+        # the track loader uses the same JSON codec as the client
+        self.codec = jsoncodec.from_client_options(cfg.opts("client", "options", mandatory=False, default_value=None))
         track_schema_file = "%s/resources/track-schema.json" % (cfg.opts("node", "rally.root"))
-        self.track_schema = json.loads(open(track_schema_file).read())
+        self.track_schema = self.codec.loads(open(track_schema_file).read())
         override_auto_manage_indices = cfg.opts("track", "auto_manage_indices")
         self.read_track = TrackSpecificationReader(override_auto_manage_indices)
 
@@ -380,8 +402,8 @@ class TrackFileReader:
         try:
             rendered = render_template_from_file(track_spec_file)
             logger.info("Final rendered track for '%s': %s" % (track_spec_file, rendered))
-            track_spec = json.loads(rendered)
-        except (json.JSONDecodeError, jinja2.exceptions.TemplateError) as e:
+            track_spec = self.codec.loads(rendered)
+        except (ValueError, jinja2.exceptions.TemplateError) as e:
             logger.exception("Could not load [%s]." % track_spec_file)
             raise TrackSyntaxError("Could not load '%s'" % track_spec_file, e)
         try:
@@ -398,8 +420,9 @@ class TrackPluginReader:
     """
     Loads track plugins
     """
-    def __init__(self, runner_registry):
+    def __init__(self, runner_registry, scheduler_registry=None):
         self.runner_registry = runner_registry
+        self.scheduler_registry = scheduler_registry
 
     def _modules(self, plugins_dirs, plugin_name, plugin_root_path):
         for path in plugins_dirs:
@@ -450,6 +473,10 @@ class TrackPluginReader:
     def register_runner(self, name, runner):
         self.runner_registry(name, runner)
 
+    def register_scheduler(self, name, scheduler):
+        if self.scheduler_registry:
+            self.scheduler_registry(name, scheduler)
+
 
 class TrackSpecificationReader:
     """
@@ -458,10 +485,12 @@ class TrackSpecificationReader:
 
     def __init__(self, override_auto_manage_indices=None):
         self.name = None
+        self.track_dir = None
         self.override_auto_manage_indices = override_auto_manage_indices
 
     def __call__(self, track_name, track_specification, mapping_dir, data_dir):
         self.name = track_name
+        self.track_dir = mapping_dir
         short_description = self._track_info(track_specification, "short-description")
         description = self._track_info(track_specification, "description")
         source_root_url = self._track_info(track_specification, "data-url", mandatory=False)
@@ -592,13 +621,21 @@ class TrackSpecificationReader:
             known_challenge_names.add(name)
 
             schedule = []
+            searched_ops = set()
 
             for op in self._r(challenge, "schedule", error_ctx=name):
                 if "parallel" in op:
-                    task = self.parse_parallel(op["parallel"], ops, name)
+                    schedule.append(self.parse_parallel(op["parallel"], ops, name))
+                elif "throughput-search" in op:
+                    probes = self.parse_throughput_search(op, ops, name)
+                    search = probes[0].throughput_search
+                    if search.name in searched_ops:
+                        self._error("Challenge '%s' searches the throughput of operation '%s' more than once." % (name, search.name))
+                    searched_ops.add(search.name)
+                    # each probe is a separate step so the search can stop after each of them
+                    schedule.extend(probes)
                 else:
-                    task = self.parse_task(op, ops, name)
-                schedule.append(task)
+                    schedule.append(self.parse_task(op, ops, name))
 
             new_challenge = track.Challenge(name=name,
                                             meta_data=meta_data,
@@ -627,6 +664,9 @@ class TrackSpecificationReader:
         # now descent to each operation
         tasks = []
         for task in self._r(ops_spec, "tasks", error_ctx="parallel"):
+            if "throughput-search" in task:
+                self._error("Operation '%s' in challenge '%s' defines a 'throughput-search' which is not supported for parallel tasks."
+                            % (task.get("operation"), challenge_name))
             tasks.append(self.parse_task(task, ops, challenge_name, default_warmup_iterations, default_iterations,
                                          default_warmup_time_period, default_time_period))
         return track.Parallel(tasks, clients)
@@ -645,6 +685,7 @@ class TrackSpecificationReader:
                         % (op_name, challenge_name))
         if target_interval:
             target_throughput = 1 / target_interval
+        schedule, schedule_params = self.parse_schedule(task_spec, op_name)
 
         task = track.Task(operation=ops[op_name],
                           meta_data=self._r(task_spec, "meta", error_ctx=op_name, mandatory=False),
@@ -656,7 +697,9 @@ class TrackSpecificationReader:
                           time_period=self._r(task_spec, "time-period", error_ctx=op_name, mandatory=False,
                                               default_value=default_time_period),
                           clients=self._r(task_spec, "clients", error_ctx=op_name, mandatory=False, default_value=1),
-                          target_throughput=target_throughput)
+                          target_throughput=target_throughput,
+                          schedule=schedule,
+                          schedule_params=schedule_params)
         if task.warmup_iterations != default_warmup_iterations and task.time_period is not None:
             self._error("Operation '%s' in challenge '%s' defines '%d' warmup iterations and a time period of '%d' seconds. Please do not "
                         "mix time periods and iterations." % (op_name, challenge_name, task.warmup_iterations, task.time_period))
@@ -666,6 +709,86 @@ class TrackSpecificationReader:
 
         return task
 
+    def parse_throughput_search(self, task_spec, ops, challenge_name):
+        """
+        Expands a task with a throughput search into one probe task per target throughput.
+        """
+        op_name = task_spec["operation"]
+        search_spec = self._r(task_spec, "throughput-search", error_ctx=op_name)
+        if "target-throughput" in task_spec or "target-interval" in task_spec:
+            self._error("Operation '%s' in challenge '%s' defines a 'throughput-search' and a target throughput but only one of them is "
+                        "allowed." % (op_name, challenge_name))
+        start = self._r(search_spec, "start", error_ctx=op_name)
+        maximum = self._r(search_spec, "max", error_ctx=op_name)
+        step = self._r(search_spec, "step", error_ctx=op_name, mandatory=False)
+        factor = self._r(search_spec, "factor", error_ctx=op_name, mandatory=False)
+        if start <= 0 or maximum < start:
+            self._error("'throughput-search' of '%s' requires 0 < 'start' <= 'max' but was start=%s, max=%s." %
+                        (op_name, str(start), str(maximum)))
+        if (step is None) == (factor is None):
+            self._error("'throughput-search' of '%s' requires exactly one of 'step' or 'factor'." % op_name)
+        if step is not None and step <= 0:
+            self._error("'step' in 'throughput-search' of '%s' must be positive but was %s." % (op_name, str(step)))
+        if factor is not None and factor <= 1:
+            self._error("'factor' in 'throughput-search' of '%s' must be greater than one but was %s." % (op_name, str(factor)))
+        max_error_rate = self._r(search_spec, "max-error-rate", error_ctx=op_name, mandatory=False)
+        if max_error_rate is not None and not 0 <= max_error_rate <= 1:
+            self._error("'max-error-rate' in 'throughput-search' of '%s' must be in the range [0, 1] but was %s." %
+                        (op_name, str(max_error_rate)))
+
+        target_throughputs = []
+        target_throughput = start
+        while target_throughput <= maximum:
+            target_throughputs.append(target_throughput)
+            # avoid accumulating rounding errors
+            n = len(target_throughputs)
+            target_throughput = start + n * step if step is not None else start * factor ** n
+
+        base_task = self.parse_task(task_spec, ops, challenge_name)
+        search = track.ThroughputSearch(operation=base_task.operation,
+                                        target_throughputs=target_throughputs,
+                                        max_latency=self._r(search_spec, "max-latency", error_ctx=op_name),
+                                        latency_percentile=self._r(search_spec, "latency-percentile", error_ctx=op_name, mandatory=False,
+                                                                   default_value=99),
+                                        max_error_rate=max_error_rate)
+        probes = []
+        for target_throughput in target_throughputs:
+            op = base_task.operation
+            # each probe gets its own operation name so its metrics are kept apart from the other probes
+            probe_op = track.Operation(name=search.probe_name(target_throughput), operation_type=op.type,
+                                       meta_data=op.meta_data, params=op.params, param_source=op.param_source)
+            probes.append(track.Task(operation=probe_op,
+                                     meta_data=base_task.meta_data,
+                                     warmup_iterations=base_task.warmup_iterations,
+                                     iterations=base_task.iterations,
+                                     warmup_time_period=base_task.warmup_time_period,
+                                     time_period=base_task.time_period,
+                                     clients=base_task.clients,
+                                     target_throughput=target_throughput,
+                                     schedule=base_task.schedule,
+                                     schedule_params=base_task.schedule_params,
+                                     throughput_search=search))
+        return probes
+
+    def parse_schedule(self, task_spec, op_name):
+        schedule_spec = self._r(task_spec, "schedule", error_ctx=op_name, mandatory=False)
+        if schedule_spec is None:
+            return None, {}
+        elif isinstance(schedule_spec, str):
+            return schedule_spec, {}
+        elif isinstance(schedule_spec, dict):
+            schedule_params = dict(schedule_spec)
+            schedule = schedule_params.pop("type", None)
+            if schedule is None:
+                self._error("Mandatory element 'type' is missing in 'schedule' of '%s'." % op_name)
+            # timestamp files are usually stored along with the track
+            replay_file = schedule_params.get("file")
+            if replay_file and self.track_dir and not os.path.isabs(replay_file):
+                schedule_params["file"] = os.path.join(self.track_dir, replay_file)
+            return schedule, schedule_params
+        else:
+            self._error("'schedule' of '%s' must be either a name or an object but was [%s]." % (op_name, str(schedule_spec)))
+
     def parse_operations(self, ops_specs):
         # key = name, value = operation
         ops = {}
@@ -1,18 +1,29 @@
+import array
+import bisect
+import hashlib
 import logging
+import mmap
+import os
+import queue
 import random
+import sys
+import threading
 import time
 import types
 from enum import Enum
 
 from esrally import exceptions
 from esrally.track import track
-from esrally.utils import io
+from esrally.utils import io, compression
 
 logger = logging.getLogger("rally.track")
 
 __PARAM_SOURCES_BY_OP = {}
 __PARAM_SOURCES_BY_NAME = {}
 
+# probability in percent that a document replaces an already indexed one when id conflicts are simulated
+DEFAULT_CONFLICT_PROBABILITY = 25
+
 
 def param_source_for_operation(op_type, indices, params):
     try:
@@ -111,6 +122,73 @@ class DelegatingParamSource(ParamSource):
         return self.delegate(self.indices, self._params)
 
 
+class PrefetchingParamSource(ParamSource):
+    """
+    Wraps a partitioned parameter source and calls its ``params()`` in a background thread so the next parameters are usually ready when
+    they are needed (e.g. the next bulk body can be read from disk while the current bulk request is in flight).
+    """
+
+    def __init__(self, delegate, prefetch_size, on_wait=None):
+        """
+        :param delegate: The parameter source to wrap.
+        :param prefetch_size: The maximum number of parameters that are retrieved ahead of time. Must be positive.
+        :param on_wait: A function that is called with the waiting time in seconds whenever ``params()`` had to wait for the background
+                        thread. Optional.
+        """
+        super().__init__(delegate.indices, {})
+        self.delegate = delegate
+        self.on_wait = on_wait
+        self.queue = queue.Queue(maxsize=prefetch_size)
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._prefetch, name="param-source-prefetcher", daemon=True)
+        self.thread.start()
+
+    def _prefetch(self):
+        while not self.stopped.is_set():
+            try:
+                item = (self.delegate.params(), None)
+            except BaseException as e:
+                # also includes StopIteration when the delegate is exhausted
+                item = (None, e)
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if item[1] is not None:
+                return
+
+    def partition(self, partition_index, total_partitions):
+        raise exceptions.RallyError("Cannot partition a PrefetchingParamSource")
+
+    def size(self):
+        return self.delegate.size()
+
+    def params(self):
+        if self.error is not None:
+            raise self.error
+        try:
+            params, error = self.queue.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            params, error = self.queue.get()
+            if self.on_wait:
+                self.on_wait(time.perf_counter() - start)
+        if error is not None:
+            self.error = error
+            raise error
+        return params
+
+    def close(self):
+        """
+        Stops the background thread.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+
 class SearchParamSource(ParamSource):
     def __init__(self, indices, params):
         super().__init__(indices, params)
@@ -147,6 +225,64 @@ class SearchParamSource(ParamSource):
         return self.query_params
 
 
+class MultiSearchParamSource(ParamSource):
+    """
+    Provides a batch of queries for each multi-search request. Queries are taken round-robin from the list of queries. Each client starts
+    at a different query.
+    """
+
+    def __init__(self, indices, params, offset=0):
+        super().__init__(indices, params)
+        if len(indices) == 1 and len(indices[0].types) == 1:
+            default_index = indices[0].name
+            default_type = indices[0].types[0].name
+        else:
+            default_index = None
+            default_type = None
+
+        index_name = params.get("index", default_index)
+        type_name = params.get("type", default_type)
+        request_cache = params.get("cache", False)
+        if "queries" in params:
+            query_specs = params["queries"]
+        elif "body" in params:
+            query_specs = [{"body": params["body"]}]
+        else:
+            raise exceptions.InvalidSyntax("Either 'queries' or 'body' is mandatory")
+        if not isinstance(query_specs, list) or len(query_specs) == 0:
+            raise exceptions.InvalidSyntax("'queries' must be a non-empty list")
+
+        self.queries = []
+        for query_spec in query_specs:
+            query_index = query_spec.get("index", index_name)
+            if not query_index:
+                raise exceptions.InvalidSyntax("'index' is mandatory")
+            self.queries.append({
+                "index": query_index,
+                "type": query_spec.get("type", type_name),
+                "use_request_cache": request_cache,
+                "body": query_spec.get("body", None)
+            })
+
+        try:
+            self.queries_per_request = int(params.get("queries-per-request", len(self.queries)))
+            if self.queries_per_request <= 0:
+                raise exceptions.InvalidSyntax("'queries-per-request' must be positive but was %d" % self.queries_per_request)
+        except ValueError:
+            raise exceptions.InvalidSyntax("'queries-per-request' must be numeric")
+        self.current = offset % len(self.queries)
+
+    def partition(self, partition_index, total_partitions):
+        return MultiSearchParamSource(self.indices, self._params, offset=partition_index)
+
+    def params(self):
+        batch = []
+        for _ in range(self.queries_per_request):
+            batch.append(self.queries[self.current])
+            self.current = (self.current + 1) % len(self.queries)
+        return {"queries": batch}
+
+
 class IndexIdConflict(Enum):
     """
     Determines which id conflicts to simulate during indexing.
@@ -162,6 +298,18 @@ class IndexIdConflict(Enum):
     RandomConflicts = 2
 
 
+class ConflictDistribution(Enum):
+    """
+    Determines which of the already indexed document ids is chosen when a document is replaced.
+
+    * Uniform: All already indexed document ids are equally likely to be replaced
+    * Zipfian: Document ids that have been indexed early are replaced much more often than later ones ("hot keys"). The probability to
+      replace the n-th document id is roughly proportional to 1 / n.
+    """
+    Uniform = 0,
+    Zipfian = 1
+
+
 class ActionMetaData(Enum):
     NoMetaData = 0,
     Generate = 1,
@@ -196,7 +344,35 @@ class BulkIndexParamSource(ParamSource):
             raise exceptions.InvalidSyntax("Cannot generate id conflicts [%s] when 'action-and-meta-data' is [%s]." %
                                            (id_conflicts, action_metadata))
 
+        try:
+            self.conflict_probability = float(params.get("conflict-probability", DEFAULT_CONFLICT_PROBABILITY))
+            if self.conflict_probability < 0 or self.conflict_probability > 100:
+                raise exceptions.InvalidSyntax("'conflict-probability' must be in the range [0, 100] but was %s" %
+                                               str(self.conflict_probability))
+        except ValueError:
+            raise exceptions.InvalidSyntax("'conflict-probability' must be numeric")
+
+        conflict_distribution = params.get("conflict-distribution", "uniform")
+        if conflict_distribution == "uniform":
+            self.conflict_distribution = ConflictDistribution.Uniform
+        elif conflict_distribution == "zipfian":
+            self.conflict_distribution = ConflictDistribution.Zipfian
+        else:
+            raise exceptions.InvalidSyntax("Unknown 'conflict-distribution' setting [%s]" % conflict_distribution)
+
         self.pipeline = params.get("pipeline", None)
+        self.bulk_cache = params.get("bulk-cache", False)
+        if not isinstance(self.bulk_cache, bool):
+            raise exceptions.InvalidSyntax("'bulk-cache' must be a boolean but was [%s]" % str(self.bulk_cache))
+        body_compression = params.get("body-compression", None)
+        if body_compression:
+            try:
+                self.compressor = compression.Compressor(body_compression,
+                                                         params.get("body-compression-level", compression.DEFAULT_LEVEL))
+            except ValueError as e:
+                raise exceptions.InvalidSyntax(str(e))
+        else:
+            self.compressor = None
         try:
             self.bulk_size = int(params["bulk-size"])
             if self.bulk_size <= 0:
@@ -231,7 +407,8 @@ class BulkIndexParamSource(ParamSource):
         logger.info("Choosing indices [%s] for partition [%d] of [%d]." %
                     (",".join([str(i) for i in chosen_indices]), partition_index, total_partitions))
         return PartitionBulkIndexParamSource(chosen_indices, partition_index, total_partitions, self.action_metadata,
-                                             self.batch_size, self.bulk_size, self.id_conflicts, self.pipeline)
+                                             self.batch_size, self.bulk_size, self.id_conflicts, self.pipeline, self.bulk_cache,
+                                             self.conflict_probability, self.conflict_distribution, self.compressor)
 
     def params(self):
         raise exceptions.RallyError("Do not use a BulkIndexParamSource without partitioning")
@@ -242,7 +419,8 @@ class BulkIndexParamSource(ParamSource):
 
 class PartitionBulkIndexParamSource(ParamSource):
     def __init__(self, indices, partition_index, total_partitions, action_metadata, batch_size, bulk_size, id_conflicts=None,
-                 pipeline=None):
+                 pipeline=None, bulk_cache=False, conflict_probability=DEFAULT_CONFLICT_PROBABILITY,
+                 conflict_distribution=ConflictDistribution.Uniform, compressor=None):
         """
 
         :param indices: Specification of affected indices.
@@ -253,6 +431,11 @@ class PartitionBulkIndexParamSource(ParamSource):
         :param bulk_size: The size of bulk index operations (number of documents per bulk).
         :param id_conflicts: The type of id conflicts.
         :param pipeline: The name of the ingest pipeline to run.
+        :param bulk_cache: Whether bulk requests should be read from (and written to) the bulk cache.
+        :param conflict_probability: The probability in percent that a document replaces an already indexed one if id conflicts are
+                                     simulated.
+        :param conflict_distribution: Determines which of the already indexed documents is replaced.
+        :param compressor: If provided, bulk bodies are compressed with this compressor before they are returned.
         """
         super().__init__(indices, {})
         self.partition_index = partition_index
@@ -262,8 +445,15 @@ class PartitionBulkIndexParamSource(ParamSource):
         self.id_conflicts = id_conflicts
         self.pipeline = pipeline
         self.action_metadata = action_metadata
+        self.bulk_cache = bulk_cache
+        self.conflict_probability = conflict_probability
+        self.conflict_distribution = conflict_distribution
+        self.compressor = compressor
         self.internal_params = bulk_data_based(total_partitions, partition_index, indices, action_metadata, batch_size,
-                                               bulk_size, id_conflicts, pipeline)
+                                               bulk_size, id_conflicts, pipeline,
+                                               create_reader=create_caching_reader if bulk_cache else create_default_reader,
+                                               conflict_probability=conflict_probability, conflict_distribution=conflict_distribution,
+                                               compressor=compressor)
 
     def partition(self, partition_index, total_partitions):
         raise exceptions.RallyError("Cannot partition a PartitionBulkIndexParamSource further")
@@ -289,18 +479,101 @@ class PartitionBulkIndexParamSource(ParamSource):
         return bulks
 
 
-def build_conflicting_ids(conflicts, docs_to_index, offset, rand=random.randint):
+def build_conflicting_ids(conflicts, docs_to_index, offset, conflict_probability=DEFAULT_CONFLICT_PROBABILITY,
+                          conflict_distribution=ConflictDistribution.Uniform, seed=None):
     if conflicts is None or conflicts == IndexIdConflict.NoConflicts:
         return None
-    logger.info("building ids with id conflicts of type [%s]" % conflicts)
-    all_ids = [0] * docs_to_index
-    for i in range(docs_to_index):
-        # always consider the offset as each client will index its own range and we don't want uncontrolled conflicts across clients
-        if conflicts == IndexIdConflict.SequentialConflicts:
-            all_ids[i] = "%10d" % (offset + i)
-        else:  # RandomConflicts
-            all_ids[i] = "%10d" % rand(offset, offset + docs_to_index)
-    return all_ids
+    logger.info("building ids with id conflicts of type [%s] and distribution [%s]" % (conflicts, conflict_distribution))
+    # always consider the offset as each client will index its own range and we don't want uncontrolled conflicts across clients
+    return ConflictingIds(conflicts, docs_to_index, offset, conflict_probability, conflict_distribution, seed)
+
+
+class ConflictingIds:
+    """
+    Generates the document ids for one client when id conflicts should be simulated.
+
+    With ``conflict_probability`` percent a document replaces an already indexed one, otherwise it gets the next new id. The id of the
+    n-th new document is computed on the fly (it is either ``offset + n`` or derived from a hash of ``n``), so memory usage does not
+    depend on the number of documents. Ids are generated in chunks with one random number per document and a fixed seed, so the same
+    client always produces the same sequence of ids.
+    """
+    # constants of the splitmix64 generator which we use to derive random ids from a position
+    _GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+    _MASK_64 = (1 << 64) - 1
+
+    def __init__(self, conflicts, docs_to_index, offset, conflict_probability=DEFAULT_CONFLICT_PROBABILITY,
+                 conflict_distribution=ConflictDistribution.Uniform, seed=None, chunk_size=10000):
+        """
+        :param conflicts: Either ``IndexIdConflict.SequentialConflicts`` or ``IndexIdConflict.RandomConflicts``.
+        :param docs_to_index: The number of documents that this client indexes.
+        :param offset: The id of the first document of this client.
+        :param conflict_probability: The probability in percent that a document replaces an already indexed one.
+        :param conflict_distribution: Determines which of the already indexed documents is replaced.
+        :param seed: The random seed. Defaults to ``offset`` so each client produces a different but reproducible sequence.
+        :param chunk_size: The number of ids that are generated in one go.
+        """
+        self.conflicts = conflicts
+        self.docs_to_index = docs_to_index
+        self.offset = offset
+        self.conflict_probability = conflict_probability / 100.0
+        self.conflict_distribution = conflict_distribution
+        self.seed = offset if seed is None else seed
+        self.rand = random.Random(self.seed)
+        self.chunk_size = chunk_size
+        self.remaining = docs_to_index
+        # number of new ids that have been handed out so far
+        self.id_up_to = 0
+        self.chunk = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunk)
+        except StopIteration:
+            if self.remaining == 0:
+                raise
+            self.chunk = iter(self._next_chunk(min(self.chunk_size, self.remaining)))
+            return next(self.chunk)
+
+    def id_at(self, position):
+        """
+        :param position: The position of a new document in the range [0, ``docs_to_index``).
+        :return: The numeric id of the document at this position.
+        """
+        if self.conflicts == IndexIdConflict.SequentialConflicts:
+            return self.offset + position
+        # RandomConflicts: any id in [offset, offset + docs_to_index] (inclusive) that is stable for this position
+        z = (self.seed + (position + 1) * ConflictingIds._GOLDEN_GAMMA) & ConflictingIds._MASK_64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & ConflictingIds._MASK_64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & ConflictingIds._MASK_64
+        return self.offset + (z ^ (z >> 31)) % (self.docs_to_index + 1)
+
+    def _next_chunk(self, size):
+        p = self.conflict_probability
+        zipfian = self.conflict_distribution == ConflictDistribution.Zipfian
+        id_at = self.id_at
+        id_up_to = self.id_up_to
+        rand = self.rand.random
+        ids = []
+        for u in [rand() for _ in range(size)]:
+            if id_up_to > 0 and u < p:
+                # u / p is again uniformly distributed in [0, 1) so we can use it to choose which document to replace
+                u /= p
+                if zipfian:
+                    # inverse transform sampling of a continuous approximation of Zipf's law with exponent 1 over the ranks
+                    # [1, id_up_to] where rank 1 is the document that has been indexed first.
+                    position = min(int((id_up_to + 1) ** u), id_up_to) - 1
+                else:
+                    position = int(u * id_up_to)
+            else:
+                position = id_up_to
+                id_up_to += 1
+            ids.append("%10d" % id_at(position))
+        self.id_up_to = id_up_to
+        self.remaining -= size
+        return ids
 
 
 def chain(*iterables):
@@ -317,11 +590,19 @@ def chain(*iterables):
                 yield element
 
 
-def create_default_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size, bulk_size, id_conflicts):
-    source = Slice(io.FileSource, offset, num_lines)
+def create_default_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size, bulk_size, id_conflicts,
+                          conflict_probability=DEFAULT_CONFLICT_PROBABILITY, conflict_distribution=ConflictDistribution.Uniform):
+    if not os.path.exists(type.document_file) and type.document_archive and io.has_block_index(type.document_archive):
+        # the archive has not been decompressed (see --stream-track-data) so we read from it directly
+        data_file = type.document_archive
+        source = CompressedSlice(offset, num_lines)
+    else:
+        data_file = type.document_file
+        source = MmapSlice(offset, num_lines)
 
     if action_metadata == ActionMetaData.Generate:
-        am_handler = GenerateActionMetaData(index, type, build_conflicting_ids(id_conflicts, num_docs, offset))
+        am_handler = GenerateActionMetaData(index, type, build_conflicting_ids(id_conflicts, num_docs, offset, conflict_probability,
+                                                                               conflict_distribution))
     elif action_metadata == ActionMetaData.NoMetaData:
         am_handler = NoneActionMetaData()
     elif action_metadata == ActionMetaData.SourceFile:
@@ -329,7 +610,28 @@ def create_default_reader(index, type, offset, num_lines, num_docs, action_metad
     else:
         raise RuntimeError("Missing action-meta-data handler implementation for %s" % action_metadata)
 
-    return IndexDataReader(type.document_file, batch_size, bulk_size, source, am_handler, index, type)
+    return MmapIndexDataReader(data_file, batch_size, bulk_size, source, am_handler, index, type)
+
+
+def create_caching_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size, bulk_size, id_conflicts,
+                          conflict_probability=DEFAULT_CONFLICT_PROBABILITY, conflict_distribution=ConflictDistribution.Uniform):
+    """
+    Creates a reader that reads bulk requests from the bulk cache if possible. Otherwise it creates bulk requests from the source file
+    and writes them to the bulk cache.
+    """
+    data_file = type.document_file if os.path.exists(type.document_file) else type.document_archive
+    # the bulk requests only depend on the data and on the part of the data that the client reads
+    key = "%r-%s-%s-%d-%d-%d-%s-%s-%s-%s" % (io.file_fingerprint(data_file), index, type, offset, num_lines, bulk_size,
+                                             action_metadata.name, id_conflicts.name if id_conflicts else None,
+                                             str(conflict_probability), conflict_distribution.name)
+    cache = BulkCache(os.path.join(os.path.dirname(type.document_file), "bulk-cache"), key)
+    if cache.exists():
+        logger.info("Reading bulk requests for [%s/%s] from [%s]." % (index, type, cache.segment_path))
+        return CachedIndexDataReader(cache, batch_size, bulk_size, index, type)
+    else:
+        logger.info("Writing bulk requests for [%s/%s] to [%s]." % (index, type, cache.segment_path))
+        return BulkCacheWriter(cache, create_default_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size,
+                                                            bulk_size, id_conflicts, conflict_probability, conflict_distribution))
 
 
 def bounds(total_docs, client_index, num_clients, action_metadata):
@@ -359,7 +661,8 @@ def bounds(total_docs, client_index, num_clients, action_metadata):
 
 
 def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_size, bulk_size, id_conflicts, pipeline,
-                    create_reader=create_default_reader):
+                    create_reader=create_default_reader, conflict_probability=DEFAULT_CONFLICT_PROBABILITY,
+                    conflict_distribution=ConflictDistribution.Uniform, compressor=None):
     """
     Calculates the necessary schedule for bulk operations.
 
@@ -373,6 +676,10 @@ def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_s
     :param pipeline: Name of the ingest pipeline to use. May be None.
     :param create_reader: A function to create the index reader. By default a file based index reader will be created. This parameter is
                           intended for testing only.
+    :param conflict_probability: The probability in percent that a document replaces an already indexed one if id conflicts are
+                                 simulated.
+    :param conflict_distribution: Determines which of the already indexed documents is replaced.
+    :param compressor: If provided, bulk bodies are compressed with this compressor (``compression.Compressor``). Optional.
     :return: A generator for the bulk operations of the given client.
     """
     readers = []
@@ -382,20 +689,26 @@ def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_s
             if num_docs > 0:
                 logger.info("Client [%d] will index [%d] docs starting from line offset [%d] for [%s/%s]" %
                             (client_index, num_docs, offset, index, type))
-                readers.append(create_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size, bulk_size, id_conflicts))
+                readers.append(create_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size, bulk_size, id_conflicts,
+                                             conflict_probability, conflict_distribution))
             else:
                 logger.info("Client [%d] skips [%s/%s] (no documents to read)." % (client_index, index, type))
     reader = chain(*readers)
     bulk_id = 0
     for index, type, batch in reader:
         # each batch can contain of one or more bulks
-        for bulk in batch:
+        for docs_in_bulk, bulk in batch:
             bulk_id += 1
+            if compressor and isinstance(bulk, (bytes, memoryview)):
+                # compress here so the timed section only needs to send the body
+                bulk = compressor.compress_body(bulk)
             params = {
                 "index": index,
                 "type": type,
                 "action_metadata_present": action_metadata != ActionMetaData.NoMetaData,
                 "body": bulk,
+                # the number of documents in this bulk so runners don't need to count them
+                "bulk-size": docs_in_bulk,
                 # a globally unique id for this bulk
                 "bulk-id": "%d-%d" % (client_index, bulk_id)
             }
@@ -413,24 +726,22 @@ class NoneActionMetaData:
 
 
 class GenerateActionMetaData:
-    def __init__(self, index_name, type_name, conflicting_ids, rand=random.randint):
+    def __init__(self, index_name, type_name, conflicting_ids):
+        """
+        :param index_name: The name of the index.
+        :param type_name: The name of the type.
+        :param conflicting_ids: An iterator over document ids (see ``ConflictingIds``) or ``None`` if ids should not be set.
+        """
         self.index_name = index_name
         self.type_name = type_name
         self.conflicting_ids = conflicting_ids
-        self.rand = rand
-        self.id_up_to = 0
 
     def __iter__(self):
         return self
 
     def __next__(self):
         if self.conflicting_ids is not None:
-            # 25% of the time we replace a doc:
-            if self.id_up_to > 0 and self.rand(0, 3) == 3:
-                doc_id = self.conflicting_ids[self.rand(0, self.id_up_to - 1)]
-            else:
-                doc_id = self.conflicting_ids[self.id_up_to]
-                self.id_up_to += 1
+            doc_id = next(self.conflicting_ids)
             return '{"index": {"_index": "%s", "_type": "%s", "_id": "%s"}}' % (self.index_name, self.type_name, doc_id)
         else:
             return '{"index": {"_index": "%s", "_type": "%s"}}' % (self.index_name, self.type_name)
@@ -447,51 +758,227 @@ class SourceActionMetaData:
         return next(self.source)
 
 
-class Slice:
-    def __init__(self, source_class, offset, number_of_lines):
-        self.source_class = source_class
-        self.source = None
+class MmapSlice:
+    """
+    Provides access to a range of lines of a file via a read-only memory map. It does not return lines but only their boundaries so callers
+    can copy arbitrary ranges of lines without creating an intermediate object per line.
+    """
+
+    def __init__(self, offset, number_of_lines):
         self.offset = offset
         self.number_of_lines = number_of_lines
+        self.file_name = None
+        self.file = None
+        self.mm = None
+        self.size = 0
+        self.position = 0
         self.current_line = 0
 
-    def open(self, file_name, mode):
-        self.source = self.source_class(file_name, mode).open()
-        # skip offset number of lines
+    def open(self, file_name, mode="rb"):
+        self.file_name = file_name
+        self.file = open(file_name, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        # empty files cannot be mapped
+        if self.size > 0:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
         logger.info("Skipping %d lines in [%s]." % (self.offset, file_name))
         start = time.perf_counter()
-        io.skip_lines(file_name, self.source, self.offset)
+        offset, remaining_lines = io.line_offset(file_name, self.offset)
+        self.position = self._skip(min(offset, self.size), remaining_lines)
         end = time.perf_counter()
         logger.info("Skipping %d lines took %f s." % (self.offset, end - start))
         return self
 
     def close(self):
-        self.source.close()
-        self.source = None
+        if self.mm:
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+        self.file = None
+
+    def _skip(self, position, number_of_lines):
+        for _ in range(number_of_lines):
+            if position >= self.size:
+                break
+            line_end = self.mm.find(b"\n", position)
+            position = self.size if line_end == -1 else line_end + 1
+        return position
 
-    def __iter__(self):
+    def next_lines(self, number_of_lines):
+        """
+        Advances by up to ``number_of_lines`` lines.
+
+        :param number_of_lines: The maximum number of lines to advance.
+        :return: A tuple (start, end, lines) with the byte range of the lines (including line terminators) and the number of lines in
+                 this range. ``lines`` is zero when the end of the slice is reached.
+        """
+        start = self.position
+        lines = 0
+        position = start
+        max_lines = min(number_of_lines, self.number_of_lines - self.current_line)
+        while lines < max_lines and position < self.size:
+            line_end = self.mm.find(b"\n", position)
+            position = self.size if line_end == -1 else line_end + 1
+            lines += 1
+        self.position = position
+        self.current_line += lines
+        return start, position, lines
+
+    @property
+    def buffer(self):
+        """
+        :return: The buffer to which the positions returned by ``next_lines`` refer.
+        """
+        return self.mm
+
+    def __str__(self):
+        return "%s[%d;%d]" % (self.file_name, self.offset, self.offset + self.number_of_lines)
+
+
+class CompressedSlice:
+    """
+    Provides access to a range of lines of a compressed archive with a block index (see ``io.prepare_block_index``). It starts reading at
+    the block that contains the first line of the slice and decompresses blocks on the fly in a background thread. It implements the same
+    interface as ``MmapSlice``.
+    """
+
+    def __init__(self, offset, number_of_lines, prefetch_blocks=2):
+        """
+        :param offset: The number of lines to skip.
+        :param number_of_lines: The number of lines in this slice.
+        :param prefetch_blocks: The maximum number of blocks that are decompressed ahead.
+        """
+        self.offset = offset
+        self.number_of_lines = number_of_lines
+        self.prefetch_blocks = prefetch_blocks
+        self.file_name = None
+        self.blocks = None
+        self.stopped = None
+        self.decompressor = None
+        self.exhausted = False
+        self.buffer = b""
+        self.position = 0
+        self.current_line = 0
+
+    def open(self, file_name, mode="rb"):
+        self.file_name = file_name
+        blocks = io.read_block_index(file_name)
+        newlines_before_block = [newlines for _, _, newlines in blocks]
+        # the first line of the slice starts after the line terminator with the number ``offset``
+        first_block = max(bisect.bisect_left(newlines_before_block, self.offset) - 1, 0)
+        logger.info("Starting to read [%s] at block [%d] of [%d]." % (file_name, first_block, len(blocks)))
+        self.blocks = queue.Queue(maxsize=self.prefetch_blocks)
+        self.stopped = threading.Event()
+        self.exhausted = False
+        self.decompressor = threading.Thread(target=self._decompress, args=(blocks[first_block:],), name="decompressor", daemon=True)
+        self.decompressor.start()
+        self._skip(self.offset - newlines_before_block[first_block] if blocks else self.offset)
         return self
 
-    def __next__(self):
-        if self.current_line >= self.number_of_lines:
-            raise StopIteration()
-        else:
-            self.current_line += 1
-            line = self.source.readline()
-            if len(line) == 0:
-                raise StopIteration()
-            return line.strip()
+    def close(self):
+        self.stopped.set()
+        # unblock the decompressor
+        try:
+            while True:
+                self.blocks.get_nowait()
+        except queue.Empty:
+            pass
+        self.decompressor.join()
+        self.buffer = b""
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decompress(self, blocks):
+        try:
+            with open(self.file_name, mode="rb") as archive:
+                for offset, size, _ in blocks:
+                    archive.seek(offset)
+                    if not self._put(io.decompress_block(self.file_name, archive.read(size))):
+                        return
+        except BaseException as e:
+            logger.exception("Could not decompress [%s]." % self.file_name)
+            self._put(e)
+        self._put(None)
+
+    def _next_block(self, keep_remainder):
+        if self.exhausted:
+            return False
+        block = self.blocks.get()
+        if block is None:
+            self.exhausted = True
+            return False
+        if isinstance(block, BaseException):
+            self.exhausted = True
+            raise block
+        remainder = self.buffer[self.position:] if keep_remainder else b""
+        self.buffer = remainder + block if remainder else block
+        self.position = 0
+        return True
+
+    def _skip(self, number_of_lines):
+        while number_of_lines > 0:
+            line_end = self.buffer.find(b"\n", self.position)
+            if line_end == -1:
+                if not self._next_block(keep_remainder=False):
+                    return
+            else:
+                self.position = line_end + 1
+                number_of_lines -= 1
+
+    def next_lines(self, number_of_lines):
+        """
+        Advances by up to ``number_of_lines`` lines. Contrary to ``MmapSlice`` this may return fewer lines than requested even if the
+        end of the slice is not reached yet.
+
+        :param number_of_lines: The maximum number of lines to advance.
+        :return: A tuple (start, end, lines) with the range of the lines in ``buffer`` (including line terminators) and the number of
+                 lines in this range. ``lines`` is zero when the end of the slice is reached.
+        """
+        max_lines = min(number_of_lines, self.number_of_lines - self.current_line)
+        if max_lines <= 0:
+            return self.position, self.position, 0
+        while True:
+            if self.position >= len(self.buffer) and not self._next_block(keep_remainder=False):
+                return self.position, self.position, 0
+            start = self.position
+            position = start
+            lines = 0
+            while lines < max_lines:
+                line_end = self.buffer.find(b"\n", position)
+                if line_end == -1:
+                    break
+                position = line_end + 1
+                lines += 1
+            if lines > 0:
+                self.position = position
+                self.current_line += lines
+                return start, position, lines
+            # the current line continues in the next block
+            if not self._next_block(keep_remainder=True):
+                # the last line of the archive is not terminated
+                start = self.position
+                self.position = len(self.buffer)
+                self.current_line += 1
+                return start, self.position, 1
 
     def __str__(self):
-        return "%s[%d;%d]" % (self.source, self.offset, self.offset + self.number_of_lines)
+        return "%s[%d;%d]" % (self.file_name, self.offset, self.offset + self.number_of_lines)
 
 
-class IndexDataReader:
+class MmapIndexDataReader:
     """
-    Reads a file in bulks into an array and also adds a meta-data line before each document if necessary.
+    Reads a memory-mapped file (or a compressed archive, see ``CompressedSlice``) in bulks and provides each bulk as a tuple (number of
+    documents, body) where the body is one contiguous ``bytes`` object in the format of the bulk API.
 
-    This implementation also supports batching. This means that you can specify batch_size = N * bulk_size, where N is any natural
-    number >= 1. This makes file reading more efficient for small bulk sizes.
+    If action and meta-data lines are generated, they are interleaved with the documents while copying them from the memory map.
+    Otherwise the lines of a bulk are contiguous in the file and copied in one go. Either way, no object is created per document line.
     """
 
     def __init__(self, data_file, batch_size, bulk_size, file_source, action_metadata, index_name, type_name):
@@ -500,11 +987,14 @@ class IndexDataReader:
         self.bulk_size = bulk_size
         self.file_source = file_source
         self.action_metadata = action_metadata
+        self.generate_action_metadata = isinstance(action_metadata, GenerateActionMetaData)
+        # the source file contains an action and meta-data line for each document
+        self.lines_per_doc = 2 if isinstance(action_metadata, SourceActionMetaData) else 1
         self.index_name = index_name
         self.type_name = type_name
 
     def __enter__(self):
-        self.file_source.open(self.data_file, 'rt')
+        self.file_source.open(self.data_file, "rb")
         return self
 
     def __iter__(self):
@@ -512,7 +1002,7 @@ class IndexDataReader:
 
     def __next__(self):
         """
-        Returns lines for N bulk requests (where N is bulk_size / batch_size)
+        Returns N bulk requests (where N is bulk_size / batch_size)
         """
         batch = []
         try:
@@ -522,7 +1012,7 @@ class IndexDataReader:
                 if docs_in_bulk == 0:
                     break
                 docs_in_batch += docs_in_bulk
-                batch.append(bulk)
+                batch.append((docs_in_bulk, bulk))
             if docs_in_batch == 0:
                 raise StopIteration()
             logger.debug("Returning a batch with %d bulks." % len(batch))
@@ -531,25 +1021,197 @@ class IndexDataReader:
             logger.exception("Could not read [%s]" % self.data_file)
 
     def read_bulk(self):
+        if self.generate_action_metadata:
+            return self._read_bulk_with_generated_action_metadata()
+        parts = []
+        lines_in_bulk = 0
+        lines_to_read = self.bulk_size * self.lines_per_doc
+        # sources may return fewer lines than requested (e.g. at block boundaries)
+        while lines_in_bulk < lines_to_read:
+            start, end, lines = self.file_source.next_lines(lines_to_read - lines_in_bulk)
+            if lines == 0:
+                break
+            parts.append(self.file_source.buffer[start:end])
+            lines_in_bulk += lines
+        if lines_in_bulk == 0:
+            return 0, b""
+        body = parts[0] if len(parts) == 1 else b"".join(parts)
+        if not body.endswith(b"\n"):
+            body += b"\n"
+        return lines_in_bulk // self.lines_per_doc, body
+
+    def _read_bulk_with_generated_action_metadata(self):
+        parts = []
+        views = []
+        current_buffer = None
+        current_view = None
         docs_in_bulk = 0
-        current_bulk = []
-
-        for action_metadata_line, document in zip(self.action_metadata, self.file_source):
-            if action_metadata_line:
-                current_bulk.append(action_metadata_line)
-            current_bulk.append(document)
-            docs_in_bulk += 1
-            if docs_in_bulk == self.bulk_size:
+        # action and meta-data lines are often identical so we encode them only once
+        previous_action_metadata_line = None
+        encoded_action_metadata_line = None
+        while docs_in_bulk < self.bulk_size:
+            start, end, lines = self.file_source.next_lines(1)
+            if lines == 0:
                 break
-        return docs_in_bulk, current_bulk
+            if self.file_source.buffer is not current_buffer:
+                current_buffer = self.file_source.buffer
+                current_view = memoryview(current_buffer)
+                views.append(current_view)
+            action_metadata_line = next(self.action_metadata)
+            if action_metadata_line != previous_action_metadata_line:
+                previous_action_metadata_line = action_metadata_line
+                encoded_action_metadata_line = action_metadata_line.encode("utf-8") + b"\n"
+            parts.append(encoded_action_metadata_line)
+            parts.append(current_view[start:end])
+            docs_in_bulk += 1
+        body = b"".join(parts)
+        # the memory map can only be closed after all views on it have been released
+        del parts
+        for view in views:
+            view.release()
+        if docs_in_bulk == 0:
+            return 0, b""
+        if not body.endswith(b"\n"):
+            body += b"\n"
+        return docs_in_bulk, body
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.file_source.close()
         return False
 
 
+class BulkCache:
+    """
+    Stores fully-formed bulk requests on disk. The cache consists of a segment file with all bulk bodies and an index file with the
+    offset, length and number of documents of each bulk body in the segment file.
+    """
+    # number of entries per bulk in the index file
+    INDEX_ENTRIES = 3
+
+    def __init__(self, cache_dir, key):
+        """
+        :param cache_dir: The directory in which cache files are stored.
+        :param key: A key that uniquely identifies the contents of this cache.
+        """
+        self.cache_dir = cache_dir
+        # the file layout is part of the name so caches in an older layout are not read
+        name = hashlib.sha1(("%d-%s" % (BulkCache.INDEX_ENTRIES, key)).encode("utf-8")).hexdigest()
+        self.segment_path = os.path.join(cache_dir, "%s.bulks" % name)
+        self.index_path = os.path.join(cache_dir, "%s.bulks.idx" % name)
+
+    def exists(self):
+        # the index is written last
+        return os.path.exists(self.index_path) and os.path.exists(self.segment_path)
+
+
+class BulkCacheWriter:
+    """
+    Wraps a reader and writes all bulk requests that it returns to the bulk cache. The cache is only persisted if the wrapped reader is
+    read completely.
+    """
+
+    def __init__(self, cache, reader):
+        self.cache = cache
+        self.reader = reader
+        self.index = array.array("Q")
+        self.segment = None
+        self.tmp_segment_path = "%s.%d.tmp" % (cache.segment_path, os.getpid())
+        self.complete = False
+
+    def __enter__(self):
+        io.ensure_dir(self.cache.cache_dir)
+        self.reader.__enter__()
+        self.segment = open(self.tmp_segment_path, mode="wb")
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            index, type, batch = next(self.reader)
+        except StopIteration:
+            self.complete = True
+            raise
+        for docs_in_bulk, bulk in batch:
+            self.index.append(self.segment.tell())
+            self.index.append(len(bulk))
+            self.index.append(docs_in_bulk)
+            self.segment.write(bulk)
+        return index, type, batch
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.segment.close()
+        self.reader.__exit__(exc_type, exc_val, exc_tb)
+        if self.complete and exc_type is None:
+            tmp_index_path = "%s.%d.tmp" % (self.cache.index_path, os.getpid())
+            index = array.array("Q", self.index)
+            if sys.byteorder != "little":
+                index.byteswap()
+            with open(tmp_index_path, mode="wb") as index_file:
+                index.tofile(index_file)
+            os.replace(self.tmp_segment_path, self.cache.segment_path)
+            os.replace(tmp_index_path, self.cache.index_path)
+        else:
+            # we have not seen all bulk requests (e.g. a time-based benchmark has ended)
+            logger.info("Discarding incomplete bulk cache [%s]." % self.tmp_segment_path)
+            os.remove(self.tmp_segment_path)
+        return False
+
+
+class CachedIndexDataReader:
+    """
+    Reads bulk requests from the bulk cache. It provides the same interface as ``MmapIndexDataReader``.
+    """
+
+    def __init__(self, cache, batch_size, bulk_size, index_name, type_name):
+        self.cache = cache
+        self.bulks_per_batch = max(batch_size // bulk_size, 1)
+        self.index_name = index_name
+        self.type_name = type_name
+        self.file = None
+        self.mm = None
+        self.index = None
+        self.current_bulk = 0
+
+    def __enter__(self):
+        self.index = array.array("Q")
+        with open(self.cache.index_path, mode="rb") as index_file:
+            self.index.frombytes(index_file.read())
+        if sys.byteorder != "little":
+            self.index.byteswap()
+        self.file = open(self.cache.segment_path, mode="rb")
+        if os.fstat(self.file.fileno()).st_size > 0:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.current_bulk = 0
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        number_of_bulks = len(self.index) // BulkCache.INDEX_ENTRIES
+        if self.current_bulk >= number_of_bulks:
+            raise StopIteration()
+        batch = []
+        for i in range(self.current_bulk, min(self.current_bulk + self.bulks_per_batch, number_of_bulks)):
+            offset, length, docs_in_bulk = self.index[BulkCache.INDEX_ENTRIES * i:BulkCache.INDEX_ENTRIES * (i + 1)]
+            batch.append((docs_in_bulk, self.mm[offset:offset + length]))
+        self.current_bulk += len(batch)
+        return self.index_name, self.type_name, batch
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.mm:
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+        self.file = None
+        return False
+
+
 register_param_source_for_operation(track.OperationType.Index, BulkIndexParamSource)
 register_param_source_for_operation(track.OperationType.Search, SearchParamSource)
+register_param_source_for_operation(track.OperationType.MultiSearch, MultiSearchParamSource)
 
 # Also register by name, so users can use it too
 register_param_source_for_name("file-reader", BulkIndexParamSource)
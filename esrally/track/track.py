@@ -268,7 +268,8 @@ class OperationType(Enum):
     ForceMerge = 1,
     IndicesStats = 2,
     NodesStats = 3,
-    Search = 4
+    Search = 4,
+    MultiSearch = 5
 
     @classmethod
     def from_hyphenated_string(cls, v):
@@ -282,6 +283,8 @@ class OperationType(Enum):
             return OperationType.NodesStats
         elif v == "search":
             return OperationType.Search
+        elif v == "msearch":
+            return OperationType.MultiSearch
         else:
             raise KeyError("No enum value for [%s]" % v)
 
@@ -323,7 +326,7 @@ class Parallel:
 
 class Task:
     def __init__(self, operation, meta_data=None, warmup_iterations=0, iterations=1, warmup_time_period=None, time_period=None, clients=1,
-                 target_throughput=None):
+                 target_throughput=None, schedule=None, schedule_params=None, throughput_search=None):
         self.operation = operation
         self.meta_data = meta_data if meta_data else {}
         self.warmup_iterations = warmup_iterations
@@ -332,16 +335,23 @@ class Task:
         self.time_period = time_period
         self.clients = clients
         self.target_throughput = target_throughput
+        # name of the scheduler that determines when requests are issued; None means a fixed interval if a target throughput is defined
+        self.schedule = schedule
+        self.schedule_params = schedule_params if schedule_params else {}
+        # the throughput search this task is a probe of (if any)
+        self.throughput_search = throughput_search
 
     def __hash__(self):
         return hash(self.operation) ^ hash(self.warmup_iterations) ^ hash(self.iterations) ^ hash(self.warmup_time_period) ^ \
-               hash(self.time_period) ^ hash(self.clients) ^ hash(self.target_throughput)
+               hash(self.time_period) ^ hash(self.clients) ^ hash(self.target_throughput) ^ hash(self.schedule)
 
     def __eq__(self, other):
         return isinstance(other, type(self)) and (self.operation, self.warmup_iterations, self.iterations, self.warmup_time_period, 
-                                                  self.time_period, self.clients, self.target_throughput) == \
+                                                  self.time_period, self.clients, self.target_throughput, self.schedule,
+                                                  self.schedule_params) == \
                                                  (other.operation, other.warmup_iterations, other.iterations, other.warmup_time_period,
-                                                  other.time_period, other.clients, other.target_throughput)
+                                                  other.time_period, other.clients, other.target_throughput, other.schedule,
+                                                  other.schedule_params)
 
     def __iter__(self):
         return iter([self])
@@ -356,6 +366,53 @@ class Task:
         return ", ".join(r)
 
 
+class ThroughputSearch:
+    """
+    Describes the search for the maximum throughput of an operation that still satisfies a latency and error rate objective. The search
+    is run as a sequence of tasks ("probes") with increasing target throughput that stops after the first probe that violates the
+    objective.
+    """
+
+    def __init__(self, operation, target_throughputs, max_latency, latency_percentile=99, max_error_rate=None):
+        """
+        :param operation: The operation that is searched.
+        :param target_throughputs: The target throughputs of all probes in ascending order.
+        :param max_latency: The highest acceptable latency in ms at ``latency_percentile``.
+        :param latency_percentile: The latency percentile that is checked. Default: 99.
+        :param max_error_rate: The highest acceptable error rate in the range [0, 1]. ``None`` if errors should not be checked.
+        """
+        self.operation = operation
+        self.target_throughputs = target_throughputs
+        self.max_latency = max_latency
+        self.latency_percentile = latency_percentile
+        self.max_error_rate = max_error_rate
+
+    @property
+    def name(self):
+        return self.operation.name
+
+    def probe_name(self, target_throughput):
+        return "%s@%s" % (self.name, "{:g}".format(target_throughput))
+
+    def __hash__(self):
+        return hash(self.operation)
+
+    def __eq__(self, other):
+        return isinstance(other, type(self)) and (self.operation, self.target_throughputs, self.max_latency, self.latency_percentile,
+                                                  self.max_error_rate) == \
+                                                 (other.operation, other.target_throughputs, other.max_latency, other.latency_percentile,
+                                                  other.max_error_rate)
+
+    def __str__(self, *args, **kwargs):
+        return "Throughput search for [%s]" % self.name
+
+    def __repr__(self):
+        r = []
+        for prop, value in vars(self).items():
+            r.append("%s = [%s]" % (prop, repr(value)))
+        return ", ".join(r)
+
+
 class Operation:
     def __init__(self, name, operation_type, meta_data=None, params=None, param_source=None):
         if params is None:
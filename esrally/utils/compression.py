@@ -0,0 +1,82 @@
+import time
+import zlib
+
+# HTTP content encoding -> zlib window bits (see zlib.compressobj)
+ALGORITHMS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS
+}
+
+DEFAULT_ALGORITHM = "gzip"
+# same as gzip.compress()
+DEFAULT_LEVEL = 9
+
+
+class CompressedBody(bytes):
+    """
+    A request body that has already been compressed. It is sent as is with the corresponding ``Content-Encoding`` header.
+    """
+
+    def __new__(cls, data, content_encoding, uncompressed_size, line_count, compression_time):
+        """
+        :param data: The compressed data.
+        :param content_encoding: The HTTP content encoding of ``data``, e.g. "gzip".
+        :param uncompressed_size: The size of the uncompressed body in bytes.
+        :param line_count: The number of lines of the uncompressed body.
+        :param compression_time: The time in seconds it took to compress the body.
+        """
+        body = super().__new__(cls, data)
+        body.content_encoding = content_encoding
+        body.uncompressed_size = uncompressed_size
+        body.line_count = line_count
+        body.compression_time = compression_time
+        return body
+
+    def __reduce__(self):
+        return CompressedBody, (bytes(self), self.content_encoding, self.uncompressed_size, self.line_count, self.compression_time)
+
+
+class Compressor:
+    """
+    Compresses request bodies with a configurable algorithm and compression level.
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, level=DEFAULT_LEVEL):
+        """
+        :param algorithm: The name of the HTTP content encoding. Either "gzip" or "deflate". Default: "gzip".
+        :param level: The compression level in the range [0, 9]. Lower levels are faster but compress less. Default: 9.
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError("Unknown compression algorithm [%s]. Valid values are %s." % (algorithm, sorted(ALGORITHMS.keys())))
+        if not isinstance(level, int) or level < 0 or level > 9:
+            raise ValueError("Compression level must be an integer in the range [0, 9] but was [%s]." % str(level))
+        self.content_encoding = algorithm
+        self.level = level
+        self.wbits = ALGORITHMS[algorithm]
+
+    def compress(self, body):
+        """
+        :param body: The body to compress (``bytes`` or ``memoryview``).
+        :return: The compressed body as ``bytes``.
+        """
+        c = zlib.compressobj(self.level, zlib.DEFLATED, self.wbits)
+        return c.compress(body) + c.flush()
+
+    def compress_body(self, body):
+        """
+        Compresses a body and records statistics about it.
+
+        :param body: The body to compress (``bytes`` or ``memoryview``).
+        :return: A ``CompressedBody``.
+        """
+        if isinstance(body, CompressedBody):
+            return body
+        if isinstance(body, memoryview):
+            body = body.tobytes()
+        start = time.perf_counter()
+        data = self.compress(body)
+        compression_time = time.perf_counter() - start
+        return CompressedBody(data, self.content_encoding, len(body), body.count(b"\n"), compression_time)
+
+    def __repr__(self):
+        return "%s (level %d)" % (self.content_encoding, self.level)
@@ -0,0 +1,147 @@
+import math
+
+
+class HdrHistogram:
+    """
+    A high dynamic range (HDR) histogram that records values with a fixed number of significant decimal digits.
+
+    The bucketing scheme follows http://hdrhistogram.org: values are mapped to logarithmically growing buckets which are linearly
+    subdivided so that the relative error of each bucket is bounded by the requested number of significant digits. In contrast to the
+    reference implementation, counts are kept in a sparse dict so there is no upper bound for trackable values and memory usage only
+    depends on the number of distinct buckets.
+
+    For each bucket we also remember the highest recorded value. Hence, percentiles are always values that have actually been recorded
+    and they are exact if a bucket contains only identical values.
+
+    Histograms with the same configuration can be merged, e.g. across load generators or laps.
+    """
+
+    def __init__(self, significant_figures=3, resolution=0.001):
+        """
+        :param significant_figures: The number of significant decimal digits to which the histogram maintains value resolution. Must
+                                    be in the range [1, 5]. Default: 3.
+        :param resolution: The smallest value that should be distinguishable from zero. Default: 0.001 (e.g. microseconds if values
+                           are recorded in milliseconds).
+        """
+        if significant_figures < 1 or significant_figures > 5:
+            raise ValueError("significant_figures must be in the range [1, 5] but was [%s]" % str(significant_figures))
+        if resolution <= 0:
+            raise ValueError("resolution must be positive but was [%s]" % str(resolution))
+        self.significant_figures = significant_figures
+        self.resolution = resolution
+        largest_value_with_single_unit_resolution = 2 * math.pow(10, significant_figures)
+        sub_bucket_count_magnitude = int(math.ceil(math.log(largest_value_with_single_unit_resolution, 2)))
+        self._sub_bucket_half_count_magnitude = max(sub_bucket_count_magnitude, 1) - 1
+        self._sub_bucket_count = 1 << (self._sub_bucket_half_count_magnitude + 1)
+        self._sub_bucket_half_count = self._sub_bucket_count // 2
+        self._sub_bucket_mask = self._sub_bucket_count - 1
+        # counts index -> number of recorded values
+        self.counts = {}
+        # counts index -> highest recorded value
+        self.highest_values = {}
+        self.total_count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def _counts_index(self, value):
+        v = int(value / self.resolution)
+        bucket_index = (v | self._sub_bucket_mask).bit_length() - (self._sub_bucket_half_count_magnitude + 1)
+        sub_bucket_index = v >> bucket_index
+        return (bucket_index << self._sub_bucket_half_count_magnitude) + sub_bucket_index
+
+    def record_value(self, value, count=1):
+        """
+        Records a value.
+
+        :param value: A non-negative value.
+        :param count: The number of times this value should be recorded. Default: 1.
+        """
+        if value < 0:
+            raise ValueError("Cannot record negative value [%s]" % str(value))
+        idx = self._counts_index(value)
+        self.counts[idx] = self.counts.get(idx, 0) + count
+        highest = self.highest_values.get(idx)
+        if highest is None or value > highest:
+            self.highest_values[idx] = value
+        self.total_count += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Adds all values of another histogram to this one.
+
+        :param other: A histogram with the same configuration.
+        :return: This histogram.
+        """
+        if other.significant_figures != self.significant_figures or other.resolution != self.resolution:
+            raise ValueError("Cannot merge histograms with different configurations.")
+        for idx, count in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + count
+            highest = self.highest_values.get(idx)
+            other_highest = other.highest_values[idx]
+            if highest is None or other_highest > highest:
+                self.highest_values[idx] = other_highest
+        self.total_count += other.total_count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.total_count if self.total_count > 0 else None
+
+    def value_at_percentile(self, percentile):
+        """
+        :param percentile: A percentile in the range [0, 100].
+        :return: The (highest recorded) value at the given percentile or None if no values have been recorded.
+        """
+        if self.total_count == 0:
+            return None
+        percentile = min(max(float(percentile), 0.0), 100.0)
+        # same rounding as the reference implementation
+        count_at_percentile = max(int(percentile / 100.0 * self.total_count + 0.5), 1)
+        running_count = 0
+        for idx in sorted(self.counts.keys()):
+            running_count += self.counts[idx]
+            if running_count >= count_at_percentile:
+                return self.highest_values[idx]
+        return self.max
+
+    def to_dict(self):
+        """
+        :return: A JSON-serializable representation of this histogram (see ``from_dict``).
+        """
+        return {
+            "significant-figures": self.significant_figures,
+            "resolution": self.resolution,
+            "total-count": self.total_count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            # counts index, number of recorded values, highest recorded value
+            "counts": [[idx, count, self.highest_values[idx]] for idx, count in sorted(self.counts.items())]
+        }
+
+    @staticmethod
+    def from_dict(d):
+        """
+        :param d: A dict that has been created with ``to_dict``.
+        :return: A new histogram with the same contents.
+        """
+        h = HdrHistogram(significant_figures=d["significant-figures"], resolution=d["resolution"])
+        for idx, count, highest in d["counts"]:
+            h.counts[idx] = count
+            h.highest_values[idx] = highest
+        h.total_count = d["total-count"]
+        h.sum = d["sum"]
+        h.min = d["min"]
+        h.max = d["max"]
+        return h
@@ -1,13 +1,21 @@
+import array
+import collections
+import concurrent.futures
+import hashlib
 import os
 import errno
 import re
+import struct
+import sys
 import subprocess
 import bz2
 import gzip
 import zipfile
 import tarfile
+import zlib
 import logging
 
+from esrally import exceptions
 from esrally.utils import console
 
 logger = logging.getLogger("rally.utils.io")
@@ -142,7 +150,7 @@ def compress(source_directory, archive_name):
     _zipdir(source_directory, archive)
 
 
-def decompress(zip_name, target_directory):
+def decompress(zip_name, target_directory, offset_table_interval=None, threads=1):
     """
     Decompresses the provided archive to the target directory. The following file extensions are supported:
 
@@ -159,29 +167,157 @@ def decompress(zip_name, target_directory):
     :param zip_name: The full path name to the file that should be decompressed.
     :param target_directory: The directory to which files should be decompressed. May or may not exist prior to calling
     this function.
+    :param offset_table_interval: If provided, a file offset table with this interval is created for the decompressed file while
+    decompressing it (only supported for bz2 and gz). Optional.
+    :param threads: The maximum number of threads that should be used to decompress bz2 files. Multiple threads are only used for
+    bz2 files that consist of multiple streams (e.g. created by pbzip2 or lbzip2). Default: 1.
+    :return: True iff a file offset table has been created.
     """
     path_without_extension, extension = splitext(zip_name)
     filename = basename(path_without_extension)
     if extension == ".zip":
         _do_decompress(target_directory, zipfile.ZipFile(zip_name))
     elif extension == ".bz2":
-        _do_decompress_manually(target_directory, filename, bz2.open(zip_name))
+        stream_offsets = find_bz2_streams(zip_name) if threads > 1 else []
+        if len(stream_offsets) > 1:
+            try:
+                return _do_decompress_manually(target_directory, filename, ParallelBz2File(zip_name, stream_offsets, threads),
+                                               offset_table_interval)
+            except ParallelDecompressionError:
+                logger.exception("Could not decompress [%s] in parallel. Falling back to sequential decompression." % zip_name)
+        return _do_decompress_manually(target_directory, filename, bz2.open(zip_name), offset_table_interval)
     elif extension == ".gz":
-        _do_decompress_manually(target_directory, filename, gzip.open(zip_name))
+        return _do_decompress_manually(target_directory, filename, gzip.open(zip_name), offset_table_interval)
     elif extension in [".tar", ".tar.gz", ".tgz", ".tar.bz2"]:
         _do_decompress(target_directory, tarfile.open(zip_name))
     else:
         raise RuntimeError("Unsupported file extension [%s]. Cannot decompress [%s]" % (extension, zip_name))
+    return False
 
 
-def _do_decompress_manually(target_directory, filename, compressed_file):
+def _do_decompress_manually(target_directory, filename, compressed_file, offset_table_interval=None):
     ensure_dir(target_directory)
+    target_path = "%s/%s" % (target_directory, filename)
+    offset_table = OffsetTableBuilder(offset_table_interval) if offset_table_interval else None
     try:
-        with open("%s/%s" % (target_directory, filename), 'wb') as new_file:
+        with open(target_path, 'wb') as new_file:
             for data in iter(lambda: compressed_file.read(100 * 1024), b''):
                 new_file.write(data)
+                if offset_table:
+                    offset_table.update(data)
     finally:
         compressed_file.close()
+    if offset_table:
+        offset_table.write(target_path)
+        return True
+    return False
+
+
+# magic bytes at the start of each bz2 stream ("BZh", block size, magic number of the first block)
+BZ2_STREAM_HEADER = re.compile(b"BZh[1-9]\x31\x41\x59\x26\x53\x59")
+
+
+def find_bz2_streams(file_name, chunk_size=16 * 1024 * 1024):
+    """
+    Finds the start offsets of all streams in a bz2 file.
+
+    Note that the stream header may also occur by chance in compressed data so offsets may be wrong. ``ParallelBz2File`` detects this.
+
+    :param file_name: The path to a bz2 file.
+    :param chunk_size: The number of bytes to scan at once.
+    :return: A list of candidate offsets of streams in the file.
+    """
+    offsets = []
+    # overlap chunks so we also find headers that cross chunk boundaries
+    overlap = 9
+    with open(file_name, mode="rb") as f:
+        position = 0
+        previous_tail = b""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data = previous_tail + chunk
+            data_start = position - len(previous_tail)
+            for match in BZ2_STREAM_HEADER.finditer(data):
+                offset = data_start + match.start()
+                if not offsets or offsets[-1] < offset:
+                    offsets.append(offset)
+            position += len(chunk)
+            previous_tail = data[-overlap:]
+    return offsets
+
+
+class ParallelDecompressionError(IOError):
+    pass
+
+
+def _decompress_bz2_streams(data, offset):
+    result = []
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        try:
+            result.append(decompressor.decompress(data))
+        except (OSError, EOFError) as e:
+            raise ParallelDecompressionError("Could not decompress bz2 stream at offset [%d]: %s" % (offset, str(e)))
+        if not decompressor.eof:
+            raise ParallelDecompressionError("Incomplete bz2 stream at offset [%d]." % offset)
+        data = decompressor.unused_data
+    return b"".join(result)
+
+
+class ParallelBz2File:
+    """
+    Decompresses a bz2 file that consists of multiple streams with multiple threads. It can be read like a file but returns
+    decompressed data in arbitrarily sized chunks (one per stream) in the original order.
+
+    This works because the bz2 module releases the GIL while decompressing.
+    """
+
+    def __init__(self, file_name, stream_offsets, threads):
+        """
+        :param file_name: The path to a bz2 file.
+        :param stream_offsets: A sorted list of all stream offsets (see ``find_bz2_streams``).
+        :param threads: The number of threads to use.
+        """
+        self.f = open(file_name, mode="rb")
+        self.f.seek(0, os.SEEK_END)
+        self.offsets = stream_offsets + [self.f.tell()]
+        if stream_offsets[0] != 0:
+            self.f.close()
+            raise ParallelDecompressionError("[%s] does not start with a bz2 stream." % file_name)
+        self.threads = threads
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.pending = collections.deque()
+        self.next_stream = 0
+
+    def _submit(self):
+        # bound the number of pending streams to limit memory usage
+        while len(self.pending) < 2 * self.threads and self.next_stream < len(self.offsets) - 1:
+            start = self.offsets[self.next_stream]
+            end = self.offsets[self.next_stream + 1]
+            self.f.seek(start)
+            self.pending.append(self.executor.submit(_decompress_bz2_streams, self.f.read(end - start), start))
+            self.next_stream += 1
+
+    def read(self, size=-1):
+        """
+        :param size: Ignored. Returns the decompressed contents of the next stream.
+        :return: The next chunk of decompressed data or an empty byte string at the end of the file.
+        """
+        while True:
+            self._submit()
+            if not self.pending:
+                return b""
+            data = self.pending.popleft().result()
+            if data:
+                return data
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown()
+        self.f.close()
 
 
 def _do_decompress(target_directory, compressed_file):
@@ -226,30 +362,347 @@ def splitext(file_name):
         return os.path.splitext(file_name)
 
 
-def prepare_file_offset_table(data_file_path):
+# Layout of the binary file offset table (all numbers little endian):
+#
+# header: magic (8 bytes), format version (uint32), interval (uint32), number of lines (uint64), fingerprint of the data file (32 bytes)
+# body:   one uint64 per entry with the byte offset of line number ``i * interval`` (starting at line zero)
+OFFSET_TABLE_MAGIC = b"RLYOFFST"
+OFFSET_TABLE_VERSION = 1
+OFFSET_TABLE_HEADER = struct.Struct("<8sIIQ32s")
+OFFSET_TABLE_ENTRY = struct.Struct("<Q")
+DEFAULT_OFFSET_TABLE_INTERVAL = 50000
+# number of bytes at the start and at the end of the data file that are considered for its fingerprint
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def file_fingerprint(data_file_path):
+    """
+    Calculates a cheap fingerprint of a file based on its size, its modification time and a hash of its first and last bytes (so we don't
+    need to read large files completely). The modification time catches in-place changes in the middle of a file that keep its size. As
+    a consequence, merely touching a file (or copying it without preserving timestamps) changes its fingerprint as well.
+
+    :param data_file_path: The path to a file that is readable by this process.
+    :return: A 32 bytes fingerprint.
+    """
+    stat = os.stat(data_file_path)
+    size = stat.st_size
+    h = hashlib.sha256()
+    h.update(("%d-%d" % (size, stat.st_mtime_ns)).encode("ascii"))
+    with open(data_file_path, mode="rb") as f:
+        h.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+        if size > FINGERPRINT_SAMPLE_SIZE:
+            f.seek(max(size - FINGERPRINT_SAMPLE_SIZE, FINGERPRINT_SAMPLE_SIZE))
+            h.update(f.read())
+    return h.digest()
+
+
+def _read_offset_table_header(offset_file):
+    header = offset_file.read(OFFSET_TABLE_HEADER.size)
+    if len(header) < OFFSET_TABLE_HEADER.size:
+        return None
+    magic, version, interval, number_of_lines, fingerprint = OFFSET_TABLE_HEADER.unpack(header)
+    if magic != OFFSET_TABLE_MAGIC or version != OFFSET_TABLE_VERSION or interval < 1:
+        return None
+    return interval, number_of_lines, fingerprint
+
+
+class OffsetTableBuilder:
+    """
+    Builds a file offset table incrementally from the contents of a data file.
+    """
+
+    def __init__(self, interval=DEFAULT_OFFSET_TABLE_INTERVAL):
+        if interval < 1:
+            raise ValueError("interval must be positive but was [%s]" % str(interval))
+        self.interval = interval
+        self.offsets = array.array("Q")
+        # number of line terminators so far
+        self.newlines = 0
+        # number of bytes so far
+        self.size = 0
+        # the next line that needs an entry in the table and where it starts (if known)
+        self.next_entry_line = 0
+        self.next_entry_offset = 0
+        self.last_byte = b""
+
+    def update(self, data):
+        """
+        :param data: The next chunk of the data file.
+        """
+        if not data:
+            return
+        # the line has at least one byte so add the pending entry
+        if self.next_entry_offset is not None and self.next_entry_offset == self.size:
+            self.offsets.append(self.next_entry_offset)
+            self.next_entry_line += self.interval
+            self.next_entry_offset = None
+        newlines_in_chunk = data.count(b"\n")
+        if self.newlines + newlines_in_chunk < self.next_entry_line:
+            # fast path: no entry in this chunk
+            self.newlines += newlines_in_chunk
+        else:
+            position = 0
+            while True:
+                line_end = data.find(b"\n", position)
+                if line_end == -1:
+                    break
+                position = line_end + 1
+                self.newlines += 1
+                if self.newlines == self.next_entry_line:
+                    if position < len(data):
+                        self.offsets.append(self.size + position)
+                        self.next_entry_line += self.interval
+                    else:
+                        # we can only add it once we know that the line is not empty
+                        self.next_entry_offset = self.size + position
+                        break
+        self.size += len(data)
+        self.last_byte = data[-1:]
+
+    @property
+    def number_of_lines(self):
+        # the last line may not be terminated
+        return self.newlines + 1 if self.last_byte not in [b"", b"\n"] else self.newlines
+
+    def write(self, data_file_path):
+        """
+        Writes the file offset table for the provided data file.
+
+        :param data_file_path: The path to the data file that has been fed into this builder.
+        """
+        offset_file_path = "%s.offset" % data_file_path
+        offsets = array.array("Q", self.offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        # write to a temporary file first so readers never see a partially written table
+        tmp_offset_file_path = "%s.tmp" % offset_file_path
+        with open(tmp_offset_file_path, mode="wb") as offset_file:
+            offset_file.write(OFFSET_TABLE_HEADER.pack(OFFSET_TABLE_MAGIC, OFFSET_TABLE_VERSION, self.interval, self.number_of_lines,
+                                                       file_fingerprint(data_file_path)))
+            offsets.tofile(offset_file)
+        os.replace(tmp_offset_file_path, offset_file_path)
+
+
+def prepare_file_offset_table(data_file_path, interval=DEFAULT_OFFSET_TABLE_INTERVAL):
     """
     Creates a file that contains a mapping from line numbers to file offsets for the provided path. This file is used internally by
-    #skip_lines(data_file_path, data_file) to speed up line skipping.
+    #skip_lines(data_file_path, data_file) and #line_offset(data_file_path, line_number) to speed up line skipping.
+
+    The file offset table is only recreated if the data file's fingerprint or the requested interval have changed.
 
     :param data_file_path: The path to a text file that is readable by this process.
+    :param interval: Stores the offset of every n-th line. Smaller values allow to seek faster at the expense of a larger file offset
+                     table. Default: 50000.
+    :return: True iff the file offset table has been (re)created.
     """
+    if interval < 1:
+        raise ValueError("interval must be positive but was [%s]" % str(interval))
     offset_file_path = "%s.offset" % data_file_path
-    # recreate only if necessary as this can be time-consuming
-    if not os.path.exists(offset_file_path) or os.path.getmtime(offset_file_path) < os.path.getmtime(data_file_path):
-        console.info("Preparing file offset table for [%s] ... " % data_file_path, end="", flush=True, logger=logger)
-        line_number = 0
-        with open(offset_file_path, mode="w") as offset_file:
-            with open(data_file_path, mode="rt") as data_file:
-                while True:
-                    line = data_file.readline()
-                    if len(line) == 0:
-                        break
-                    line_number += 1
-                    if line_number % 50000 == 0:
-                        print("%d;%d" % (line_number, data_file.tell()), file=offset_file)
-        console.println("[OK]")
+    if os.path.exists(offset_file_path):
+        with open(offset_file_path, mode="rb") as offset_file:
+            header = _read_offset_table_header(offset_file)
+        if header and header[0] == interval and header[2] == file_fingerprint(data_file_path):
+            logger.info("Skipping creation of file offset table at [%s] as it is still valid." % offset_file_path)
+            return False
+
+    console.info("Preparing file offset table for [%s] ... " % data_file_path, end="", flush=True, logger=logger)
+    offset_table = OffsetTableBuilder(interval)
+    with open(data_file_path, mode="rb") as data_file:
+        for data in iter(lambda: data_file.read(1024 * 1024), b""):
+            offset_table.update(data)
+    offset_table.write(data_file_path)
+    console.println("[OK]")
+    return True
+
+
+# file offset tables that have already been validated against their data file (by path and file stats of both files)
+_validated_offset_tables = {}
+
+
+def _validate_offset_table(data_file_path, offset_file_path, offset_file, fingerprint):
+    """
+    Checks that a file offset table belongs to the current contents of its data file. As this requires reading parts of the data file,
+    the result is remembered until either of the two files changes.
+    """
+    data_file_stat = os.stat(data_file_path)
+    offset_file_stat = os.fstat(offset_file.fileno())
+    stamp = (data_file_stat.st_size, data_file_stat.st_mtime_ns, offset_file_stat.st_size, offset_file_stat.st_mtime_ns)
+    if _validated_offset_tables.get(offset_file_path) == stamp:
+        return
+    if fingerprint != file_fingerprint(data_file_path):
+        raise exceptions.DataError("File offset table [%s] does not match the data file [%s]. Has the data file changed after the table "
+                                   "has been prepared?" % (offset_file_path, data_file_path))
+    _validated_offset_tables[offset_file_path] = stamp
+
+
+def line_offset(data_file_path, line_number):
+    """
+    Looks up the closest known file offset for the provided line number in the file offset table. This is a constant time operation
+    which reads only one entry of the file offset table (and validates the table against the data file the first time it is used).
+
+    :param data_file_path: The full path to the data file.
+    :param line_number: A non-negative line number (starting at zero).
+    :return: A tuple (offset, remaining_lines) with the byte offset of a line at or before the provided line number and the number of
+             lines that still need to be skipped from there.
+    :raises DataError: If the file offset table has been prepared for different contents of the data file.
+    """
+    offset_file_path = "%s.offset" % data_file_path
+    if line_number > 0 and os.path.exists(offset_file_path):
+        with open(offset_file_path, mode="rb") as offset_file:
+            header = _read_offset_table_header(offset_file)
+            if header:
+                interval, number_of_lines, fingerprint = header
+                _validate_offset_table(data_file_path, offset_file_path, offset_file, fingerprint)
+                # the table has no entry beyond the last line
+                entry = min(line_number, max(number_of_lines - 1, 0)) // interval
+                offset_file.seek(OFFSET_TABLE_HEADER.size + entry * OFFSET_TABLE_ENTRY.size)
+                raw_entry = offset_file.read(OFFSET_TABLE_ENTRY.size)
+                if len(raw_entry) == OFFSET_TABLE_ENTRY.size:
+                    offset, = OFFSET_TABLE_ENTRY.unpack(raw_entry)
+                    return offset, line_number - entry * interval
+            else:
+                logger.warning("Ignoring invalid file offset table [%s]." % offset_file_path)
+    return 0, line_number
+
+
+# Layout of the block index of a compressed file (all numbers little endian):
+#
+# header: magic (8 bytes), format version (uint32), number of blocks (uint32), number of line terminators (uint64), fingerprint of the
+#         archive (32 bytes)
+# body:   per block: offset in the archive (uint64), compressed size (uint64), number of line terminators before this block (uint64)
+BLOCK_INDEX_MAGIC = b"RLYBLKIX"
+BLOCK_INDEX_VERSION = 1
+BLOCK_INDEX_HEADER = struct.Struct("<8sIIQ32s")
+BLOCK_INDEX_ENTRY = struct.Struct("<QQQ")
+
+
+def _block_decompressor(archive_path):
+    _, extension = splitext(archive_path)
+    if extension == ".bz2":
+        return bz2.BZ2Decompressor()
+    elif extension == ".gz":
+        # expect a gzip header
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
     else:
-        logger.info("Skipping creation of file offset table at [%s] as it is still valid." % offset_file_path)
+        raise RuntimeError("Unsupported file extension [%s]. Cannot read [%s] block by block." % (extension, archive_path))
+
+
+def supports_block_index(archive_path):
+    """
+    :return: True iff a block index can be created for the provided archive.
+    """
+    return splitext(archive_path)[1] in [".bz2", ".gz"]
+
+
+def decompress_block(archive_path, data):
+    """
+    Decompresses one block of an archive.
+
+    :param archive_path: The path to the archive (only used to determine the compression format).
+    :param data: The compressed block.
+    :return: The decompressed block.
+    """
+    decompressor = _block_decompressor(archive_path)
+    result = decompressor.decompress(data)
+    if not decompressor.eof:
+        raise IOError("Incomplete block in [%s]." % archive_path)
+    return result
+
+
+def _read_block_index_header(index_file):
+    header = index_file.read(BLOCK_INDEX_HEADER.size)
+    if len(header) < BLOCK_INDEX_HEADER.size:
+        return None
+    magic, version, number_of_blocks, newlines, fingerprint = BLOCK_INDEX_HEADER.unpack(header)
+    if magic != BLOCK_INDEX_MAGIC or version != BLOCK_INDEX_VERSION:
+        return None
+    return number_of_blocks, newlines, fingerprint
+
+
+def has_block_index(archive_path):
+    """
+    :return: True iff a block index exists for the provided archive.
+    """
+    index_path = "%s.blocks" % archive_path
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, mode="rb") as index_file:
+        return _read_block_index_header(index_file) is not None
+
+
+def read_block_index(archive_path):
+    """
+    :param archive_path: The path to an archive for which a block index has been created with ``prepare_block_index``.
+    :return: A list of tuples (offset, compressed size, number of line terminators before this block), one per block.
+    """
+    index_path = "%s.blocks" % archive_path
+    with open(index_path, mode="rb") as index_file:
+        header = _read_block_index_header(index_file)
+        if not header:
+            raise IOError("[%s] is not a valid block index." % index_path)
+        number_of_blocks = header[0]
+        entries = array.array("Q")
+        entries.fromfile(index_file, number_of_blocks * 3)
+    if sys.byteorder != "little":
+        entries.byteswap()
+    return [tuple(entries[i:i + 3]) for i in range(0, len(entries), 3)]
+
+
+def prepare_block_index(archive_path):
+    """
+    Creates an index of all independently compressed blocks in an archive so the archive can be read starting at an arbitrary line
+    without decompressing anything before. Blocks are bz2 streams (e.g. created by pbzip2) or gzip members (e.g. created by
+    bgzip or by concatenating gzip files).
+
+    The block index is only recreated if the archive's fingerprint has changed.
+
+    :param archive_path: The path to a bz2 or gz file.
+    :return: True iff the block index has been (re)created.
+    """
+    index_path = "%s.blocks" % archive_path
+    fingerprint = file_fingerprint(archive_path)
+    if os.path.exists(index_path):
+        with open(index_path, mode="rb") as index_file:
+            header = _read_block_index_header(index_file)
+        if header and header[2] == fingerprint:
+            logger.info("Skipping creation of block index at [%s] as it is still valid." % index_path)
+            return False
+
+    console.info("Preparing block index for [%s] ... " % archive_path, end="", flush=True, logger=logger)
+    entries = array.array("Q")
+    newlines = 0
+    offset = 0
+    block_start = 0
+    newlines_before_block = 0
+    decompressor = _block_decompressor(archive_path)
+    with open(archive_path, mode="rb") as archive:
+        for data in iter(lambda: archive.read(1024 * 1024), b""):
+            while data:
+                newlines += decompressor.decompress(data).count(b"\n")
+                if decompressor.eof:
+                    used = len(data) - len(decompressor.unused_data)
+                    offset += used
+                    data = decompressor.unused_data
+                    entries.extend([block_start, offset - block_start, newlines_before_block])
+                    block_start = offset
+                    newlines_before_block = newlines
+                    decompressor = _block_decompressor(archive_path)
+                else:
+                    offset += len(data)
+                    data = b""
+    if block_start != offset:
+        raise IOError("[%s] is truncated." % archive_path)
+    if sys.byteorder != "little":
+        entries.byteswap()
+    tmp_index_path = "%s.tmp" % index_path
+    with open(tmp_index_path, mode="wb") as index_file:
+        index_file.write(BLOCK_INDEX_HEADER.pack(BLOCK_INDEX_MAGIC, BLOCK_INDEX_VERSION, len(entries) // 3, newlines, fingerprint))
+        entries.tofile(index_file)
+    os.replace(tmp_index_path, index_path)
+    console.println("[OK]")
+    if len(entries) // 3 == 1:
+        logger.warning("[%s] consists of only one block. Reading from it requires to decompress it from the beginning." % archive_path)
+    return True
 
 
 def skip_lines(data_file_path, data_file, number_of_lines_to_skip):
@@ -263,25 +716,12 @@ def skip_lines(data_file_path, data_file, number_of_lines_to_skip):
     if number_of_lines_to_skip == 0:
         return
 
-    offset_file_path = "%s.offset" % data_file_path
-    offset = 0
-    remaining_lines = number_of_lines_to_skip
-    # can we fast forward?
-    if os.path.exists(offset_file_path):
-        with open(offset_file_path) as offsets:
-            for line in offsets:
-                line_number, offset_in_bytes = [int(i) for i in line.strip().split(";")]
-                if line_number <= number_of_lines_to_skip:
-                    offset = offset_in_bytes
-                    remaining_lines = number_of_lines_to_skip - line_number
-                else:
-                    break
     # fast forward to the last known file offset
+    offset, remaining_lines = line_offset(data_file_path, number_of_lines_to_skip)
     data_file.seek(offset)
     # forward the last remaining lines if needed
-    if remaining_lines > 0:
-        for line in range(remaining_lines):
-            data_file.readline()
+    for line in range(remaining_lines):
+        data_file.readline()
 
 
 def get_size(start_path="."):
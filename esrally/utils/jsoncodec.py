@@ -0,0 +1,130 @@
+import importlib
+import json
+import logging
+
+from esrally import exceptions
+
+logger = logging.getLogger("rally.jsoncodec")
+
+
+class JsonCodec:
+    """
+    Encodes and decodes JSON with Python's standard library. All other codecs provide the same interface:
+
+    * ``loads`` accepts ``str`` or ``bytes`` and raises a ``ValueError`` if the document cannot be decoded.
+    * ``dumps`` always returns a ``str``.
+    * ``raw_decode`` decodes one JSON value at a given position of a ``str``. None of the accelerated libraries can decode incrementally
+      so all codecs rely on the standard library for this.
+    """
+    name = "json"
+    _decoder = json.JSONDecoder()
+
+    def loads(self, s):
+        if isinstance(s, (bytes, bytearray)):
+            s = s.decode("utf-8")
+        return json.loads(s)
+
+    def dumps(self, obj, default=None):
+        return json.dumps(obj, default=default, separators=(",", ":"))
+
+    def raw_decode(self, s, idx=0):
+        """
+        :param s: A ``str`` that contains (at least) one JSON value.
+        :param idx: The position in ``s`` at which the JSON value starts.
+        :return: A tuple of the decoded value and the position in ``s`` where it ended.
+        """
+        return self._decoder.raw_decode(s, idx)
+
+
+class UJsonCodec(JsonCodec):
+    """
+    Encodes and decodes JSON with `ujson <https://pypi.python.org/pypi/ujson>`_.
+    """
+    name = "ujson"
+
+    def __init__(self):
+        self.ujson = importlib.import_module("ujson")
+
+    def loads(self, s):
+        if isinstance(s, (bytes, bytearray)):
+            s = s.decode("utf-8")
+        return self.ujson.loads(s)
+
+    def dumps(self, obj, default=None):
+        # ujson does not support a fallback for unknown types
+        if default is not None:
+            return super().dumps(obj, default)
+        return self.ujson.dumps(obj, ensure_ascii=False)
+
+
+class OrJsonCodec(JsonCodec):
+    """
+    Encodes and decodes JSON with `orjson <https://pypi.python.org/pypi/orjson>`_.
+    """
+    name = "orjson"
+
+    def __init__(self):
+        self.orjson = importlib.import_module("orjson")
+
+    def loads(self, s):
+        # orjson.JSONDecodeError is a subclass of ValueError
+        return self.orjson.loads(s)
+
+    def dumps(self, obj, default=None):
+        return self.orjson.dumps(obj, default=default).decode("utf-8")
+
+
+CODECS = [JsonCodec, UJsonCodec, OrJsonCodec]
+
+_codecs = {}
+
+
+def codec(name=None):
+    """
+    Returns a JSON codec.
+
+    :param name: The name of the codec, e.g. "json", "ujson" or "orjson". If ``None``, the standard library's ``json`` module is used.
+                 Accelerated codecs are only used if they are requested explicitly.
+    :return: A codec instance. Accelerated codecs fall back to the standard library's ``json`` module if their library is not installed.
+    """
+    if name is None:
+        name = JsonCodec.name
+    if name in _codecs:
+        return _codecs[name]
+    candidates = [c for c in CODECS if c.name == name]
+    if not candidates:
+        raise ValueError("Unknown JSON codec [%s]. Valid values are %s." % (name, [c.name for c in CODECS]))
+    try:
+        selected = candidates[0]()
+    except ImportError:
+        logger.warning("JSON codec [%s] is not available. Falling back to [%s]." % (name, JsonCodec.name))
+        selected = JsonCodec()
+    logger.info("Using JSON codec [%s]." % selected.name)
+    _codecs[name] = selected
+    return selected
+
+
+def from_client_options(client_options):
+    """
+    :param client_options: A dict with client options (see ``--client-options``). Optional.
+    :return: The codec that is selected with the client option ``json_codec`` (see ``codec``).
+    """
+    name = client_options.get("json_codec") if client_options else None
+    try:
+        return codec(name)
+    except ValueError as e:
+        raise exceptions.SystemSetupError("Invalid client options: %s" % str(e))
+
+
+def loads(s):
+    """
+    Decodes the provided JSON document with the default codec.
+    """
+    return codec().loads(s)
+
+
+def dumps(obj):
+    """
+    Encodes the provided object as JSON with the default codec.
+    """
+    return codec().dumps(obj)
@@ -0,0 +1,168 @@
+import gzip
+import http.server
+import zlib
+import socketserver
+import threading
+import time
+from unittest import TestCase
+
+import elasticsearch
+
+from esrally import client, exceptions
+from esrally.utils import compression
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, body))
+        self.server.content_encodings.append(self.headers["Content-Encoding"])
+        if self.path.startswith("/slow"):
+            time.sleep(1)
+            self.respond(200, b'{"took": 1000, "errors": false, "items": []}')
+        elif self.path.startswith("/unavailable") and len(self.server.requests) == 1:
+            self.respond(503, b'{"error": "unavailable", "status": 503}')
+        elif self.path.startswith("/missing"):
+            self.respond(404, b'{"error": {"type": "index_not_found_exception"}, "status": 404}')
+        else:
+            self.respond(200, b'{"took": 1, "errors": false, "items": []}')
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # clients keep their connections open so each one needs its own thread
+    daemon_threads = True
+
+
+class RawTransportTests(TestCase):
+    def setUp(self):
+        self.server = StubServer(("127.0.0.1", 0), StubHandler)
+        self.server.requests = []
+        self.server.content_encodings = []
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": self.server.server_port}], client_options={}).create()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sends_body_as_is(self):
+        body = b'{"index": {}}\n{"key": "value"}\n'
+        status, data = self.es.raw_transport.perform_request("POST", "/_bulk", params={"pipeline": "test"}, body=memoryview(body))
+
+        self.assertEqual(200, status)
+        self.assertEqual(b'{"took": 1, "errors": false, "items": []}', data)
+        self.assertEqual([("/_bulk?pipeline=test", body)], self.server.requests)
+
+    def test_raises_transport_error_on_error_status(self):
+        with self.assertRaises(elasticsearch.NotFoundError) as ctx:
+            self.es.raw_transport.perform_request("POST", "/missing/_bulk", body=b"{}\n")
+        self.assertEqual(404, ctx.exception.status_code)
+        self.assertEqual("index_not_found_exception", ctx.exception.error)
+
+    def test_reuses_raw_transport_of_client(self):
+        self.assertIs(self.es.raw_transport, self.es.raw_transport)
+        self.assertIs(self.es.transport, self.es.raw_transport.transport)
+
+    def test_retries_on_configured_status(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": self.server.server_port}],
+                                    client_options={"retry_on_status": (503,), "max_retries": 1}).create()
+        status, _ = es.raw_transport.perform_request("POST", "/unavailable/_bulk", body=b"{}\n")
+
+        self.assertEqual(200, status)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_does_not_retry_on_other_status(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": self.server.server_port}],
+                                    client_options={"retry_on_status": ()}).create()
+        with self.assertRaises(elasticsearch.TransportError) as ctx:
+            es.raw_transport.perform_request("POST", "/unavailable/_bulk", body=b"{}\n")
+        self.assertEqual(503, ctx.exception.status_code)
+        self.assertEqual("unavailable", ctx.exception.error)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_uses_request_timeout_of_client(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": self.server.server_port}],
+                                    client_options={"request_timeout": 0.1}).create()
+        with self.assertRaises(elasticsearch.ConnectionTimeout):
+            es.raw_transport.perform_request("POST", "/slow/_bulk", body=b"{}\n")
+
+    def test_request_timeout_parameter_overrides_client_option(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": self.server.server_port}],
+                                    client_options={"request_timeout": 0.1}).create()
+        params = {"request_timeout": 5}
+        status, _ = es.raw_transport.perform_request("POST", "/slow/_bulk", params=params, body=b"{}\n")
+
+        self.assertEqual(200, status)
+        self.assertEqual([("/slow/_bulk", b"{}\n")], self.server.requests)
+        # the caller's parameters are not modified
+        self.assertEqual({"request_timeout": 5}, params)
+
+    def test_raises_connection_error_if_server_is_unavailable(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(elasticsearch.ConnectionError):
+            self.es.raw_transport.perform_request("POST", "/_bulk", body=b"{}\n")
+
+    def test_sends_precompressed_body_with_its_content_encoding(self):
+        body = b'{"index": {}}\n{"key": "value"}\n'
+        transport = self.es.raw_transport
+        prepared = transport.prepare_body(body)
+        self.assertIs(body, prepared)
+
+        compressed = compression.Compressor("deflate").compress_body(body)
+        transport.perform_request("POST", "/_bulk", body=compressed)
+
+        self.assertEqual([("/_bulk", bytes(compressed))], self.server.requests)
+        self.assertEqual(["deflate"], self.server.content_encodings)
+        self.assertEqual(body, zlib.decompress(self.server.requests[0][1]))
+
+    def test_compresses_body_if_enabled(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": self.server.server_port}],
+                                    client_options={"compressed": True, "compression_level": 1}).create()
+        body = b'{"index": {}}\n{"key": "value"}\n'
+        transport = es.raw_transport
+        prepared = transport.prepare_body(body)
+        self.assertIsInstance(prepared, compression.CompressedBody)
+        self.assertEqual(len(body), prepared.uncompressed_size)
+
+        transport.perform_request("POST", "/_bulk", body=prepared)
+
+        self.assertEqual(["gzip"], self.server.content_encodings)
+        self.assertEqual(body, gzip.decompress(self.server.requests[0][1]))
+
+
+class EsClientFactoryTests(TestCase):
+    def test_does_not_modify_client_options(self):
+        client_options = {"compressed": True, "compression_algorithm": "deflate", "compression_level": 1, "json_codec": "json"}
+        factory = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options=client_options)
+
+        self.assertEqual("deflate", factory.compressor.content_encoding)
+        self.assertEqual(1, factory.compressor.level)
+        self.assertEqual({"compressed": True, "compression_algorithm": "deflate", "compression_level": 1, "json_codec": "json"},
+                         client_options)
+
+    def test_rejects_invalid_compression_level(self):
+        with self.assertRaises(exceptions.SystemSetupError):
+            client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={"compression_level": 11})
+
+    def test_rejects_unknown_json_codec(self):
+        with self.assertRaises(exceptions.SystemSetupError):
+            client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={"json_codec": "yaml"})
+
+    def test_raw_transport_uses_json_codec_of_client(self):
+        factory = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={"json_codec": "json"})
+        es = factory.create()
+        self.assertIs(factory.json_codec, es.raw_transport.codec)
@@ -1,10 +1,11 @@
 import unittest.mock as mock
 import threading
 import collections
+import time
 from unittest import TestCase
 
-from esrally import metrics, track, exceptions
-from esrally.driver import driver
+from esrally import metrics, track, exceptions, config
+from esrally.driver import driver, scheduler
 from esrally.track import params
 from esrally.utils import io
 
@@ -162,6 +163,92 @@ class AllocatorTests(TestCase):
         self.assertEqual([{op1, op2, op3}], allocator.operations_per_joinpoint)
 
 
+class WorkerAllocationTests(TestCase):
+    def test_one_worker_per_client_with_threads(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "client.execution", "threads")
+        self.assertEqual(4, driver.number_of_workers(cfg, 4))
+
+    def test_single_worker_with_thread_pool(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "client.execution", "thread-pool")
+        self.assertEqual(1, driver.number_of_workers(cfg, 4))
+
+    @mock.patch("esrally.utils.sysstats.logical_cpu_cores")
+    def test_worker_pool_defaults_to_number_of_cores(self, cpu_cores):
+        cpu_cores.return_value = 4
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "worker.pool", True)
+        self.assertEqual(4, driver.number_of_workers(cfg, 16))
+        self.assertEqual(2, driver.number_of_workers(cfg, 2))
+
+    def test_worker_pool_with_explicit_size(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "worker.pool", True)
+        cfg.add(config.Scope.application, "driver", "worker.pool.size", 3)
+        cfg.add(config.Scope.application, "driver", "client.execution", "thread-pool")
+        self.assertEqual(3, driver.number_of_workers(cfg, 16))
+
+    def test_one_worker_per_host_with_thread_pool(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "client.execution", "thread-pool")
+        self.assertEqual(3, driver.number_of_workers(cfg, 8, hosts=3))
+        self.assertEqual(2, driver.number_of_workers(cfg, 2, hosts=3))
+
+    def test_worker_pool_per_host(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "worker.pool", True)
+        cfg.add(config.Scope.application, "driver", "worker.pool.size", 2)
+        self.assertEqual(6, driver.number_of_workers(cfg, 16, hosts=3))
+
+    def test_load_driver_hosts_default_to_localhost(self):
+        cfg = config.Config()
+        self.assertEqual(["localhost"], driver.load_driver_hosts(cfg))
+        self.assertTrue(driver.is_local("localhost"))
+        self.assertTrue(driver.is_local("127.0.0.1"))
+        self.assertFalse(driver.is_local("10.17.20.5"))
+
+    @mock.patch("socket.gethostname")
+    @mock.patch("socket.gethostbyname_ex")
+    @mock.patch("socket.gethostbyname")
+    def test_normalizes_names_of_the_same_machine(self, gethostbyname, gethostbyname_ex, gethostname):
+        addresses = {"localhost": "127.0.0.1", "coordinator": "10.17.20.4", "10.17.20.4": "10.17.20.4", "driver-1": "10.17.20.5",
+                     "10.17.20.5": "10.17.20.5"}
+        gethostbyname.side_effect = lambda host: addresses[host]
+        gethostname.return_value = "coordinator"
+        gethostbyname_ex.return_value = ("coordinator", [], ["10.17.20.4"])
+
+        self.assertEqual("127.0.0.1", driver.machine_key("localhost"))
+        self.assertEqual("127.0.0.1", driver.machine_key("127.0.0.1"))
+        self.assertEqual("127.0.0.1", driver.machine_key("10.17.20.4"))
+        self.assertEqual("127.0.0.1", driver.machine_key("coordinator"))
+        self.assertEqual("10.17.20.5", driver.machine_key("driver-1"))
+        self.assertEqual("10.17.20.5", driver.machine_key("10.17.20.5"))
+
+    @mock.patch("socket.gethostbyname")
+    def test_keeps_unresolvable_host_names(self, gethostbyname):
+        gethostbyname.side_effect = OSError("unknown host")
+        self.assertEqual("driver-1", driver.machine_key("driver-1"))
+
+    def test_distributes_clients_round_robin(self):
+        allocations = [["c0"], ["c1"], ["c2"], ["c3"], ["c4"]]
+        worker_allocations = driver.allocations_per_worker(allocations, 2)
+
+        self.assertEqual(2, len(worker_allocations))
+        self.assertEqual({0: ["c0"], 2: ["c2"], 4: ["c4"]}, worker_allocations[0])
+        self.assertEqual({1: ["c1"], 3: ["c3"]}, worker_allocations[1])
+
+    def test_never_more_workers_than_clients(self):
+        allocations = [["c0"], ["c1"]]
+        worker_allocations = driver.allocations_per_worker(allocations, 8)
+
+        self.assertEqual([{0: ["c0"]}, {1: ["c1"]}], worker_allocations)
+
+    def test_requires_at_least_one_worker(self):
+        with self.assertRaises(exceptions.RallyAssertionError):
+            driver.allocations_per_worker([["c0"]], 0)
+
+
 class IndexManagementTests(TestCase):
     @mock.patch("elasticsearch.Elasticsearch")
     def test_setup_auto_managed_index(self, es):
@@ -197,6 +284,20 @@ class IndexManagementTests(TestCase):
         es.indices.create.assert_called_with(index="test-index", body=index_settings)
         es.indices.put_mapping.assert_called_with(index="test-index", doc_type="test-type", body={"mapping": "empty-for-test"})
 
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_decodes_mappings_with_provided_codec(self, es):
+        es.indices.exists.return_value = False
+        codec = mock.Mock()
+        codec.loads.return_value = {"mapping": "decoded"}
+
+        index = track.Index(name="test-index",
+                            auto_managed=True,
+                            types=[track.Type(name="test-type", mapping_file=['{"mapping": "empty-for-test"}'])])
+        driver.setup_index(es, index, {}, source=io.StringAsFileSource, codec=codec)
+
+        codec.loads.assert_called_once_with('{"mapping": "empty-for-test"}')
+        es.indices.put_mapping.assert_called_with(index="test-index", doc_type="test-type", body={"mapping": "decoded"})
+
     @mock.patch("elasticsearch.Elasticsearch")
     def test_do_not_change_manually_managed_index(self, es):
         index = track.Index(name="test-index", auto_managed=False, types=[])
@@ -256,6 +357,275 @@ class MetricsAggregationTests(TestCase):
         self.assertEqual((1470838600, 26, metrics.SampleType.Normal, 6666.666666666667, "docs/s"), throughput[5])
         # self.assertEqual((1470838600.5, 26.5, metrics.SampleType.Normal, 10000), throughput[6])
 
+    def test_incremental_metrics_aggregation(self):
+        op = track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source")
+
+        calculator = driver.ThroughputCalculator()
+        aggregated = calculator.calculate([
+            driver.Sample(0, 1470838595, 21, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 1, 1 / 6),
+            driver.Sample(0, 1470838596, 22, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 2, 2 / 6),
+            driver.Sample(0, 1470838597, 23, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 3, 3 / 6),
+        ])
+        self.assertEqual([
+            (1470838595, 21, metrics.SampleType.Normal, 5000, "docs/s"),
+            (1470838596, 22, metrics.SampleType.Normal, 5000, "docs/s"),
+            (1470838597, 23, metrics.SampleType.Normal, 5000, "docs/s")
+        ], aggregated[op])
+
+        # the calculator carries its state over to the next invocation
+        aggregated = calculator.calculate([
+            driver.Sample(0, 1470838598, 24, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 4, 4 / 6),
+            driver.Sample(1, 1470838598.5, 24.5, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 4.5, 5 / 6),
+            driver.Sample(0, 1470838599, 25, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 5, 6 / 6),
+        ])
+        self.assertEqual([
+            (1470838598, 24, metrics.SampleType.Normal, 5000, "docs/s"),
+            (1470838599, 25, metrics.SampleType.Normal, 6000, "docs/s")
+        ], aggregated[op])
+        # we have already produced throughput samples for the current sample type
+        self.assertEqual({}, calculator.finish())
+
+    def test_finish_includes_last_sample_below_bucket_interval(self):
+        op = track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source")
+
+        calculator = driver.ThroughputCalculator()
+        aggregated = calculator.calculate([
+            driver.Sample(0, 1470838595, 21, op, metrics.SampleType.Warmup, None, -1, -1, 3000, "docs", 1, 0.5),
+            driver.Sample(0, 1470838595.5, 21.5, op, metrics.SampleType.Normal, None, -1, -1, 2500, "docs", 1, 1),
+        ])
+        self.assertEqual([(1470838595, 21, metrics.SampleType.Warmup, 3000, "docs/s")], aggregated[op])
+        self.assertEqual({op: [(1470838595.5, 21.5, metrics.SampleType.Normal, 3666.6666666666665, "docs/s")]}, calculator.finish())
+
+
+class RequestMetricsAggregatorTests(TestCase):
+    def test_folds_samples_into_histograms(self):
+        op = track.Operation("search", track.OperationType.Search, param_source="driver-test-param-source")
+        task = track.Task(op)
+
+        aggregator = driver.RequestMetricsAggregator()
+        aggregator.add([
+            driver.Sample(0, 1470838595, 21, task, metrics.SampleType.Warmup, {"success": True}, 10, 9, 1, "ops", 1, 0.25),
+            driver.Sample(0, 1470838596, 22, task, metrics.SampleType.Normal, {"success": True, "query-took": [3, 4]}, 20, 19, 1, "ops", 1,
+                          0.5, schedule_lag_ms=1),
+        ])
+        # subsequent invocations are folded into the same histograms
+        aggregator.add([
+            driver.Sample(0, 1470838597, 23, task, metrics.SampleType.Normal, {"success": False}, 30, 29, 1, "ops", 1, 0.75,
+                          schedule_lag_ms=-0.1),
+            driver.Sample(0, 1470838598, 24, task, metrics.SampleType.Normal, None, 40, 39, 1, "ops", 1, 1.0),
+        ])
+
+        aggregates = aggregator.finish()
+        self.assertEqual(2, len(aggregates))
+
+        warmup = aggregates[(task, metrics.SampleType.Warmup)]
+        self.assertEqual(["latency", "service_time"], sorted(warmup.histograms.keys()))
+        self.assertEqual(1, warmup.histograms["latency"].total_count)
+        self.assertEqual(0, warmup.errors)
+        self.assertEqual(1470838595, warmup.absolute_time)
+        self.assertEqual(21, warmup.relative_time)
+
+        normal = aggregates[(task, metrics.SampleType.Normal)]
+        self.assertEqual(["latency", "query_took", "schedule_lag", "service_time"], sorted(normal.histograms.keys()))
+        self.assertEqual(3, normal.histograms["latency"].total_count)
+        self.assertEqual(30, normal.histograms["latency"].value_at_percentile(50))
+        self.assertEqual(39, normal.histograms["service_time"].max)
+        # negative schedule lags are recorded as zero
+        self.assertEqual(0, normal.histograms["schedule_lag"].min)
+        self.assertEqual(2, normal.histograms["query_took"].total_count)
+        self.assertEqual(1, normal.errors)
+        # timestamps of the most recent sample
+        self.assertEqual(1470838598, normal.absolute_time)
+        self.assertEqual(24, normal.relative_time)
+
+        # finish resets the aggregator
+        self.assertEqual({}, aggregator.finish())
+
+
+class SampleBatchTests(TestCase):
+    def setUp(self):
+        params.register_param_source_for_name("driver-test-param-source", DriverTestParamSource)
+
+    def test_converts_to_samples(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        batch = driver.SampleBatch(client_id=3, task=task)
+        batch.add(1470838595, 21, metrics.SampleType.Warmup, {"success": True}, 10.5, 9.5, 5000, "docs", 1, 0.5)
+        batch.add(1470838596, 22, metrics.SampleType.Normal, {"success": False, "http-status": 500}, 12.5, 11.5, 0, "docs", 2, 1.0)
+
+        self.assertEqual(2, len(batch))
+        samples = list(batch)
+        self.assertEqual(3, samples[0].client_id)
+        self.assertEqual(task, samples[0].task)
+        self.assertEqual(1470838595, samples[0].absolute_time)
+        self.assertEqual(21, samples[0].relative_time)
+        self.assertEqual(metrics.SampleType.Warmup, samples[0].sample_type)
+        self.assertEqual({"success": True}, samples[0].request_meta_data)
+        self.assertEqual(10.5, samples[0].latency_ms)
+        self.assertEqual(9.5, samples[0].service_time_ms)
+        self.assertEqual(5000, samples[0].total_ops)
+        self.assertEqual("docs", samples[0].total_ops_unit)
+        self.assertEqual(1, samples[0].time_period)
+        self.assertEqual(0.5, samples[0].percent_completed)
+
+        self.assertEqual(metrics.SampleType.Normal, samples[1].sample_type)
+        self.assertEqual({"success": False, "http-status": 500}, samples[1].request_meta_data)
+        self.assertEqual(1470838596, batch.last().absolute_time)
+
+    def test_converts_schedule_lag(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        batch = driver.SampleBatch(client_id=3, task=task)
+        batch.add(1470838595, 21, metrics.SampleType.Normal, None, 10.5, 9.5, 1, "ops", 1, 0.5)
+        batch.add(1470838596, 22, metrics.SampleType.Normal, None, 12.5, 11.5, 1, "ops", 2, 1.0, 0.25)
+
+        samples = list(batch)
+        # not throughput-throttled
+        self.assertIsNone(samples[0].schedule_lag_ms)
+        self.assertEqual(0.25, samples[1].schedule_lag_ms)
+
+    def test_interns_units_and_meta_data(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        batch = driver.SampleBatch(client_id=0, task=task)
+        for i in range(100):
+            batch.add(1470838595 + i, 21 + i, metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", i, i / 100)
+        batch.add(1470838695, 121, metrics.SampleType.Normal, {"success": True, "shards": {"failed": 1}}, 10, 10, 1, "ops", 100, 1.0)
+
+        self.assertEqual(["ops"], batch.units)
+        self.assertEqual(2, len(batch.meta_data))
+
+    def test_shift_absolute_time(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        batch = driver.SampleBatch(client_id=0, task=task)
+        batch.add(1470838595, 21, metrics.SampleType.Normal, None, 10, 10, 1, "ops", 1, 1.0)
+        batch.shift_absolute_time(-5)
+        self.assertEqual(1470838590, batch.last().absolute_time)
+        self.assertEqual(21, batch.last().relative_time)
+
+    def test_sampler_provides_batches(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        sampler = driver.Sampler(client_id=1, task=task, start_timestamp=0)
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", 1, 0.5)
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", 2, 1.0)
+
+        batch = sampler.samples
+        self.assertEqual(2, len(batch))
+        self.assertEqual(1, batch.client_id)
+        # all samples have been retrieved
+        self.assertEqual(0, len(sampler.samples))
+
+    def test_sampler_spills_instead_of_dropping_samples(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        sampler = driver.Sampler(client_id=1, task=task, start_timestamp=0, buffer_size=4)
+        for i in range(10):
+            sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", i, i / 10)
+
+        batch = sampler.samples
+        self.assertEqual(10, len(batch))
+        self.assertEqual(0, batch.dropped)
+        # samples are retrieved in order
+        self.assertEqual(list(range(10)), [sample.time_period for sample in batch])
+
+        # the ring buffer is reused after it has been drained
+        for i in range(10, 13):
+            sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", i, i / 13)
+        self.assertEqual([10, 11, 12], [sample.time_period for sample in sampler.samples])
+
+    def test_sampler_counts_dropped_samples_above_spill_limit(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        sampler = driver.Sampler(client_id=1, task=task, start_timestamp=0, buffer_size=4, spill_limit=2)
+        for i in range(10):
+            sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", i, i / 10)
+
+        batch = sampler.samples
+        self.assertEqual(6, len(batch))
+        self.assertEqual(4, batch.dropped)
+        # dropped samples are reported only once
+        self.assertEqual(0, sampler.samples.dropped)
+
+    def test_sampler_reports_param_source_waits_as_deltas(self):
+        task = track.Task(track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source"))
+        sampler = driver.Sampler(client_id=1, task=task, start_timestamp=0)
+        sampler.add_param_source_wait(0.5)
+        sampler.add_param_source_wait(0.25)
+
+        batch = sampler.samples
+        self.assertEqual(0, len(batch))
+        self.assertEqual(2, batch.param_source_waits)
+        self.assertAlmostEqual(0.75, batch.param_source_wait_time)
+
+        sampler.add_param_source_wait(0.125)
+        batch = sampler.samples
+        self.assertEqual(1, batch.param_source_waits)
+        self.assertAlmostEqual(0.125, batch.param_source_wait_time)
+
+    def test_reads_sampler_spill_limit_from_config(self):
+        cfg = config.Config()
+        self.assertIsNone(driver.sampler_spill_limit(cfg))
+
+        # values from the config file are strings
+        cfg.add(config.Scope.application, "driver", "sampler.spill.limit", "1000")
+        self.assertEqual(1000, driver.sampler_spill_limit(cfg))
+
+        cfg.add(config.Scope.application, "driver", "sampler.spill.limit", "-1")
+        with self.assertRaisesRegex(exceptions.SystemSetupError, r"The sampler spill limit must not be negative but was \[-1\]."):
+            driver.sampler_spill_limit(cfg)
+
+
+class ThroughputSearchTrackerTests(TestCase):
+    def setUp(self):
+        op = track.Operation("search", track.OperationType.Search)
+        self.search = track.ThroughputSearch(op, target_throughputs=[10, 20, 30], max_latency=100, latency_percentile=90,
+                                             max_error_rate=0.1)
+        self.probes = [track.Task(track.Operation(self.search.probe_name(t), track.OperationType.Search), target_throughput=t,
+                                  throughput_search=self.search) for t in self.search.target_throughputs]
+
+    def batch(self, task, latencies, errors=0, warmup=False):
+        batch = driver.SampleBatch(client_id=0, task=task)
+        if warmup:
+            batch.add(1470838594, 20, metrics.SampleType.Warmup, {"success": False}, 5000, 10, 1, "ops", 1, 0)
+        for i, latency in enumerate(latencies):
+            meta_data = {"success": i >= errors}
+            batch.add(1470838595 + i, 21 + i, metrics.SampleType.Normal, meta_data, latency, 10, 10, "ops", 1, (i + 1) / len(latencies))
+        return batch
+
+    def test_records_highest_sustainable_probe(self):
+        tracker = driver.ThroughputSearchTracker()
+        # warmup samples are not considered
+        tracker.add(self.batch(self.probes[0], [10] * 10, warmup=True))
+        self.assertTrue(tracker.finish_probe(self.probes[0]))
+        self.assertFalse(tracker.skipped(self.probes[1]))
+
+        # one error in ten requests is still acceptable
+        tracker.add(self.batch(self.probes[1], [20] * 9 + [500], errors=1))
+        self.assertTrue(tracker.finish_probe(self.probes[1]))
+
+        # the 90th percentile is too high
+        tracker.add(self.batch(self.probes[2], [20] * 8 + [500] * 2))
+        self.assertFalse(tracker.finish_probe(self.probes[2]))
+
+        target_throughput, throughput, unit = tracker.result(self.search)
+        self.assertEqual(20, target_throughput)
+        self.assertEqual(10, throughput)
+        self.assertEqual("ops/s", unit)
+
+    def test_skips_remaining_probes_after_violation(self):
+        tracker = driver.ThroughputSearchTracker()
+        tracker.add(self.batch(self.probes[0], [10] * 10, errors=2))
+        self.assertFalse(tracker.finish_probe(self.probes[0]))
+
+        self.assertTrue(tracker.skipped(self.probes[1]))
+        self.assertTrue(tracker.skipped(self.probes[2]))
+        self.assertFalse(tracker.skipped(track.Task(track.Operation("index", track.OperationType.Index))))
+        self.assertEqual((0, 0, "ops/s"), tracker.result(self.search))
+
+    def test_ends_search_without_measurement_samples(self):
+        tracker = driver.ThroughputSearchTracker()
+        self.assertFalse(tracker.finish_probe(self.probes[0]))
+        self.assertTrue(tracker.skipped(self.probes[1]))
+
+    def test_finds_searches_in_schedule(self):
+        other = track.Task(track.Operation("index", track.OperationType.Index))
+        self.assertEqual([self.search], driver.ThroughputSearchTracker.searches([other] + self.probes))
+
 
 class SchedulerTests(ScheduleTestCase):
     def setUp(self):
@@ -297,6 +667,38 @@ class SchedulerTests(ScheduleTestCase):
         ]
         self.assert_schedule(expected_schedule, schedule)
 
+    def test_search_task_with_step_schedule(self):
+        task = track.Task(track.Operation("search", track.OperationType.Search.name, param_source="driver-test-param-source"),
+                          warmup_iterations=0, iterations=8, clients=2, schedule="step",
+                          schedule_params={"steps": [{"duration": 1, "target-throughput": 4}, {"duration": 1, "target-throughput": 8}]})
+        schedule = driver.schedule_for(self.test_track, task, 0)
+
+        expected_schedule = [
+            (0, metrics.SampleType.Normal, 1 / 4, {}),
+            (0.5, metrics.SampleType.Normal, 2 / 4, {}),
+            (1.0, metrics.SampleType.Normal, 3 / 4, {}),
+            (1.25, metrics.SampleType.Normal, 4 / 4, {}),
+        ]
+        self.assert_schedule(expected_schedule, schedule)
+
+    def test_schedule_ends_when_scheduler_is_exhausted(self):
+        class TwoRequestsScheduler:
+            def __init__(self, params):
+                pass
+
+            def next(self, current):
+                return 0 if current is None else (current + 1 if current < 1 else None)
+
+        scheduler.register_scheduler("driver-test-two-requests", TwoRequestsScheduler)
+        task = track.Task(track.Operation("search", track.OperationType.Search.name, param_source="driver-test-param-source"),
+                          warmup_iterations=0, iterations=10, clients=1, schedule="driver-test-two-requests")
+        schedule = driver.schedule_for(self.test_track, task, 0)
+
+        self.assert_schedule([
+            (0, metrics.SampleType.Normal, 1 / 10, {}),
+            (1, metrics.SampleType.Normal, 2 / 10, {}),
+        ], schedule)
+
     def test_schedule_for_warmup_time_based(self):
         task = track.Task(track.Operation("time-based", track.OperationType.Index.name, params={"body": ["a"], "size": 11},
                                           param_source="driver-test-param-source"),
@@ -403,10 +805,64 @@ class ExecutorTests(TestCase):
             self.assertEqual(metrics.SampleType.Normal, sample.sample_type)
             # latency equals service time in throughput mode
             self.assertEqual(sample.latency_ms, sample.service_time_ms)
+            self.assertIsNone(sample.schedule_lag_ms)
             self.assertEqual(1, sample.total_ops)
             self.assertEqual("docs", sample.total_ops_unit)
             self.assertEqual(1, sample.request_meta_data["bulk-size"])
 
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_execute_tasks_of_all_clients_on_thread_pool(self, es):
+        from esrally.driver import async_driver
+
+        es.bulk.return_value = {
+            "errors": False
+        }
+
+        params.register_param_source_for_name("driver-test-param-source", DriverTestParamSource)
+        test_track = track.Track(name="unittest", short_description="unittest track", description="unittest track",
+                                 source_root_url="http://example.org",
+                                 indices=None,
+                                 challenges=None)
+
+        task = track.Task(track.Operation("iteration-based", track.OperationType.Index.name, params={
+            "body": ["action_metadata_line", "index_line"],
+            "action_metadata_present": True
+        },
+                                          param_source="driver-test-param-source"),
+                          warmup_iterations=0, iterations=10, clients=2, target_throughput=None)
+
+        samplers = {
+            0: [driver.Sampler(client_id=0, task=task, start_timestamp=100)],
+            1: [driver.Sampler(client_id=1, task=task, start_timestamp=100)]
+        }
+        cancel = threading.Event()
+        # both clients share one request thread
+        async_driver.execute_tasks_of_all_clients(cancel, test_track, {0: [task], 1: [task]}, {0: es, 1: es}, samplers,
+                                                  max_request_threads=1)
+
+        for client_id in [0, 1]:
+            samples = samplers[client_id][0].samples
+            self.assertEqual(5, len(samples))
+            for sample in samples:
+                self.assertEqual(client_id, sample.client_id)
+                self.assertEqual(task, sample.task)
+                self.assertEqual(metrics.SampleType.Normal, sample.sample_type)
+                # latency includes the time that a request has waited for the request thread
+                self.assertGreaterEqual(sample.latency_ms, sample.service_time_ms)
+                self.assertIsNone(sample.schedule_lag_ms)
+                self.assertEqual(1, sample.total_ops)
+                self.assertEqual("docs", sample.total_ops_unit)
+
+    @mock.patch("esrally.utils.sysstats.logical_cpu_cores")
+    def test_bounds_number_of_request_threads(self, cpu_cores):
+        from esrally.driver import async_driver
+        cpu_cores.return_value = 8
+
+        self.assertEqual(32, async_driver.request_threads(clients=500))
+        self.assertEqual(10, async_driver.request_threads(clients=10))
+        self.assertEqual(16, async_driver.request_threads(clients=500, configured_threads=16))
+        self.assertEqual(1, async_driver.request_threads(clients=0))
+
     @mock.patch("elasticsearch.Elasticsearch")
     def test_execute_schedule_throughput_throttled(self, es):
         es.bulk.return_value = {
@@ -440,6 +896,15 @@ class ExecutorTests(TestCase):
             upper_bound = bounds[1]
             self.assertTrue(lower_bound <= sample_size <= upper_bound,
                             msg="Expected sample size to be between %d and %d but was %d" % (lower_bound, upper_bound, sample_size))
+            # all but the first request are throughput-throttled and cannot start before their scheduled time
+            for sample in list(samples)[1:]:
+                self.assertTrue(sample.schedule_lag_ms >= 0)
+
+    def test_wait_until_deadline(self):
+        for spin_threshold in [0, driver.DEFAULT_SPIN_THRESHOLD, 1]:
+            deadline = time.perf_counter() + 0.005
+            driver.wait_until(deadline, spin_threshold)
+            self.assertTrue(time.perf_counter() >= deadline)
 
     @mock.patch("elasticsearch.Elasticsearch")
     def test_cancel_execute_schedule(self, es):
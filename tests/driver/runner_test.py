@@ -1,7 +1,9 @@
+import json
 import unittest.mock as mock
 from unittest import TestCase
 
 from esrally.driver import runner
+from esrally.utils import compression, jsoncodec
 
 
 class BulkIndexRunnerTests(TestCase):
@@ -34,6 +36,72 @@ class BulkIndexRunnerTests(TestCase):
 
         es.bulk.assert_called_with(body=bulk_params["body"], params={})
 
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_bulk_index_raw_body(self, es):
+        raw_transport = es.raw_transport
+        raw_transport.codec = jsoncodec.codec()
+        raw_transport.prepare_body.side_effect = lambda body: body
+        raw_transport.perform_request.return_value = (200, b'{"errors": false}')
+        bulk = runner.BulkIndex()
+
+        bulk_params = {
+            "body": b'{"index": {}}\n{"key": "value1"}\n{"index": {}}\n{"key": "value2"}\n',
+            "action_metadata_present": True,
+            "pipeline": "test-pipeline"
+        }
+
+        result = bulk(es, bulk_params)
+
+        self.assertEqual(2, result["weight"])
+        self.assertEqual(2, result["bulk-size"])
+        self.assertEqual(True, result["success"])
+
+        raw_transport.perform_request.assert_called_with("POST", "/_bulk", params={"pipeline": "test-pipeline"},
+                                                                      body=bulk_params["body"])
+        es.bulk.assert_not_called()
+        es.transport.perform_request.assert_not_called()
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_bulk_index_raw_body_without_metadata(self, es):
+        raw_transport = es.raw_transport
+        raw_transport.codec = jsoncodec.codec()
+        raw_transport.prepare_body.side_effect = lambda body: body
+        raw_transport.perform_request.return_value = (200, b'{"errors": false}')
+        bulk = runner.BulkIndex()
+
+        bulk_params = {
+            "body": memoryview(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}\n'),
+            "action_metadata_present": False,
+            "index": "test-index",
+            "type": "test-type"
+        }
+
+        result = bulk(es, bulk_params)
+
+        self.assertEqual(3, result["bulk-size"])
+        raw_transport.perform_request.assert_called_with("POST", "/test-index/test-type/_bulk", params={},
+                                                                      body=bulk_params["body"])
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_bulk_index_raw_body_uses_provided_bulk_size(self, es):
+        raw_transport = es.raw_transport
+        raw_transport.codec = jsoncodec.codec()
+        raw_transport.prepare_body.side_effect = lambda body: body
+        raw_transport.perform_request.return_value = (200, b'{"errors": false}')
+        bulk = runner.BulkIndex()
+
+        bulk_params = {
+            # the body is not scanned for line terminators if the parameter source provides the number of documents
+            "body": memoryview(b'{"index": {}}\n{"key": "value1"}\n'),
+            "bulk-size": 5000,
+            "action_metadata_present": True
+        }
+
+        result = bulk(es, bulk_params)
+
+        self.assertEqual(5000, result["weight"])
+        self.assertEqual(5000, result["bulk-size"])
+
     @mock.patch("elasticsearch.Elasticsearch")
     def test_bulk_index_success_without_metadata(self, es):
         es.bulk.return_value = {
@@ -403,3 +471,143 @@ class BulkIndexRunnerTests(TestCase):
             ], result["shards_histogram"])
 
         es.bulk.assert_called_with(body=bulk_params["body"], params={})
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_bulk_index_compressed_raw_body(self, es):
+        raw_transport = es.raw_transport
+        raw_transport.codec = jsoncodec.codec()
+        raw_transport.prepare_body.side_effect = lambda body: body
+        raw_transport.perform_request.return_value = (200, b'{"errors": false}')
+        bulk = runner.BulkIndex()
+        body = compression.CompressedBody(b"compressed", "gzip", uncompressed_size=60, line_count=4, compression_time=0.002)
+
+        result = bulk(es, {
+            "body": body,
+            "action_metadata_present": True
+        })
+
+        self.assertEqual(2, result["bulk-size"])
+        self.assertEqual(60, result["uncompressed-bytes"])
+        self.assertEqual(10, result["compressed-bytes"])
+        self.assertEqual(2, result["compression-time"])
+        raw_transport.perform_request.assert_called_with("POST", "/_bulk", params={}, body=body)
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_bulk_index_raw_body_with_errors(self, es):
+        raw_transport = es.raw_transport
+        raw_transport.codec = jsoncodec.codec()
+        raw_transport.prepare_body.side_effect = lambda body: body
+        raw_transport.perform_request.return_value = (200, json.dumps({
+            "took": 30,
+            "errors": True,
+            "items": [
+                {"index": {"status": 201, "_shards": {"total": 2, "successful": 1, "failed": 0}}},
+                {"index": {"status": 429, "_shards": {"total": 2, "successful": 0, "failed": 0}}}
+            ]
+        }).encode("utf-8"))
+        bulk = runner.BulkIndex()
+
+        result = bulk(es, {
+            "body": b'{"index": {}}\n{"key": "value1"}\n{"index": {}}\n{"key": "value2"}\n',
+            "action_metadata_present": True
+        })
+
+        self.assertEqual(2, result["bulk-size"])
+        self.assertEqual(False, result["success"])
+        self.assertEqual(1, result["success-count"])
+        self.assertEqual(1, result["error-count"])
+
+
+class MultiSearchRunnerTests(TestCase):
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_sends_all_queries_in_one_request(self, es):
+        es.msearch.return_value = {
+            "responses": [
+                {"took": 3, "timed_out": False, "hits": {"total": 10, "hits": []}},
+                {"took": 5, "timed_out": False, "hits": {"total": 0, "hits": []}}
+            ]
+        }
+        msearch = runner.MultiSearch()
+
+        result = msearch(es, {
+            "queries": [
+                {"index": "test-index", "type": "docs", "use_request_cache": True, "body": {"query": {"match_all": {}}}},
+                {"index": "other-index", "type": None, "use_request_cache": False, "body": None}
+            ]
+        })
+
+        self.assertEqual(2, result["weight"])
+        self.assertEqual("ops", result["unit"])
+        self.assertTrue(result["success"])
+        self.assertEqual(2, result["success-count"])
+        self.assertEqual(0, result["error-count"])
+        self.assertEqual([3, 5], result["query-took"])
+
+        es.msearch.assert_called_once_with(body=[
+            {"index": "test-index", "type": "docs", "request_cache": True},
+            {"query": {"match_all": {}}},
+            {"index": "other-index", "request_cache": False},
+            {}
+        ])
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_counts_failed_queries(self, es):
+        es.msearch.return_value = {
+            "responses": [
+                {"took": 3, "timed_out": False, "hits": {"total": 10, "hits": []}},
+                {"error": {"type": "index_not_found_exception"}, "status": 404}
+            ]
+        }
+        msearch = runner.MultiSearch()
+
+        result = msearch(es, {
+            "queries": [
+                {"index": "test-index", "type": "docs", "use_request_cache": False, "body": {"query": {"match_all": {}}}},
+                {"index": "missing", "type": "docs", "use_request_cache": False, "body": {"query": {"match_all": {}}}}
+            ]
+        })
+
+        self.assertEqual(2, result["weight"])
+        self.assertFalse(result["success"])
+        self.assertEqual(1, result["success-count"])
+        self.assertEqual(1, result["error-count"])
+        self.assertEqual([3], result["query-took"])
+
+
+class LazyBulkResponseTests(TestCase):
+    def test_reads_errors_flag_without_decoding_items(self):
+        # the items are deliberately invalid as they must not be decoded
+        response = runner.LazyBulkResponse(b'{"took":30,"errors":false,"items":[{"index": invalid]}')
+        self.assertFalse(response["errors"])
+        self.assertEqual({"success": True, "success-count": 500, "error-count": 0}, runner.BulkIndex().simple_stats(500, response))
+
+    def test_errors_flag_in_items_is_ignored(self):
+        response = runner.LazyBulkResponse(b'{"took": 30, "items": [{"index": {"errors": true}}], "errors": false}')
+        self.assertFalse(response["errors"])
+
+    def test_decodes_items_on_demand(self):
+        items = [
+            {"index": {"_id": "1", "result": "created", "status": 201}},
+            {"update": {"_id": "\u00fc", "result": "updated", "status": 200}}
+        ]
+        raw = json.dumps({"took": 30, "errors": True, "items": items}, indent=2, ensure_ascii=False).encode("utf-8")
+        response = runner.LazyBulkResponse(raw)
+
+        self.assertTrue(response["errors"])
+        self.assertEqual(items, list(response["items"]))
+        self.assertIsNone(response._decoded)
+        self.assertEqual(30, response["took"])
+        self.assertEqual(items, response["items"])
+
+    def test_decodes_empty_items(self):
+        response = runner.LazyBulkResponse(b'{"took": 1, "errors": false, "items": [ ]}')
+        self.assertEqual([], list(response["items"]))
+
+    def test_decodes_with_provided_codec(self):
+        codec = mock.Mock(wraps=jsoncodec.JsonCodec())
+        response = runner.LazyBulkResponse(b'{"took": 1, "errors": false, "items": [{"index": {"status": 201}}]}', codec)
+
+        self.assertEqual([{"index": {"status": 201}}], list(response["items"]))
+        self.assertEqual(1, response["took"])
+        codec.raw_decode.assert_called_once_with(mock.ANY, mock.ANY)
+        codec.loads.assert_called_once_with(b'{"took": 1, "errors": false, "items": [{"index": {"status": 201}}]}')
@@ -0,0 +1,128 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from esrally import exceptions
+from esrally.driver import scheduler
+
+
+class SchedulerTestCase(TestCase):
+    def times(self, sched, n):
+        times = []
+        current = None
+        for _ in range(n):
+            current = sched.next(current)
+            if current is None:
+                break
+            times.append(current)
+        return times
+
+    def assert_times(self, expected, actual):
+        self.assertEqual(len(expected), len(actual), "Expected %s but was %s" % (expected, actual))
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e, a, msg="Expected %s but was %s" % (expected, actual))
+
+
+class SchedulerRegistryTests(SchedulerTestCase):
+    def test_unthrottled_without_target_throughput(self):
+        self.assertIsNone(scheduler.scheduler_for(None, {"target-throughput": None, "clients": 1}))
+
+    def test_deterministic_by_default(self):
+        self.assertIsInstance(scheduler.scheduler_for(None, {"target-throughput": 10, "clients": 1}), scheduler.DeterministicScheduler)
+
+    def test_unknown_schedule(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, r"Unknown schedule \[unknown\]"):
+            scheduler.scheduler_for("unknown", {"target-throughput": 10})
+
+    def test_custom_schedule(self):
+        class BurstScheduler:
+            def __init__(self, params):
+                self.params = params
+
+            def next(self, current):
+                return 0 if current is None else current + 1
+
+        scheduler.register_scheduler("unittest-burst", BurstScheduler)
+        sched = scheduler.scheduler_for("unittest-burst", {"clients": 2})
+        self.assertEqual({"clients": 2}, sched.params)
+        self.assertEqual([0, 1, 2], self.times(sched, 3))
+
+
+class DeterministicSchedulerTests(SchedulerTestCase):
+    def test_fixed_interval_per_client(self):
+        sched = scheduler.DeterministicScheduler({"target-throughput": 20, "clients": 2})
+        self.assert_times([0, 0.1, 0.2, 0.3], self.times(sched, 4))
+
+    def test_requires_target_throughput(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, r"Schedule \[deterministic\] requires a positive 'target-throughput'."):
+            scheduler.DeterministicScheduler({"clients": 2})
+
+
+class PoissonSchedulerTests(SchedulerTestCase):
+    def test_average_rate_matches_target_throughput(self):
+        sched = scheduler.PoissonScheduler({"target-throughput": 100, "clients": 1, "seed": 42})
+        times = self.times(sched, 10001)
+        self.assertEqual(0, times[0])
+        # all waiting times are positive...
+        self.assertTrue(all(b > a for a, b in zip(times, times[1:])))
+        # ... and 10000 requests take roughly 100 seconds
+        self.assertTrue(95 < times[-1] < 105, "10000 requests took [%f] seconds" % times[-1])
+
+    def test_seed_makes_schedule_reproducible(self):
+        params = {"target-throughput": 10, "clients": 2, "client-index": 1, "seed": 7}
+        self.assertEqual(self.times(scheduler.PoissonScheduler(params), 10), self.times(scheduler.PoissonScheduler(params), 10))
+        other_client = dict(params, **{"client-index": 0})
+        self.assertNotEqual(self.times(scheduler.PoissonScheduler(params), 10),
+                            self.times(scheduler.PoissonScheduler(other_client), 10))
+
+
+class ProfileSchedulerTests(SchedulerTestCase):
+    def test_ramp_up(self):
+        # 0 -> 2 ops/s in 2 seconds: after t seconds, t^2 / 2 requests have been issued
+        sched = scheduler.ramp_scheduler({"target-throughput": 2, "clients": 1, "ramp-up-time-period": 2})
+        self.assert_times([0, 2 ** 0.5, 2, 2.5, 3], self.times(sched, 5))
+
+    def test_ramp_up_and_down(self):
+        sched = scheduler.ramp_scheduler({"target-throughput": 2, "clients": 1, "ramp-up-time-period": 2,
+                                          "ramp-down-time-period": 2, "duration": 5})
+        # two requests during ramp-up, two at full throughput and two during ramp-down. Afterwards throughput is zero.
+        self.assert_times([0, 2 ** 0.5, 2, 2.5, 3, 5 - 2 ** 0.5], self.times(sched, 10))
+
+    def test_ramp_down_requires_duration(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, "only for tasks with a 'time-period'"):
+            scheduler.ramp_scheduler({"target-throughput": 2, "clients": 1, "ramp-up-time-period": 2, "ramp-down-time-period": 2})
+
+    def test_steps(self):
+        sched = scheduler.step_scheduler({"clients": 2, "steps": [
+            {"duration": 2, "target-throughput": 2},
+            {"duration": 1, "target-throughput": 0},
+            {"duration": 1, "target-throughput": 8}
+        ]})
+        # one request per second per client, a pause of one second and then four requests per second
+        self.assert_times([0, 1, 3, 3.25, 3.5, 3.75, 4, 4.25], self.times(sched, 8))
+
+    def test_invalid_step(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, "Each step needs a positive 'duration'"):
+            scheduler.step_scheduler({"clients": 1, "steps": [{"target-throughput": 10}]})
+
+
+class ReplaySchedulerTests(SchedulerTestCase):
+    def setUp(self):
+        fd, self.timestamps_file = tempfile.mkstemp()
+        with os.fdopen(fd, "wt") as f:
+            f.write("# recorded request times\n100.0\n100.5\n101.0\n\n103.0\n")
+
+    def tearDown(self):
+        os.remove(self.timestamps_file)
+
+    def test_replays_timestamps_relative_to_first(self):
+        sched = scheduler.ReplayScheduler({"file": self.timestamps_file, "clients": 1, "client-index": 0})
+        self.assert_times([0, 0.5, 1.0, 3.0], self.times(sched, 10))
+
+    def test_distributes_timestamps_across_clients(self):
+        sched = scheduler.ReplayScheduler({"file": self.timestamps_file, "clients": 2, "client-index": 1, "speedup": 2})
+        self.assert_times([0.25, 1.5], self.times(sched, 10))
+
+    def test_missing_file(self):
+        with self.assertRaises(exceptions.SystemSetupError):
+            scheduler.ReplayScheduler({"file": self.timestamps_file + ".missing", "clients": 1})
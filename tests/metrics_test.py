@@ -1,10 +1,13 @@
 import os
+import collections
 import datetime
+import time
 import unittest.mock as mock
 from unittest import TestCase
 import elasticsearch.exceptions
 
 from esrally import config, metrics, track, exceptions
+from esrally.utils import histogram
 
 
 class MockClientFactory:
@@ -361,6 +364,48 @@ class EsMetricsTests(TestCase):
 
         self.assertEqual(median_throughput, actual_median_throughput)
 
+    def test_get_percentiles_and_error_rate_from_histograms(self):
+        h1 = histogram.HdrHistogram()
+        h2 = histogram.HdrHistogram()
+        for i in range(1, 501):
+            h1.record_value(float(i))
+        for i in range(501, 1001):
+            h2.record_value(float(i))
+        histograms_result = {
+            "hits": {
+                "total": 2,
+                "hits": [
+                    {"_source": {"histogram": h1.to_dict()}},
+                    {"_source": {"histogram": h2.to_dict()}}
+                ]
+            }
+        }
+        error_count_result = {
+            "hits": {
+                "total": 2,
+            },
+            "aggregations": {
+                "metric_stats": {
+                    "count": 2,
+                    "min": 0,
+                    "max": 10,
+                    "avg": 5,
+                    "sum": 10
+                }
+            }
+        }
+        self.es_mock.search = mock.MagicMock(side_effect=[histograms_result, histograms_result, error_count_result])
+
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults")
+
+        self.assertEqual(collections.OrderedDict([(50, 500.0), (100, 1000.0)]),
+                         self.metrics_store.get_percentiles("latency", operation="bulk", percentiles=[50, 100]))
+        self.assertEqual(0.01, self.metrics_store.get_error_rate("bulk"))
+
+        histogram_query = self.es_mock.search.call_args_list[0][1]["body"]
+        self.assertEqual({"exists": {"field": "value"}}, histogram_query["query"]["bool"]["must_not"])
+        self.assertEqual(["histogram"], histogram_query["_source"])
+
     def test_get_error_rate_implicit_zero(self):
         self.assertEqual(0.0, self._get_error_rate(buckets=[
             {
@@ -452,7 +497,13 @@ class EsMetricsTests(TestCase):
                 }
             }
         }
-        self.es_mock.search = mock.MagicMock(return_value=search_result)
+        no_histograms = {
+            "hits": {
+                "total": 0,
+                "hits": []
+            }
+        }
+        self.es_mock.search = mock.MagicMock(side_effect=[no_histograms, search_result])
 
         self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults")
 
@@ -518,6 +569,58 @@ class EsMetricsTests(TestCase):
         return actual_error_rate
 
 
+class BulkFlusherTests(TestCase):
+    def test_sends_documents_in_bulks(self):
+        client = mock.Mock()
+        flusher = metrics.BulkFlusher(client, "rally-2016", "metrics", bulk_size=2, flush_interval=60, max_buffer_size=10)
+        for i in range(5):
+            flusher.add({"value": i})
+        flusher.close()
+
+        sent = [c[1]["items"] for c in client.bulk_index.call_args_list]
+        self.assertTrue(all(len(items) <= 2 for items in sent))
+        self.assertEqual([{"value": i} for i in range(5)], [doc for items in sent for doc in items])
+        self.assertFalse(flusher.thread.is_alive())
+
+    def test_flushes_after_interval(self):
+        client = mock.Mock()
+        flusher = metrics.BulkFlusher(client, "rally-2016", "metrics", bulk_size=100, flush_interval=0.01)
+        flusher.add({"value": 1})
+        # wait for the background thread (without explicitly flushing)
+        for _ in range(100):
+            if client.bulk_index.called:
+                break
+            time.sleep(0.01)
+
+        client.bulk_index.assert_called_once_with(index="rally-2016", doc_type="metrics", items=[{"value": 1}])
+        flusher.close()
+
+    def test_retries_failed_bulk_requests(self):
+        client = mock.Mock()
+        client.bulk_index.side_effect = [exceptions.RallyError("unknown error"), None]
+        flusher = metrics.BulkFlusher(client, "rally-2016", "metrics", bulk_size=10, max_retries=1, retry_backoff=0)
+        flusher.add({"value": 1})
+        flusher.close()
+
+        self.assertEqual(2, client.bulk_index.call_count)
+
+    def test_reports_failure_to_caller(self):
+        client = mock.Mock()
+        client.bulk_index.side_effect = exceptions.RallyError("unknown error")
+        flusher = metrics.BulkFlusher(client, "rally-2016", "metrics", bulk_size=10, max_retries=2, retry_backoff=0)
+        flusher.add({"value": 1})
+
+        with self.assertRaisesRegex(exceptions.RallyError, "unknown error"):
+            flusher.flush()
+        flusher.close()
+        self.assertEqual(3, client.bulk_index.call_count)
+
+    def test_rejects_buffer_smaller_than_bulk_size(self):
+        with self.assertRaisesRegex(exceptions.SystemSetupError,
+                                    r"Buffer size for the metrics store \[10\] must not be smaller than the bulk size \[100\]."):
+            metrics.BulkFlusher(mock.Mock(), "rally-2016", "metrics", bulk_size=100, max_buffer_size=10)
+
+
 class EsRaceStoreTests(TestCase):
     TRIAL_TIMESTAMP = datetime.datetime(2016, 1, 31)
 
@@ -635,6 +738,62 @@ class InMemoryMetricsStoreTests(TestCase):
 
         self.assertAlmostEqual(500.5, self.metrics_store.get_median("query_latency", lap=1))
 
+    def test_get_latency_percentiles_across_laps(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        for i in range(1, 501):
+            self.metrics_store.put_value_cluster_level("latency", float(i), "ms", operation="index")
+        self.metrics_store.lap = 2
+        for i in range(501, 1001):
+            self.metrics_store.put_value_cluster_level("latency", float(i), "ms", operation="index")
+        self.metrics_store.put_value_cluster_level("latency", 5000.0, "ms", operation="search")
+
+        self.metrics_store.close()
+
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults")
+
+        self.assertEqual(collections.OrderedDict([(99, 990.0), (99.9, 999.0), (100, 1000.0)]),
+                         self.metrics_store.get_percentiles("latency", operation="index"))
+        self.assertEqual(collections.OrderedDict([(50, 250.0), (100, 500.0)]),
+                         self.metrics_store.get_percentiles("latency", operation="index", lap=1, percentiles=[50, 100]))
+        self.assertEqual(500.0, self.metrics_store.get_median("latency", operation="index"))
+
+        stats = self.metrics_store.get_stats("latency", operation="index", sample_type=None)
+        self.assertEqual(1000, stats["count"])
+        self.assertEqual(1.0, stats["min"])
+        self.assertEqual(1000.0, stats["max"])
+        self.assertAlmostEqual(500.5, stats["avg"])
+        self.assertIsNone(self.metrics_store.get_stats("latency", operation="unknown"))
+
+    def test_records_negative_request_metrics_as_zero(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        self.metrics_store.put_value_cluster_level("service_time", -0.5, "ms", operation="index")
+        self.metrics_store.put_value_cluster_level("service_time", 2.0, "ms", operation="index")
+
+        self.assertEqual([-0.5, 2.0], self.metrics_store.get("service_time", operation="index"))
+        self.assertEqual(collections.OrderedDict([(0, 0), (100, 2.0)]),
+                         self.metrics_store.get_percentiles("service_time", operation="index", percentiles=[0, 100]))
+
+    def test_get_values_in_insertion_order_across_index_keys(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        self.metrics_store.put_value_cluster_level("service_time", 1.0, "ms", operation="index", operation_type=track.OperationType.Index.name,
+                                                   sample_type=metrics.SampleType.Warmup)
+        self.metrics_store.put_value_cluster_level("service_time", 2.0, "ms", operation="search", operation_type=track.OperationType.Search.name)
+        self.metrics_store.put_value_cluster_level("service_time", 3.0, "ms", operation="index", operation_type=track.OperationType.Index.name)
+        self.metrics_store.lap = 2
+        self.metrics_store.put_value_cluster_level("service_time", 4.0, "ms", operation="index", operation_type=track.OperationType.Index.name,
+                                                   sample_type=metrics.SampleType.Warmup)
+        self.metrics_store.put_value_cluster_level("service_time", 5.0, "ms", operation="index", operation_type=track.OperationType.Index.name)
+
+        self.assertEqual([1.0, 2.0, 3.0, 4.0, 5.0], self.metrics_store.get("service_time"))
+        self.assertEqual([1.0, 3.0, 4.0, 5.0], self.metrics_store.get("service_time", operation="index"))
+        self.assertEqual([2.0], self.metrics_store.get("service_time", operation_type=track.OperationType.Search))
+        self.assertEqual([1.0, 4.0], self.metrics_store.get("service_time", sample_type=metrics.SampleType.Warmup))
+        self.assertEqual([5.0], self.metrics_store.get("service_time", operation="index", sample_type=metrics.SampleType.Normal, lap=2))
+        self.assertEqual([], self.metrics_store.get("latency", operation="index"))
+
     def assert_equal_percentiles(self, name, percentiles, expected_percentiles):
         actual_percentiles = self.metrics_store.get_percentiles(name, percentiles=percentiles)
         self.assertEqual(len(expected_percentiles), len(actual_percentiles))
@@ -660,6 +819,50 @@ class InMemoryMetricsStoreTests(TestCase):
         self.assertEqual(1, len(self.metrics_store.docs))
         self.assertEqual(1000, self.metrics_store.get_one("final_index_size"))
 
+    def test_externalize_and_bulk_add_histograms(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        h = histogram.HdrHistogram()
+        for i in range(1, 1001):
+            h.record_value(float(i))
+        self.metrics_store.put_histogram_cluster_level("service_time", h, "ms", operation="bulk")
+        self.metrics_store.put_count_cluster_level("error_count", 10, operation="bulk")
+        memento = self.metrics_store.to_externalizable()
+
+        self.metrics_store.close()
+        del self.metrics_store
+
+        self.metrics_store = metrics.InMemoryMetricsStore(self.cfg, clock=StaticClock)
+        self.metrics_store.bulk_add(memento)
+        # one record per histogram instead of one per value
+        self.assertEqual(2, len(self.metrics_store.docs))
+        self.assertEqual(collections.OrderedDict([(50, 500.0), (99, 990.0)]),
+                         self.metrics_store.get_percentiles("service_time", operation="bulk", percentiles=[50, 99]))
+        self.assertEqual(1000, self.metrics_store.get_count("service_time", operation="bulk"))
+        self.assertEqual(0.01, self.metrics_store.get_error_rate("bulk"))
+
+    def test_merges_histograms_of_all_intervals(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        # one histogram per post-processing interval
+        for interval in range(2):
+            h = histogram.HdrHistogram()
+            for i in range(1, 51):
+                h.record_value(float(interval * 50 + i))
+            self.metrics_store.put_histogram_cluster_level("latency", h, "ms", operation="bulk", absolute_time=1470838595 + interval * 30,
+                                                           relative_time=interval * 30)
+
+        self.assertEqual(2, len(self.metrics_store.docs))
+        self.assertEqual(50.0, self.metrics_store.get_median("latency", operation="bulk", sample_type=metrics.SampleType.Normal))
+        self.assertEqual({"count": 100, "min": 1.0, "max": 100.0, "avg": 50.5, "sum": 5050.0},
+                         self.metrics_store.get_stats("latency", operation="bulk"))
+        self.assertEqual("ms", self.metrics_store.get_unit("latency", operation="bulk"))
+        # individual values are not available
+        with self.assertRaises(exceptions.RallyAssertionError):
+            self.metrics_store.get("latency", operation="bulk")
+        with self.assertRaises(exceptions.RallyAssertionError):
+            self.metrics_store.get_one("latency", operation="bulk")
+
     def test_meta_data_per_document(self):
         self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
         self.metrics_store.lap = 1
@@ -683,6 +886,20 @@ class InMemoryMetricsStoreTests(TestCase):
             "io-batch-size-kb": 4
         }, self.metrics_store.docs[1]["meta"])
 
+    def test_shares_meta_info_between_documents(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        self.metrics_store.add_meta_info(metrics.MetaInfoScope.cluster, None, "cluster-name", "test")
+        self.metrics_store.put_count_cluster_level("final_index_size", 1000, "GB")
+        self.metrics_store.put_count_cluster_level("final_bytes_written", 1, "TB")
+        self.metrics_store.add_meta_info(metrics.MetaInfoScope.cluster, None, "source_revision", "abc123")
+        self.metrics_store.put_count_cluster_level("segments_count", 17)
+
+        self.assertIs(self.metrics_store.docs.meta(0), self.metrics_store.docs.meta(1))
+        # meta info that is added later does not change existing documents
+        self.assertEqual({"cluster-name": "test"}, self.metrics_store.docs[0]["meta"])
+        self.assertEqual({"cluster-name": "test", "source_revision": "abc123"}, self.metrics_store.docs[2]["meta"])
+
     def test_get_error_rate_zero_without_samples(self):
         self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
         self.metrics_store.lap = 1
@@ -720,3 +937,91 @@ class InMemoryMetricsStoreTests(TestCase):
 
         self.assertEqual(0.0, self.metrics_store.get_error_rate("term-query", sample_type=metrics.SampleType.Warmup))
         self.assertEqual(0.2, self.metrics_store.get_error_rate("term-query", sample_type=metrics.SampleType.Normal))
+
+
+class ColumnarDocumentsTests(TestCase):
+    def test_reconstructs_documents(self):
+        docs = metrics.ColumnarDocuments()
+        doc_one = {
+            "@timestamp": 1500000000000,
+            "relative-time": 10,
+            "trial-timestamp": "20160131T000000Z",
+            "environment": "unittest",
+            "track": "test",
+            "challenge": "append-no-conflicts",
+            "car": "defaults",
+            "name": "service_time",
+            "value": 12.5,
+            "unit": "ms",
+            "sample-type": "normal",
+            "operation": "index",
+            "operation-type": "Index",
+            "lap": 1,
+            "meta": {"success": True, "node_name": "rally0"}
+        }
+        doc_two = {
+            "@timestamp": 1500000000001,
+            "relative-time": 20,
+            "trial-timestamp": "20160131T000000Z",
+            "environment": "unittest",
+            "track": "test",
+            "challenge": "append-no-conflicts",
+            "car": "defaults",
+            "name": "segment_count",
+            "value": 17,
+            "unit": "",
+            "sample-type": "normal",
+            "lap": 1,
+            "meta": {"success": True, "node_name": "rally0"},
+            "custom": ["a", "b"]
+        }
+        self.assertEqual(0, docs.append(doc_one))
+        self.assertEqual(1, docs.append(doc_two))
+
+        self.assertEqual(2, len(docs))
+        self.assertEqual(doc_one, docs[0])
+        self.assertEqual(doc_two, docs[1])
+        self.assertEqual([doc_one, doc_two], list(docs))
+        self.assertIsInstance(docs[1]["value"], int)
+        self.assertIsNone(docs.field(1, "operation"))
+        # meta data are stored only once
+        self.assertIs(docs.meta(0), docs.meta(1))
+
+    def test_stores_non_numeric_values(self):
+        docs = metrics.ColumnarDocuments()
+        docs.append({"@timestamp": 0, "relative-time": 0, "name": "node_total_young_gen_gc_time", "value": 1.5, "meta": {}})
+        docs.append({"@timestamp": 0, "relative-time": 0, "name": "custom", "value": {"a": [1, 2]}, "meta": {"tags": ["x"]}})
+
+        self.assertEqual([1.5, {"a": [1, 2]}], docs.values([0, 1]))
+        self.assertEqual({"tags": ["x"]}, docs[1]["meta"])
+
+    def test_distinguishes_meta_data_of_different_types(self):
+        docs = metrics.ColumnarDocuments()
+        docs.append({"@timestamp": 0, "relative-time": 0, "name": "latency", "value": 2.0, "meta": {"success": True}})
+        docs.append({"@timestamp": 0, "relative-time": 0, "name": "latency", "value": 2.0, "meta": {"success": 1}})
+
+        self.assertIs(True, docs[0]["meta"]["success"])
+        self.assertIs(1, docs[1]["meta"]["success"])
+
+    def test_stores_request_meta_data_per_document(self):
+        docs = metrics.ColumnarDocuments()
+        for took in range(100):
+            docs.append({"@timestamp": 0, "relative-time": 0, "name": "latency", "value": 2.0,
+                         "meta": {"success": True, "took": took, "shards_histogram": [{"item-count": took}]}})
+
+        # only the meta data that are common to all requests are shared
+        self.assertEqual(1, len(docs._meta))
+        self.assertEqual({"success": True, "took": 42, "shards_histogram": [{"item-count": 42}]}, docs.meta(42))
+        self.assertEqual({"success": True, "took": 99, "shards_histogram": [{"item-count": 99}]}, docs[99]["meta"])
+
+    def test_can_be_pickled(self):
+        import pickle
+        docs = metrics.ColumnarDocuments()
+        docs.append({"@timestamp": 0, "relative-time": 0, "name": "latency", "value": 2.0, "meta": {"success": True}})
+
+        restored = pickle.loads(pickle.dumps(docs))
+        restored.append({"@timestamp": 1, "relative-time": 1, "name": "latency", "value": 3.0, "meta": {"success": True}})
+
+        self.assertEqual([2.0, 3.0], restored.values([0, 1]))
+        self.assertIs(restored.meta(0), restored.meta(1))
+        self.assertEqual("latency", restored.field(1, "name"))
@@ -44,8 +44,88 @@ class StatsTests(TestCase):
         self.assertEqual(collections.OrderedDict([(50.0, 220), (100, 225)]), stats.op_metrics["index"]["latency"])
         self.assertEqual(collections.OrderedDict([(50.0, 200), (100, 215)]), stats.op_metrics["index"]["service_time"])
         self.assertAlmostEqual(0.3333333333333333, stats.op_metrics["index"]["error_rate"])
+        # no samples have been dropped
+        self.assertIsNone(stats.op_metrics["index"]["dropped_samples"])
 
 
+class SummaryReporterTests(TestCase):
+    def test_reports_dropped_samples_only_if_present(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "system", "env.name", "unittest")
+
+        store = metrics.InMemoryMetricsStore(cfg=cfg)
+        store.open(datetime.datetime.now(), "test", "unittest", "unittest_car")
+        store.lap = 1
+        store.put_count_cluster_level("dropped_samples", 0, operation="index", operation_type=track.OperationType.Index)
+        store.put_count_cluster_level("dropped_samples", 17, operation="search", operation_type=track.OperationType.Search)
+
+        index = track.Task(operation=track.Operation(name="index", operation_type=track.OperationType.Index, params=None))
+        search = track.Task(operation=track.Operation(name="search", operation_type=track.OperationType.Search, params=None))
+        challenge = track.Challenge(name="unittest", description="", index_settings=None, schedule=[index, search])
+        stats = reporter.Stats(store, challenge, lap=1)
+
+        r = reporter.SummaryReporter(race_store=None, metrics_store=store, config=cfg, lap=1)
+        self.assertEqual([], r.report_dropped_samples(stats, index.operation))
+        self.assertEqual([["1", "dropped samples", "search", 17, ""]], r.report_dropped_samples(stats, search.operation))
+
+    def test_reports_param_source_waits_only_if_present(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "system", "env.name", "unittest")
+
+        store = metrics.InMemoryMetricsStore(cfg=cfg)
+        store.open(datetime.datetime.now(), "test", "unittest", "unittest_car")
+        store.lap = 1
+        store.put_count_cluster_level("param_source_waits", 5, operation="index", operation_type=track.OperationType.Index)
+
+        index = track.Task(operation=track.Operation(name="index", operation_type=track.OperationType.Index, params=None))
+        search = track.Task(operation=track.Operation(name="search", operation_type=track.OperationType.Search, params=None))
+        challenge = track.Challenge(name="unittest", description="", index_settings=None, schedule=[index, search])
+        stats = reporter.Stats(store, challenge, lap=1)
+
+        r = reporter.SummaryReporter(race_store=None, metrics_store=store, config=cfg, lap=1)
+        self.assertEqual([["1", "param source waits", "index", 5, ""]], r.report_param_source_waits(stats, index.operation))
+        self.assertEqual([], r.report_param_source_waits(stats, search.operation))
+
+    def test_reports_schedule_lag_only_if_present(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "system", "env.name", "unittest")
+
+        store = metrics.InMemoryMetricsStore(cfg=cfg)
+        store.open(datetime.datetime.now(), "test", "unittest", "unittest_car")
+        store.lap = 1
+        store.put_value_cluster_level("schedule_lag", 0.5, unit="ms", operation="search", operation_type=track.OperationType.Search,
+                                      sample_type=metrics.SampleType.Normal)
+
+        index = track.Task(operation=track.Operation(name="index", operation_type=track.OperationType.Index, params=None))
+        search = track.Task(operation=track.Operation(name="search", operation_type=track.OperationType.Search, params=None))
+        challenge = track.Challenge(name="unittest", description="", index_settings=None, schedule=[index, search])
+        stats = reporter.Stats(store, challenge, lap=1)
+
+        r = reporter.SummaryReporter(race_store=None, metrics_store=store, config=cfg, lap=1)
+        self.assertEqual([], r.report_schedule_lag(stats, index.operation))
+        self.assertEqual([["1", "100th percentile schedule lag", "search", 0.5, "ms"]], r.report_schedule_lag(stats, search.operation))
+
+
+    def test_reports_max_sustainable_throughput(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "system", "env.name", "unittest")
+
+        store = metrics.InMemoryMetricsStore(cfg=cfg)
+        store.open(datetime.datetime.now(), "test", "unittest", "unittest_car")
+        store.lap = 1
+        store.put_value_cluster_level("max_sustainable_throughput", 195.5, unit="ops/s", operation="search",
+                                      operation_type=track.OperationType.Search)
+
+        op = track.Operation(name="search", operation_type=track.OperationType.Search, params=None)
+        search = track.ThroughputSearch(op, target_throughputs=[100, 200, 300], max_latency=50)
+        probes = [track.Task(operation=track.Operation(name=search.probe_name(t), operation_type=track.OperationType.Search, params=None),
+                             target_throughput=t, throughput_search=search) for t in search.target_throughputs]
+        challenge = track.Challenge(name="unittest", description="", index_settings=None, schedule=probes)
+        stats = reporter.Stats(store, challenge, lap=1)
+
+        r = reporter.SummaryReporter(race_store=None, metrics_store=store, config=cfg, lap=1)
+        self.assertEqual([["1", "Max Sustainable Throughput", "search", 195.5, "ops/s"]], r.report_max_sustainable_throughput(stats))
+
 class ComparisonReporterTests(TestCase):
     def test_formats_table(self):
         cfg = config.Config()
@@ -813,6 +813,225 @@ class TrackSpecificationReaderTests(TestCase):
         resulting_track = reader("unittest", track_specification, "/mappings", "/data")
         self.assertEqual(0.2, resulting_track.challenges[0].schedule[0].target_throughput)
 
+    def test_supports_named_schedule(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [
+                        {
+                            "operation": "search",
+                            "target-throughput": 10,
+                            "schedule": "poisson"
+                        }
+                    ]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        resulting_track = reader("unittest", track_specification, "/mappings", "/data")
+        task = resulting_track.challenges[0].schedule[0]
+        self.assertEqual("poisson", task.schedule)
+        self.assertEqual({}, task.schedule_params)
+
+    def test_supports_schedule_with_parameters(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [
+                        {
+                            "operation": "search",
+                            "schedule": {
+                                "type": "replay",
+                                "file": "timestamps.txt",
+                                "speedup": 2
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        resulting_track = reader("unittest", track_specification, "/mappings", "/data")
+        task = resulting_track.challenges[0].schedule[0]
+        self.assertEqual("replay", task.schedule)
+        # relative paths are resolved against the track directory
+        self.assertEqual({"file": "/mappings/timestamps.txt", "speedup": 2}, task.schedule_params)
+
+    def test_schedule_requires_type(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [
+                        {
+                            "operation": "search",
+                            "schedule": {
+                                "ramp-up-time-period": 10
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        with self.assertRaises(loader.TrackSyntaxError) as ctx:
+            reader("unittest", track_specification, "/mappings", "/data")
+        self.assertEqual("Track 'unittest' is invalid. Mandatory element 'type' is missing in 'schedule' of 'search'.",
+                         ctx.exception.args[0])
+
+    def test_expands_throughput_search_into_probes(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [
+                        {
+                            "operation": "search",
+                            "clients": 4,
+                            "time-period": 60,
+                            "throughput-search": {
+                                "start": 50,
+                                "factor": 2,
+                                "max": 400,
+                                "max-latency": 200,
+                                "max-error-rate": 0.01
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        resulting_track = reader("unittest", track_specification, "/mappings", "/data")
+        schedule = resulting_track.challenges[0].schedule
+        self.assertEqual(4, len(schedule))
+        self.assertEqual(["search@50", "search@100", "search@200", "search@400"], [task.operation.name for task in schedule])
+        self.assertEqual([50, 100, 200, 400], [task.target_throughput for task in schedule])
+        for task in schedule:
+            self.assertEqual("Search", task.operation.type)
+            self.assertEqual(4, task.clients)
+            self.assertEqual(60, task.time_period)
+        search = schedule[0].throughput_search
+        self.assertEqual("search", search.name)
+        self.assertEqual([50, 100, 200, 400], search.target_throughputs)
+        self.assertEqual(200, search.max_latency)
+        self.assertEqual(99, search.latency_percentile)
+        self.assertEqual(0.01, search.max_error_rate)
+
+    def test_throughput_search_requires_either_step_or_factor(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [
+                        {
+                            "operation": "search",
+                            "throughput-search": {
+                                "start": 10,
+                                "step": 10,
+                                "factor": 2,
+                                "max": 100,
+                                "max-latency": 200
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        with self.assertRaises(loader.TrackSyntaxError) as ctx:
+            reader("unittest", track_specification, "/mappings", "/data")
+        self.assertEqual("Track 'unittest' is invalid. 'throughput-search' of 'search' requires exactly one of 'step' or 'factor'.",
+                         ctx.exception.args[0])
+
+    def test_throughput_search_and_target_throughput_are_mutually_exclusive(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [
+                        {
+                            "operation": "search",
+                            "target-throughput": 10,
+                            "throughput-search": {
+                                "start": 10,
+                                "step": 10,
+                                "max": 100,
+                                "max-latency": 200
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        with self.assertRaises(loader.TrackSyntaxError) as ctx:
+            reader("unittest", track_specification, "/mappings", "/data")
+        self.assertEqual("Track 'unittest' is invalid. Operation 'search' in challenge 'default-challenge' defines a 'throughput-search' "
+                         "and a target throughput but only one of them is allowed.", ctx.exception.args[0])
+
     def test_parallel_tasks_with_default_values(self):
         track_specification = {
             "short-description": "short description for unit test",
@@ -1,43 +1,16 @@
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import time
 from unittest import TestCase
 
 from esrally import exceptions
-from esrally.utils import io
+from esrally.utils import compression, io
 from esrally.track import params, track
 
 
-class SliceTests(TestCase):
-    def test_slice_with_source_larger_than_slice(self):
-        source = params.Slice(io.StringAsFileSource, 2, 5)
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
-            '{"key": "value8"}',
-            '{"key": "value9"}',
-            '{"key": "value10"}'
-        ]
-
-        source.open(data, "r")
-        self.assertEqual(data[2:7], list(source))
-        source.close()
-
-    def test_slice_with_slice_larger_than_source(self):
-        source = params.Slice(io.StringAsFileSource, 0, 5)
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-        ]
-
-        source.open(data, "r")
-        self.assertEqual(data, list(source))
-        source.close()
-
-
 class ConflictingIdsBuilderTests(TestCase):
     def test_no_id_conflicts(self):
         self.assertIsNone(params.build_conflicting_ids(None, 100, 0))
@@ -58,7 +31,7 @@ class ConflictingIdsBuilderTests(TestCase):
                 "         9",
                 "        10",
             ],
-            params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 0)
+            list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 0, conflict_probability=0))
         )
 
         self.assertEqual(
@@ -75,27 +48,51 @@ class ConflictingIdsBuilderTests(TestCase):
                 "        14",
                 "        15",
             ],
-            params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 5)
+            list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 5, conflict_probability=0))
         )
 
     def test_random_conflicts(self):
-        self.assertEqual(
-            [
-                "         3",
-                "         3",
-                "         3"
-            ],
-            params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 0, rand=lambda x, y: y)
-        )
-
-        self.assertEqual(
-            [
-                "         8",
-                "         8",
-                "         8"
-            ],
-            params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 5, rand=lambda x, y: y)
-        )
+        ids = list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 100, 5, conflict_probability=0))
+        self.assertEqual(100, len(ids))
+        self.assertTrue(all(5 <= int(doc_id) <= 105 for doc_id in ids))
+        # ids are reproducible
+        self.assertEqual(ids, list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 100, 5, conflict_probability=0)))
+
+    def test_replaces_only_already_indexed_ids(self):
+        ids = list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 1000, 0, conflict_probability=50))
+        self.assertEqual(1000, len(ids))
+        highest_id = -1
+        replaced = 0
+        for doc_id in ids:
+            doc_id = int(doc_id)
+            if doc_id <= highest_id:
+                replaced += 1
+            else:
+                # new ids are handed out sequentially
+                self.assertEqual(highest_id + 1, doc_id)
+                highest_id = doc_id
+        self.assertTrue(400 < replaced < 600, "Expected roughly half of all documents to be replaced but were %d" % replaced)
+
+    def test_same_seed_produces_same_ids_in_chunks(self):
+        all_at_once = params.ConflictingIds(params.IndexIdConflict.RandomConflicts, 100, 0, seed=42, chunk_size=100)
+        in_chunks = params.ConflictingIds(params.IndexIdConflict.RandomConflicts, 100, 0, seed=42, chunk_size=7)
+        self.assertEqual(list(all_at_once), list(in_chunks))
+
+    def test_zipfian_conflicts_prefer_hot_keys(self):
+        ids = params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 10000, 0, conflict_probability=100,
+                                           conflict_distribution=params.ConflictDistribution.Zipfian)
+        # the first document is always new
+        self.assertEqual(0, int(next(ids)))
+        replaced = [int(doc_id) for doc_id in ids]
+        # with a conflict probability of 100% we only ever replace the first document
+        self.assertEqual([0] * 9999, replaced)
+
+        ids = list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 10000, 0, conflict_probability=50,
+                                                conflict_distribution=params.ConflictDistribution.Zipfian))
+        replaced = [int(doc_id) for doc_id in ids if int(doc_id) < 5]
+        uniform = [int(doc_id) for doc_id in params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 10000, 0,
+                                                                            conflict_probability=50) if int(doc_id) < 5]
+        self.assertTrue(len(replaced) > 5 * len(uniform))
 
 
 class ActionMetaDataTests(TestCase):
@@ -107,32 +104,13 @@ class ActionMetaDataTests(TestCase):
                          next(params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)))
 
     def test_generate_action_meta_data_with_id_conflicts(self):
-        pseudo_random_sequence = iter([
-            # first column == 3 -> we'll draw a "random" id, second column == "random" id
-            3, 1,
-            3, 3,
-            3, 2,
-            0,
-            3, 0])
-
-        generator = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=[100, 200, 300, 400],
-                                                  rand=lambda x, y: next(pseudo_random_sequence))
-
-        # first one is always not drawn from a random index
+        generator = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=iter(["100", "200", "100"]))
+
         self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "100"}}', next(generator))
-        # now we start using random ids, i.e. look in the first line of the pseudo-random sequence
         self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "200"}}', next(generator))
-        self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "400"}}', next(generator))
-        self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "300"}}', next(generator))
-        # "random" returns 0 instead of 3 -> we draw the next sequential one, which is 200
-        self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "200"}}', next(generator))
-        # and we're back to random
         self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "100"}}', next(generator))
 
     def test_source_file_action_meta_data(self):
-        source = params.Slice(io.StringAsFileSource, 0, 5)
-        generator = params.SourceActionMetaData(source)
-
         data = [
             '{"index": {"_index": "test_index", "_type": "test_type", "_id": "1"}}',
             '{"index": {"_index": "test_index", "_type": "test_type", "_id": "2"}}',
@@ -140,154 +118,192 @@ class ActionMetaDataTests(TestCase):
             '{"index": {"_index": "test_index", "_type": "test_type", "_id": "4"}}',
             '{"index": {"_index": "test_index", "_type": "test_type", "_id": "5"}}',
         ]
+        generator = params.SourceActionMetaData(iter(data))
 
-        source.open(data, "r")
         self.assertEqual(data, list(generator))
-        source.close()
 
 
-class IndexDataReaderTests(TestCase):
-    def test_read_bulk_larger_than_number_of_docs(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}'
-        ]
-        bulk_size = 50
+class MmapIndexDataReaderTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
 
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
-        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+    def write(self, lines, trailing_newline=True):
+        data_file = os.path.join(self.tmp_dir, "docs.json")
+        with open(data_file, "wt") as f:
+            f.write("\n".join(lines))
+            if trailing_newline:
+                f.write("\n")
+        return data_file
 
-        expected_bulk_sizes = [len(data) * 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes)
+    def read_bulks(self, reader):
+        bulks = []
+        with reader:
+            for index, type, batch in reader:
+                bulks.extend(bulk for _, bulk in batch)
+        return bulks
 
-    def test_read_bulk_with_offset(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}'
-        ]
-        bulk_size = 50
+    def read_bulk_sizes(self, reader):
+        with reader:
+            return [docs_in_bulk for _, _, batch in reader for docs_in_bulk, _ in batch]
 
-        source = params.Slice(io.StringAsFileSource, 3, len(data))
-        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+    def test_read_bulks_with_generated_metadata(self):
+        data_file = self.write(['{"key": "value1"}', '{"key": "value2"}', '{"key": "value3"}'])
+        source = params.MmapSlice(0, 3)
+        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=iter(["  1", "  2", "  3"]))
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+        reader = params.MmapIndexDataReader(data_file, batch_size=2, bulk_size=2, file_source=source, action_metadata=am_handler,
+                                            index_name="test_index", type_name="test_type")
 
-        expected_bulk_sizes = [(len(data) - 3) * 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes)
+        self.assertEqual([
+            b'{"index": {"_index": "test_index", "_type": "test_type", "_id": "  1"}}\n{"key": "value1"}\n'
+            b'{"index": {"_index": "test_index", "_type": "test_type", "_id": "  2"}}\n{"key": "value2"}\n',
+            b'{"index": {"_index": "test_index", "_type": "test_type", "_id": "  3"}}\n{"key": "value3"}\n'
+        ], self.read_bulks(reader))
 
-    def test_read_bulk_smaller_than_number_of_docs(self):
-        data = [
+    def test_read_bulks_with_offset_and_without_trailing_newline(self):
+        data_file = self.write(['{"key": "value1"}', '{"key": "value2"}', '{"key": "value3"}', '{"key": "value4"}'],
+                               trailing_newline=False)
+        # only two documents to index for this client
+        source = params.MmapSlice(2, 2)
+
+        reader = params.MmapIndexDataReader(data_file, batch_size=4, bulk_size=2, file_source=source,
+                                            action_metadata=params.NoneActionMetaData(), index_name="test_index", type_name="test_type")
+
+        self.assertEqual([b'{"key": "value3"}\n{"key": "value4"}\n'], self.read_bulks(reader))
+
+    def test_read_bulks_and_assume_metadata_line_in_source_file(self):
+        data_file = self.write([
+            '{"index": {"_index": "test_index", "_type": "test_type"}',
             '{"key": "value1"}',
+            '{"index": {"_index": "test_index", "_type": "test_type"}',
             '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
-        ]
-        bulk_size = 3
-
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
+            '{"index": {"_index": "test_index", "_type": "test_type"}',
+            '{"key": "value3"}'
+        ])
+        source = params.MmapSlice(0, 6)
+
+        reader = params.MmapIndexDataReader(data_file, batch_size=2, bulk_size=2, file_source=source,
+                                            action_metadata=params.SourceActionMetaData(source), index_name="test_index",
+                                            type_name="test_type")
+
+        bulks = self.read_bulks(reader)
+        self.assertEqual(2, len(bulks))
+        self.assertEqual(4, bulks[0].count(b"\n"))
+        self.assertEqual(b'{"index": {"_index": "test_index", "_type": "test_type"}\n{"key": "value3"}\n', bulks[1])
+
+    def test_provides_number_of_documents_per_bulk(self):
+        data_file = self.write(['{"key": "value%d"}' % i for i in range(5)])
+
+        reader = params.MmapIndexDataReader(data_file, batch_size=4, bulk_size=2, file_source=params.MmapSlice(0, 5),
+                                            action_metadata=params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None),
+                                            index_name="test_index", type_name="test_type")
+        self.assertEqual([2, 2, 1], self.read_bulk_sizes(reader))
+
+        reader = params.MmapIndexDataReader(data_file, batch_size=4, bulk_size=2, file_source=params.MmapSlice(0, 5),
+                                            action_metadata=params.NoneActionMetaData(), index_name="test_index", type_name="test_type")
+        self.assertEqual([2, 2, 1], self.read_bulk_sizes(reader))
+
+    def test_read_empty_file(self):
+        data_file = self.write([], trailing_newline=False)
+        source = params.MmapSlice(0, 10)
         am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+        reader = params.MmapIndexDataReader(data_file, batch_size=5, bulk_size=5, file_source=source, action_metadata=am_handler,
+                                            index_name="test_index", type_name="test_type")
 
-        # always double the amount as one line contains the data and one line contains the index command
-        expected_bulk_sizes = [6, 6, 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes)
+        self.assertEqual([], self.read_bulks(reader))
 
-    def test_read_bulk_smaller_than_number_of_docs_and_multiple_clients(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
-        ]
-        bulk_size = 3
 
-        # only 5 documents to index for this client
-        source = params.Slice(io.StringAsFileSource, 0, 5)
-        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+class CompressedSliceTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lines = [('{"id": %d}\n' % i).encode("utf-8") for i in range(100)]
+        self.archive_path = os.path.join(self.tmp_dir, "documents.json.bz2")
+        data = b"".join(self.lines)
+        # blocks do not end at line boundaries
+        with open(self.archive_path, "wb") as f:
+            for i in range(0, len(data), 97):
+                f.write(bz2.compress(data[i:i + 97]))
+        io.prepare_block_index(self.archive_path)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
 
-        # always double the amount as one line contains the data and one line contains the index command
-        expected_bulk_sizes = [6, 4]
-        self.assert_bulks_sized(reader, expected_bulk_sizes)
+    def read_bulks(self, offset, number_of_lines, bulk_size, action_metadata):
+        source = params.CompressedSlice(offset, number_of_lines)
+        reader = params.MmapIndexDataReader(self.archive_path, batch_size=bulk_size, bulk_size=bulk_size, file_source=source,
+                                            action_metadata=action_metadata, index_name="test_index", type_name="test_type")
+        bulks = []
+        with reader:
+            for index, type, batch in reader:
+                bulks.extend(bulk for _, bulk in batch)
+        return bulks
 
-    def test_read_bulks_and_assume_metadata_line_in_source_file(self):
-        data = [
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value1"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value2"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value3"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value4"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value5"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value6"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value7"}'
-        ]
-        bulk_size = 3
+    def test_reads_slice_from_archive(self):
+        bulks = self.read_bulks(offset=42, number_of_lines=30, bulk_size=7, action_metadata=params.NoneActionMetaData())
 
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
-        am_handler = params.SourceActionMetaData(source)
+        self.assertEqual(5, len(bulks))
+        self.assertEqual(b"".join(self.lines[42:72]), b"".join(bulks))
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+    def test_reads_slice_until_end_of_archive_with_generated_metadata(self):
+        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+        bulks = self.read_bulks(offset=90, number_of_lines=20, bulk_size=4, action_metadata=am_handler)
 
-        # always double the amount as one line contains the data and one line contains the index command
-        expected_bulk_sizes = [6, 6, 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes)
+        action_metadata_line = b'{"index": {"_index": "test_index", "_type": "test_type"}}\n'
+        self.assertEqual(b"".join(action_metadata_line + line for line in self.lines[90:]), b"".join(bulks))
 
-    def test_read_bulks_and_assume_no_metadata(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}'
-        ]
-        bulk_size = 3
 
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
-        am_handler = params.NoneActionMetaData()
+class BulkCacheTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp_dir, "documents.json")
+        with open(self.data_file, "wt") as f:
+            for i in range(10):
+                f.write('{"id": %d}\n' % i)
+        self.type = track.Type("test_type", mapping_file=None, document_file=self.data_file, number_of_documents=10)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
 
-        # always double the amount as one line contains the data and one line contains the index command
-        expected_bulk_sizes = [3, 3, 1]
-        self.assert_bulks_sized(reader, expected_bulk_sizes)
+    def create_reader(self, offset=2, num_lines=7):
+        return params.create_caching_reader("test_index", self.type, offset, num_lines, num_lines, params.ActionMetaData.Generate,
+                                            batch_size=6, bulk_size=3, id_conflicts=params.IndexIdConflict.NoConflicts)
 
-    def assert_bulks_sized(self, reader, expected_bulk_sizes):
+    def read_batches(self, reader):
         with reader:
-            bulk_index = 0
-            for index, type, batch in reader:
-                for bulk in batch:
-                    self.assertEqual(expected_bulk_sizes[bulk_index], len(bulk))
-                    bulk_index += 1
+            return [batch for _, _, batch in reader]
+
+    def test_writes_and_reads_bulk_cache(self):
+        writer = self.create_reader()
+        self.assertIsInstance(writer, params.BulkCacheWriter)
+        batches = self.read_batches(writer)
+        self.assertEqual([2, 1], [len(batch) for batch in batches])
+        self.assertEqual([3, 3, 1], [docs_in_bulk for batch in batches for docs_in_bulk, _ in batch])
+
+        # a different partition is not cached yet
+        self.assertIsInstance(self.create_reader(offset=0), params.BulkCacheWriter)
+
+        reader = self.create_reader()
+        self.assertIsInstance(reader, params.CachedIndexDataReader)
+        self.assertEqual(batches, self.read_batches(reader))
+
+    def test_discards_incomplete_bulk_cache(self):
+        writer = self.create_reader()
+        with writer:
+            next(writer)
+
+        self.assertIsInstance(self.create_reader(), params.BulkCacheWriter)
+        self.assertEqual([], os.listdir(os.path.join(self.tmp_dir, "bulk-cache")))
+
+    def test_invalidates_bulk_cache_if_data_changes(self):
+        self.read_batches(self.create_reader())
+        with open(self.data_file, "at") as f:
+            f.write('{"id": 10}\n')
+
+        self.assertIsInstance(self.create_reader(), params.BulkCacheWriter)
 
 
 class InvocationGeneratorTests(TestCase):
@@ -387,6 +403,25 @@ class InvocationGeneratorTests(TestCase):
         self.assertEqual(1, self.number_of_bulks([self.idx("a", [self.t(80)])], 1, 3, 267))
         self.assertEqual(1, self.number_of_bulks([self.idx("a", [self.t(80)])], 2, 3, 267))
 
+    def test_compresses_bulks_if_compressor_is_provided(self):
+        bulk = b'{"index": {}}\n{"key": "value"}\n'
+        reader = InvocationGeneratorTests.TestIndexReader([("test-index", "test-type", [(1, bulk), (1, bulk)])])
+        generator = params.bulk_data_based(num_clients=1, client_index=0, indices=[self.idx("test-index", [self.t(2)])],
+                                           action_metadata=params.ActionMetaData.Generate, batch_size=2, bulk_size=1, id_conflicts=None,
+                                           pipeline=None, create_reader=lambda *args: reader,
+                                           compressor=compression.Compressor("gzip", level=1))
+
+        bulks = []
+        for p in generator:
+            self.assertEqual(1, p["bulk-size"])
+            bulks.append(p["body"])
+        self.assertEqual(2, len(bulks))
+        for body in bulks:
+            self.assertIsInstance(body, compression.CompressedBody)
+            self.assertEqual("gzip", body.content_encoding)
+            self.assertEqual(2, body.line_count)
+            self.assertEqual(bulk, gzip.decompress(body))
+
     @staticmethod
     def number_of_bulks(indices, partition_index, total_partitions, bulk_size):
         return params.PartitionBulkIndexParamSource(
@@ -395,9 +430,9 @@ class InvocationGeneratorTests(TestCase):
     def test_build_conflicting_ids(self):
         self.assertIsNone(params.build_conflicting_ids(params.IndexIdConflict.NoConflicts, 3, 0))
         self.assertEqual(["         0", "         1", "         2"],
-                         params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 3, 0))
+                         list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 3, 0, conflict_probability=0)))
         # we cannot tell anything specific about the contents...
-        self.assertEqual(3, len(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 0)))
+        self.assertEqual(3, len(list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 0))))
 
 
 class BulkIndexParamSourceTests(TestCase):
@@ -459,6 +494,52 @@ class BulkIndexParamSourceTests(TestCase):
 
         self.assertEqual("Unknown 'conflicts' setting [crazy]", ctx.exception.args[0])
 
+    def test_create_with_conflict_probability_out_of_range(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "conflicts": "sequential",
+                "conflict-probability": 120
+            })
+
+        self.assertEqual("'conflict-probability' must be in the range [0, 100] but was 120.0", ctx.exception.args[0])
+
+    def test_create_with_unknown_conflict_distribution(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "conflicts": "sequential",
+                "conflict-distribution": "normal"
+            })
+
+        self.assertEqual("Unknown 'conflict-distribution' setting [normal]", ctx.exception.args[0])
+
+    def test_create_with_non_boolean_bulk_cache(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "bulk-size": 5000,
+                "bulk-cache": "yes"
+            })
+
+        self.assertEqual("'bulk-cache' must be a boolean but was [yes]", ctx.exception.args[0])
+
+    def test_create_with_unknown_body_compression(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "bulk-size": 5000,
+                "body-compression": "brotli"
+            })
+
+        self.assertEqual("Unknown compression algorithm [brotli]. Valid values are ['deflate', 'gzip'].", ctx.exception.args[0])
+
+    def test_create_with_invalid_body_compression_level(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "bulk-size": 5000,
+                "body-compression": "gzip",
+                "body-compression-level": 10
+            })
+
+        self.assertEqual("Compression level must be an integer in the range [0, 9] but was [10].", ctx.exception.args[0])
+
     def test_create_with_unknown_action_meta_data(self):
         with self.assertRaises(exceptions.InvalidSyntax) as ctx:
             params.BulkIndexParamSource(indices=[], params={
@@ -530,6 +611,123 @@ class BulkIndexParamSourceTests(TestCase):
         self.assertEqual("The provided index [does_not_exist] does not match any of the indices [index1].", ctx.exception.args[0])
 
 
+class MultiSearchParamSourceTests(TestCase):
+    def test_returns_queries_round_robin(self):
+        index = track.Index(name="index1", auto_managed=True, types=[track.Type(name="type1", mapping_file=None)])
+        source = params.MultiSearchParamSource(indices=[index], params={
+            "cache": True,
+            "queries-per-request": 3,
+            "queries": [
+                {"body": {"query": {"term": {"country_code": "AT"}}}},
+                {"index": "index2", "body": {"query": {"term": {"country_code": "DE"}}}}
+            ]
+        })
+        query_at = {"index": "index1", "type": "type1", "use_request_cache": True, "body": {"query": {"term": {"country_code": "AT"}}}}
+        query_de = {"index": "index2", "type": "type1", "use_request_cache": True, "body": {"query": {"term": {"country_code": "DE"}}}}
+
+        self.assertEqual({"queries": [query_at, query_de, query_at]}, source.params())
+        self.assertEqual({"queries": [query_de, query_at, query_de]}, source.params())
+        # each client starts at a different query
+        self.assertEqual({"queries": [query_de, query_at, query_de]}, source.partition(1, 2).params())
+
+    def test_uses_single_body_by_default(self):
+        source = params.MultiSearchParamSource(indices=[], params={
+            "index": "_all",
+            "body": {"query": {"match_all": {}}}
+        })
+
+        self.assertEqual({"queries": [{"index": "_all", "type": None, "use_request_cache": False, "body": {"query": {"match_all": {}}}}]},
+                         source.params())
+
+    def test_create_without_queries(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.MultiSearchParamSource(indices=[], params={"index": "_all"})
+
+        self.assertEqual("Either 'queries' or 'body' is mandatory", ctx.exception.args[0])
+
+    def test_create_without_index(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.MultiSearchParamSource(indices=[], params={"queries": [{"body": {}}]})
+
+        self.assertEqual("'index' is mandatory", ctx.exception.args[0])
+
+    def test_create_with_non_positive_queries_per_request(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.MultiSearchParamSource(indices=[], params={
+                "index": "_all",
+                "queries-per-request": 0,
+                "body": {}
+            })
+
+        self.assertEqual("'queries-per-request' must be positive but was 0", ctx.exception.args[0])
+
+
+class PrefetchingParamSourceTests(TestCase):
+    class CountingParamSource(params.ParamSource):
+        def __init__(self, limit):
+            super().__init__(indices=[], params={})
+            self.limit = limit
+            self.current = 0
+
+        def size(self):
+            return self.limit
+
+        def params(self):
+            if self.current == self.limit:
+                raise StopIteration
+            self.current += 1
+            return {"body": self.current}
+
+    def test_returns_all_params_in_order_and_stops(self):
+        source = params.PrefetchingParamSource(PrefetchingParamSourceTests.CountingParamSource(limit=5), prefetch_size=2)
+        try:
+            self.assertEqual(5, source.size())
+            self.assertEqual([1, 2, 3, 4, 5], [source.params()["body"] for _ in range(5)])
+            with self.assertRaises(StopIteration):
+                source.params()
+            # stays exhausted
+            with self.assertRaises(StopIteration):
+                source.params()
+        finally:
+            source.close()
+
+    def test_reports_waiting_time(self):
+        class SlowParamSource(PrefetchingParamSourceTests.CountingParamSource):
+            def params(self):
+                time.sleep(0.01)
+                return super().params()
+
+        waits = []
+        source = params.PrefetchingParamSource(SlowParamSource(limit=1), prefetch_size=1, on_wait=waits.append)
+        try:
+            self.assertEqual({"body": 1}, source.params())
+        finally:
+            source.close()
+        # the first call has to wait for the background thread
+        self.assertEqual(1, len(waits))
+        self.assertTrue(waits[0] > 0)
+
+    def test_propagates_errors(self):
+        class FailingParamSource(PrefetchingParamSourceTests.CountingParamSource):
+            def params(self):
+                raise exceptions.DataError("broken")
+
+        source = params.PrefetchingParamSource(FailingParamSource(limit=1), prefetch_size=2)
+        try:
+            with self.assertRaisesRegex(exceptions.DataError, "broken"):
+                source.params()
+        finally:
+            source.close()
+
+    def test_cannot_be_partitioned(self):
+        source = params.PrefetchingParamSource(PrefetchingParamSourceTests.CountingParamSource(limit=1), prefetch_size=1)
+        try:
+            with self.assertRaises(exceptions.RallyError):
+                source.partition(0, 1)
+        finally:
+            source.close()
+
+
 class ParamsRegistrationTests(TestCase):
     @staticmethod
     def param_source_function(indices, params):
@@ -0,0 +1,45 @@
+import gzip
+import pickle
+import zlib
+from unittest import TestCase
+
+from esrally.utils import compression
+
+
+class CompressorTests(TestCase):
+    def test_compresses_with_gzip(self):
+        body = b'{"index": {}}\n{"key": "value"}\n' * 10
+        self.assertEqual(body, gzip.decompress(compression.Compressor("gzip", level=1).compress(body)))
+
+    def test_compresses_with_deflate(self):
+        body = b'{"index": {}}\n{"key": "value"}\n' * 10
+        self.assertEqual(body, zlib.decompress(compression.Compressor("deflate").compress(memoryview(body))))
+
+    def test_compress_body_records_statistics(self):
+        body = b'{"index": {}}\n{"key": "value"}\n' * 10
+        compressed = compression.Compressor().compress_body(memoryview(body))
+
+        self.assertEqual("gzip", compressed.content_encoding)
+        self.assertEqual(len(body), compressed.uncompressed_size)
+        self.assertEqual(20, compressed.line_count)
+        self.assertGreaterEqual(compressed.compression_time, 0)
+        self.assertEqual(body, gzip.decompress(compressed))
+        # already compressed bodies are not compressed again
+        self.assertIs(compressed, compression.Compressor("deflate").compress_body(compressed))
+
+    def test_compressed_body_can_be_pickled(self):
+        compressed = compression.Compressor().compress_body(b'{"key": "value"}\n')
+        restored = pickle.loads(pickle.dumps(compressed))
+
+        self.assertEqual(compressed, restored)
+        self.assertEqual(compressed.content_encoding, restored.content_encoding)
+        self.assertEqual(compressed.uncompressed_size, restored.uncompressed_size)
+        self.assertEqual(compressed.line_count, restored.line_count)
+
+    def test_rejects_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            compression.Compressor("brotli")
+        with self.assertRaises(ValueError):
+            compression.Compressor("gzip", level=10)
+        with self.assertRaises(ValueError):
+            compression.Compressor("gzip", level="fast")
@@ -0,0 +1,83 @@
+import json
+from unittest import TestCase
+
+from esrally.utils import histogram
+
+
+class HdrHistogramTests(TestCase):
+    def test_empty_histogram(self):
+        h = histogram.HdrHistogram()
+        self.assertEqual(0, h.total_count)
+        self.assertIsNone(h.value_at_percentile(99))
+        self.assertIsNone(h.mean)
+
+    def test_percentiles_of_exact_values(self):
+        h = histogram.HdrHistogram()
+        for i in range(1, 1001):
+            h.record_value(float(i))
+
+        self.assertEqual(1000, h.total_count)
+        self.assertEqual(1.0, h.min)
+        self.assertEqual(1000.0, h.max)
+        self.assertAlmostEqual(500.5, h.mean)
+        self.assertEqual(1.0, h.value_at_percentile(0))
+        self.assertEqual(500.0, h.value_at_percentile(50))
+        self.assertEqual(990.0, h.value_at_percentile(99))
+        self.assertEqual(999.0, h.value_at_percentile(99.9))
+        self.assertEqual(1000.0, h.value_at_percentile(100))
+
+    def test_relative_error_is_bounded(self):
+        h = histogram.HdrHistogram(significant_figures=3, resolution=0.001)
+        for i in range(1, 10001):
+            h.record_value(i * 1.37)
+
+        for percentile in [10, 50, 90, 99, 99.9]:
+            expected = round(percentile / 100 * 10000) * 1.37
+            self.assertAlmostEqual(expected, h.value_at_percentile(percentile), delta=expected * 0.001)
+
+    def test_high_dynamic_range(self):
+        h = histogram.HdrHistogram()
+        h.record_value(0.001)
+        h.record_value(3600 * 1000.0)
+        self.assertEqual(0.001, h.value_at_percentile(50))
+        self.assertEqual(3600 * 1000.0, h.value_at_percentile(100))
+
+    def test_merge(self):
+        h1 = histogram.HdrHistogram()
+        h2 = histogram.HdrHistogram()
+        for i in range(1, 501):
+            h1.record_value(float(i))
+        for i in range(501, 1001):
+            h2.record_value(float(i))
+
+        merged = histogram.HdrHistogram().merge(h1).merge(h2)
+        self.assertEqual(1000, merged.total_count)
+        self.assertEqual(1.0, merged.min)
+        self.assertEqual(1000.0, merged.max)
+        self.assertEqual(500.0, merged.value_at_percentile(50))
+        self.assertEqual(990.0, merged.value_at_percentile(99))
+        # the originals are unchanged
+        self.assertEqual(500, h1.total_count)
+
+    def test_cannot_merge_different_configurations(self):
+        with self.assertRaises(ValueError):
+            histogram.HdrHistogram(significant_figures=3).merge(histogram.HdrHistogram(significant_figures=2))
+
+    def test_rejects_negative_values(self):
+        with self.assertRaises(ValueError):
+            histogram.HdrHistogram().record_value(-1)
+
+    def test_round_trip_as_json(self):
+        h = histogram.HdrHistogram()
+        for i in range(1, 1001):
+            h.record_value(float(i))
+
+        restored = histogram.HdrHistogram.from_dict(json.loads(json.dumps(h.to_dict())))
+        self.assertEqual(1000, restored.total_count)
+        self.assertEqual(h.sum, restored.sum)
+        self.assertEqual(1.0, restored.min)
+        self.assertEqual(1000.0, restored.max)
+        self.assertEqual(500.0, restored.value_at_percentile(50))
+        self.assertEqual(990.0, restored.value_at_percentile(99))
+        # can be merged with histograms that have been recorded directly
+        self.assertEqual(2000, histogram.HdrHistogram().merge(h).merge(restored).total_count)
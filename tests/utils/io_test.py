@@ -1,8 +1,12 @@
+import bz2
+import gzip
 import os
+import shutil
 import tempfile
 import unittest.mock as mock
 from unittest import TestCase
 
+from esrally import exceptions
 from esrally.utils import io
 
 
@@ -76,3 +80,164 @@ class DecompressionTests(TestCase):
     def read(self, f):
         with open(f, 'r') as content_file:
             return content_file.read()
+
+
+class FileOffsetTableTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_path = os.path.join(self.tmp_dir, "documents.json")
+        with open(self.data_file_path, "wt") as f:
+            for i in range(100):
+                f.write('{"id": %d}\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_skips_lines_with_offset_table(self):
+        self.assertTrue(io.prepare_file_offset_table(self.data_file_path, interval=10))
+
+        for lines_to_skip in [0, 1, 9, 10, 11, 57, 99]:
+            with open(self.data_file_path, "rt") as data_file:
+                io.skip_lines(self.data_file_path, data_file, lines_to_skip)
+                self.assertEqual('{"id": %d}\n' % lines_to_skip, data_file.readline())
+
+    def test_seeks_directly_to_indexed_lines(self):
+        io.prepare_file_offset_table(self.data_file_path, interval=1)
+
+        self.assertEqual((0, 0), io.line_offset(self.data_file_path, 0))
+        self.assertEqual((len('{"id": 0}\n') * 10 + len('{"id": 10}\n') * 27, 0), io.line_offset(self.data_file_path, 37))
+
+    def test_skips_remaining_lines_beyond_last_entry(self):
+        io.prepare_file_offset_table(self.data_file_path, interval=50)
+
+        offset, remaining_lines = io.line_offset(self.data_file_path, 120)
+        self.assertEqual(len('{"id": 0}\n') * 10 + len('{"id": 10}\n') * 40, offset)
+        self.assertEqual(70, remaining_lines)
+
+    def test_does_not_recreate_valid_offset_table(self):
+        self.assertTrue(io.prepare_file_offset_table(self.data_file_path, interval=10))
+        self.assertFalse(io.prepare_file_offset_table(self.data_file_path, interval=10))
+        # a different interval invalidates the table
+        self.assertTrue(io.prepare_file_offset_table(self.data_file_path, interval=20))
+        # so do different contents
+        with open(self.data_file_path, "at") as f:
+            f.write('{"id": 100}\n')
+        self.assertTrue(io.prepare_file_offset_table(self.data_file_path, interval=20))
+
+    def test_fingerprint_detects_same_size_changes_in_the_middle(self):
+        fingerprint = io.file_fingerprint(self.data_file_path)
+        self.assertEqual(fingerprint, io.file_fingerprint(self.data_file_path))
+
+        stat = os.stat(self.data_file_path)
+        with open(self.data_file_path, "r+b") as f:
+            f.seek(stat.st_size // 2)
+            f.write(b"X")
+        # make sure that the modification time differs even on file systems with a coarse timestamp resolution
+        os.utime(self.data_file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        self.assertEqual(stat.st_size, os.path.getsize(self.data_file_path))
+        self.assertNotEqual(fingerprint, io.file_fingerprint(self.data_file_path))
+
+    def test_rejects_offset_table_of_changed_data_file(self):
+        io.prepare_file_offset_table(self.data_file_path, interval=10)
+        self.assertEqual((len('{"id": 0}\n') * 10, 5), io.line_offset(self.data_file_path, 15))
+
+        with open(self.data_file_path, "wt") as f:
+            for i in range(100):
+                f.write('{"id": %d, "value": true}\n' % i)
+
+        with self.assertRaises(exceptions.DataError):
+            io.line_offset(self.data_file_path, 15)
+
+    def test_ignores_legacy_offset_table(self):
+        with open("%s.offset" % self.data_file_path, "wt") as f:
+            f.write("50;600\n")
+
+        self.assertEqual((0, 60), io.line_offset(self.data_file_path, 60))
+        self.assertTrue(io.prepare_file_offset_table(self.data_file_path))
+
+
+class ParallelDecompressionTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lines = ['{"id": %d}\n' % i for i in range(1000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_multi_stream_bz2(self, streams):
+        archive_path = os.path.join(self.tmp_dir, "documents.json.bz2")
+        lines_per_stream = len(self.lines) // streams
+        with open(archive_path, "wb") as f:
+            for i in range(streams):
+                f.write(bz2.compress("".join(self.lines[i * lines_per_stream:(i + 1) * lines_per_stream]).encode("utf-8")))
+        return archive_path
+
+    def test_decompresses_multi_stream_bz2_in_parallel_and_creates_offset_table(self):
+        archive_path = self.write_multi_stream_bz2(streams=4)
+        self.assertEqual(4, len(io.find_bz2_streams(archive_path)))
+
+        self.assertTrue(io.decompress(archive_path, self.tmp_dir, offset_table_interval=100, threads=4))
+
+        data_file_path = os.path.join(self.tmp_dir, "documents.json")
+        with open(data_file_path, "rt") as f:
+            self.assertEqual("".join(self.lines), f.read())
+        # the offset table is valid and does not need to be recreated
+        self.assertFalse(io.prepare_file_offset_table(data_file_path, interval=100))
+        self.assertEqual((sum(len(line) for line in self.lines[:300]), 50), io.line_offset(data_file_path, 350))
+
+    def test_falls_back_to_sequential_decompression(self):
+        archive_path = self.write_multi_stream_bz2(streams=2)
+        # pretend the second stream starts earlier than it actually does
+        offsets = io.find_bz2_streams(archive_path)
+        with mock.patch("esrally.utils.io.find_bz2_streams", return_value=[offsets[0], offsets[1] - 1]):
+            io.decompress(archive_path, self.tmp_dir, threads=2)
+
+        with open(os.path.join(self.tmp_dir, "documents.json"), "rt") as f:
+            self.assertEqual("".join(self.lines), f.read())
+
+    def test_offset_table_is_independent_of_chunk_boundaries(self):
+        data = "".join(self.lines).encode("utf-8") + b'{"id": "unterminated"}'
+        data_file_path = os.path.join(self.tmp_dir, "documents.json")
+        with open(data_file_path, "wb") as f:
+            f.write(data)
+
+        for chunk_size in [1, 7, 10, 11, 4096]:
+            builder = io.OffsetTableBuilder(interval=10)
+            for i in range(0, len(data), chunk_size):
+                builder.update(data[i:i + chunk_size])
+            self.assertEqual(1001, builder.number_of_lines)
+            self.assertEqual(101, len(builder.offsets))
+            self.assertEqual(sum(len(line) for line in self.lines[:370]), builder.offsets[37])
+
+
+class BlockIndexTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_creates_block_index_for_multi_member_gzip(self):
+        archive_path = os.path.join(self.tmp_dir, "documents.json.gz")
+        blocks = [b'{"id": 0}\n{"id": 1}\n{"id"', b': 2}\n', b'{"id": 3}\n']
+        with open(archive_path, "wb") as f:
+            for block in blocks:
+                f.write(gzip.compress(block))
+
+        self.assertTrue(io.prepare_block_index(archive_path))
+        self.assertFalse(io.prepare_block_index(archive_path))
+        self.assertTrue(io.has_block_index(archive_path))
+
+        index = io.read_block_index(archive_path)
+        self.assertEqual([0, 2, 3], [newlines for _, _, newlines in index])
+        with open(archive_path, "rb") as f:
+            for (offset, size, _), block in zip(index, blocks):
+                f.seek(offset)
+                self.assertEqual(block, io.decompress_block(archive_path, f.read(size)))
+
+    def test_supports_only_bz2_and_gz(self):
+        self.assertTrue(io.supports_block_index("documents.json.bz2"))
+        self.assertTrue(io.supports_block_index("documents.json.gz"))
+        self.assertFalse(io.supports_block_index("documents.zip"))
+        self.assertFalse(io.has_block_index(os.path.join(self.tmp_dir, "documents.json.bz2")))
@@ -0,0 +1,64 @@
+import unittest.mock as mock
+from unittest import TestCase
+
+from esrally import exceptions
+from esrally.utils import jsoncodec
+
+
+class JsonCodecTests(TestCase):
+    def setUp(self):
+        jsoncodec._codecs.clear()
+
+    def tearDown(self):
+        jsoncodec._codecs.clear()
+
+    def test_round_trip(self):
+        for codec_class in jsoncodec.CODECS:
+            try:
+                codec = codec_class()
+            except ImportError:
+                continue
+            doc = {"took": 3, "hits": {"total": 2, "hits": [{"_id": "ü", "_score": 1.5}]}, "timed_out": False}
+            self.assertEqual(doc, codec.loads(codec.dumps(doc)), msg=codec.name)
+            self.assertEqual(doc, codec.loads(codec.dumps(doc).encode("utf-8")), msg=codec.name)
+
+    def test_raises_value_error_on_invalid_document(self):
+        with self.assertRaises(ValueError):
+            jsoncodec.loads('{"key": ')
+
+    def test_selects_stdlib_codec_by_name(self):
+        self.assertEqual("json", jsoncodec.codec("json").name)
+
+    def test_uses_stdlib_codec_by_default(self):
+        with mock.patch("importlib.import_module") as import_module:
+            self.assertEqual("json", jsoncodec.codec().name)
+            self.assertEqual("json", jsoncodec.codec(None).name)
+            # accelerated libraries are not even loaded
+            import_module.assert_not_called()
+
+    def test_falls_back_to_stdlib_if_library_is_missing(self):
+        with mock.patch("importlib.import_module", side_effect=ImportError("no module")):
+            self.assertEqual("json", jsoncodec.codec("ujson").name)
+            self.assertEqual("json", jsoncodec.codec("orjson").name)
+
+    def test_rejects_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            jsoncodec.codec("yaml")
+
+    def test_selects_codec_from_client_options(self):
+        self.assertEqual("json", jsoncodec.from_client_options(None).name)
+        self.assertEqual("json", jsoncodec.from_client_options({"timeout": 60}).name)
+        self.assertEqual("json", jsoncodec.from_client_options({"json_codec": "json"}).name)
+        with self.assertRaises(exceptions.SystemSetupError):
+            jsoncodec.from_client_options({"json_codec": "yaml"})
+
+    def test_decodes_values_incrementally(self):
+        for codec_class in jsoncodec.CODECS:
+            try:
+                codec = codec_class()
+            except ImportError:
+                continue
+            doc = '[{"index": {"status": 201}}, {"index": {"status": 409}}]'
+            item, idx = codec.raw_decode(doc, 1)
+            self.assertEqual({"index": {"status": 201}}, item, msg=codec.name)
+            self.assertEqual(", ", doc[idx:idx + 2], msg=codec.name)